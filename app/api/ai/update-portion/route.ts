@@ -4,6 +4,8 @@ interface UpdatePortionRequest {
   foodName: string
   newWeight: number
   originalWeight: number
+  // Optional field selection, e.g. 'macros' for live slider updates
+  fields?: string
 }
 
 interface PreciseNutritionResponse {
@@ -29,7 +31,7 @@ interface PreciseNutritionResponse {
 export async function POST(request: NextRequest) {
   try {
     const body: UpdatePortionRequest = await request.json()
-    const { foodName, newWeight, originalWeight } = body
+    const { foodName, newWeight, originalWeight, fields } = body
 
     if (!foodName || !newWeight || newWeight <= 0) {
       return NextResponse.json(
@@ -49,7 +51,8 @@ export async function POST(request: NextRequest) {
       body: JSON.stringify({
         food_name: foodName,
         new_weight_g: newWeight,
-        original_weight_g: originalWeight
+        original_weight_g: originalWeight,
+        ...(fields ? { fields } : {})
       }),
     })
 
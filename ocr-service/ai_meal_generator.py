@@ -7,15 +7,26 @@ Uses machine learning to learn user preferences and generate personalized meal p
 import json
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass, asdict
-from collections import defaultdict, Counter
-import pickle
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Generator
+from dataclasses import dataclass, asdict, replace
+from collections import defaultdict, Counter, OrderedDict, deque
 import os
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.cluster import KMeans
-import pandas as pd
+import time
+import copy
+import queue
+import threading
+import zlib
+import hashlib
+import random
+import itertools
+from meal_storage import MealStore
+from meal_history import MealRecord, MealHistory, INGREDIENTS, MEAL_TYPES, MISSING, ranked_by_count
+from recipe_catalog import RecipeCatalog, RecipeFilter, DIFFICULTY_LEVELS, RESTRICTION_VIOLATIONS
+from recipe_embeddings import RecipeEmbeddingIndex
+from meal_plan_optimizer import PlanConstraints, PlanOptimizer
+from waste_reduction import ExpiringInventory, WastePlanner
+from insight_stats import InsightStats
+from preference_stats import PreferenceStats, FAVORITES_WINDOW, FREQUENCY_WINDOW, TIME_WINDOW, TOP_FAVORITES, MIN_MEALS
 
 @dataclass
 class UserPreference:
@@ -48,20 +59,6 @@ class UserPreference:
         if self.health_goals is None:
             self.health_goals = ["maintenance"]
 
-@dataclass
-class MealRecord:
-    """Individual meal consumption record"""
-    user_id: str
-    meal_name: str
-    ingredients: List[str]
-    meal_type: str  # breakfast, lunch, dinner, snack
-    date: str
-    rating: Optional[float] = None  # 1-5 stars if provided
-    prep_time: Optional[int] = None
-    cost: Optional[float] = None
-    calories: Optional[int] = None
-    enjoyed: Optional[bool] = None  # did they finish it?
-    
 @dataclass
 class GeneratedMeal:
     """Generated meal suggestion"""
@@ -78,125 +75,678 @@ class GeneratedMeal:
     dietary_labels: List[str]
     cuisine: str
     difficulty: str
+    servings: int = 1  # estimated_cost covers all servings; calories are per serving
+    nutrients: Optional[Dict[str, float]] = None  # Per serving, for recipes whose ingredients all resolve
+
+@dataclass
+class MealRating:
+    """User feedback on a generated meal, resolved to the recipe it served"""
+    user_id: str
+    meal_id: str
+    recipe_name: str
+    ingredients: List[str]
+    meal_type: str
+    rating: float  # 1-5 stars
+    feedback: str = ""
+    date: str = ""
+
+def make_meal_id(user_id: str, meal_type: str, day_offset: int, recipe_id: int, date: Optional[datetime] = None) -> str:
+    """
+    Id of a generated meal: {user_id}_{meal_type}_{day_offset}_{YYYYMMDD}_r{recipe_id}.
+    The catalog recipe id makes the meal rateable by any worker, with no
+    record of what was served.
+    """
+    return f"{user_id}_{meal_type}_{day_offset}_{(date or datetime.now()).strftime('%Y%m%d')}_r{recipe_id}"
+
+def parse_meal_id(meal_id: str) -> Tuple[str, str, int, str, Optional[int]]:
+    """
+    (user_id, meal_type, day_offset, YYYYMMDD, recipe id) of a generated
+    meal id; the recipe id is None for ids from before it was included.
+    Split from the right, since user ids may themselves contain underscores.
+    """
+    recipe_id = None
+    head, _, last = meal_id.rpartition('_')
+    if last[:1] == 'r' and last[1:].isdigit():
+        meal_id, recipe_id = head, int(last[1:])
+    parts = meal_id.rsplit('_', 3)
+    if len(parts) != 4 or not parts[0] or not parts[1] or not parts[2].isdigit() \
+            or len(parts[3]) != 8 or not parts[3].isdigit():
+        raise ValueError(f"Invalid meal_id format: {meal_id!r}")
+    user_id, meal_type, day_offset, date = parts
+    return user_id, meal_type, int(day_offset), date, recipe_id
+
+# Step size of the per-ingredient exponential moving average toward meal ratings
+INGREDIENT_LEARNING_RATE = 0.1
+
+class ShardedLearningQueue:
+    """
+    Single-writer queues for learning events.
+    
+    Each user maps to one shard, and each shard has one worker thread, so a
+    user's events are applied strictly in submission order without
+    cross-thread races. Workers drain whatever is queued and hand it to
+    apply_batch in one call, which lets storage writes be coalesced.
+    """
+    
+    def __init__(self, apply_batch, shard_count: int, max_batch: int = 500):
+        self.apply_batch = apply_batch
+        self.shard_count = shard_count
+        self.max_batch = max_batch
+        self._queues = [queue.Queue() for _ in range(shard_count)]
+        self._workers: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+    
+    def shard_for(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode('utf-8')) % self.shard_count
+    
+    def submit(self, user_id: str, item: Any):
+        self._start_workers()
+        self._queues[self.shard_for(user_id)].put(item)
+    
+    def join(self):
+        """Block until every submitted item has been applied"""
+        for shard_queue in self._queues:
+            shard_queue.join()
+    
+    def _start_workers(self):
+        if self._workers:
+            return
+        with self._start_lock:
+            if self._workers:
+                return
+            for shard in range(self.shard_count):
+                worker = threading.Thread(target=self._run, args=(shard,), name=f"meal-learning-{shard}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+    
+    def _run(self, shard: int):
+        shard_queue = self._queues[shard]
+        while True:
+            batch = [shard_queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(shard_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.apply_batch(shard, batch)
+            except Exception as e:
+                print(f"Error applying learning batch: {e}")
+            finally:
+                for _ in batch:
+                    shard_queue.task_done()
 
 class AIPersonalizationEngine:
     """Core AI engine for learning user preferences and generating personalized meals"""
     
-    def __init__(self, data_dir: str = "ai_meal_data"):
+    # Snapshot a user's derived state after this many unsnapshotted events
+    SNAPSHOT_INTERVAL = 25
+    # Users are partitioned into shards, each with one writer thread and one lock
+    LEARNING_SHARDS = 8
+    # Hot-user cache bounds; least recently used users beyond either are written back and dropped
+    MAX_HOT_USERS = 10000
+    MAX_CACHED_MEALS = 500000
+    # Recipes scoring at or below this are never suggested
+    MIN_CONFIDENCE = 0.3
+    # Std-dev of the score jitter that keeps plans from repeating
+    SCORE_JITTER = 0.1
+    # Score penalty for a recipe whose ingredients were all already used in the plan
+    DIVERSITY_PENALTY = 0.3
+    # Recipe filters keeping more than this share of a partition score it whole and index into it
+    # (gathering that many sparse rows costs more than the contiguous matvec saves)
+    PRUNE_MAX_KEPT = 0.5
+    # Extra score weight of the most plentiful available ingredient (others scale by quantity)
+    QUANTITY_BONUS = 0.2
+    # Score bonus per unit of cosine similarity to the meals a user rated highly
+    SIMILARITY_BONUS = 0.2
+    # Recipes per meal type retrieved from the embedding index for that bonus
+    SIMILAR_CANDIDATES = 200
+    # Relevance vs. novelty trade-off of MMR suggestions (1.0 = plain top-K), and candidates re-ranked per suggestion
+    MMR_LAMBDA = 0.7
+    MMR_POOL_FACTOR = 8
+    # Candidates per meal type handed to the plan optimizer, and its search length in moves
+    # (a move budget rather than a time budget keeps seeded plans reproducible)
+    PLAN_POOL_SIZE = 60
+    PLAN_MAX_MOVES = 3000
+    # Generated plans kept for repeat requests, keyed by user, state version and request;
+    # longer plans aren't kept, so streaming them holds only the current day
+    PLAN_CACHE_SIZE = 2048
+    PLAN_CACHE_MAX_DAYS = 31
+    # Seconds between background consolidations (snapshots of online updates, WAL checkpoint)
+    CONSOLIDATION_INTERVAL = 60.0
+    # Users scored together (one users × recipes matrix per meal type) by each bulk-plan task
+    BULK_BATCH_SIZE = 128
+    
+    def __init__(self, data_dir: str = "ai_meal_data", catalog: Optional[RecipeCatalog] = None,
+                 embeddings_dir: Optional[str] = None, max_hot_users: Optional[int] = None,
+                 max_cached_meals: Optional[int] = None):
         self.data_dir = data_dir
         os.makedirs(data_dir, exist_ok=True)
         
-        # ML Models
-        self.ingredient_vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
-        self.meal_clusterer = KMeans(n_clusters=10, random_state=42)
+        # Recipe catalog, loaded and indexed once
+        self.catalog = catalog or RecipeCatalog.load()
+        
+        # Offline-built recipe embeddings (see recipe_embeddings.py); None until built
+        embeddings_dir = embeddings_dir or os.environ.get('RECIPE_EMBEDDINGS_DIR', os.path.join(data_dir, "recipe_embeddings"))
+        self.embedding_index = RecipeEmbeddingIndex.load(embeddings_dir, self.catalog)
+        self.waste_planner = WastePlanner(self.catalog)
         
-        # User data storage
+        # User data storage (in-memory views of the store, loaded per user on first access)
+        self.store = MealStore(os.path.join(data_dir, "meal_engine.db"))
         self.user_preferences: Dict[str, UserPreference] = {}
-        self.meal_history: Dict[str, List[MealRecord]] = defaultdict(list)
+        self.meal_history: Dict[str, MealHistory] = defaultdict(MealHistory)
         self.ingredient_preferences: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.preference_stats: Dict[str, PreferenceStats] = defaultdict(PreferenceStats)
+        self.insight_stats: Dict[str, InsightStats] = defaultdict(InsightStats)
+        # Materialized insights and their ETag, dropped whenever the user learns or changes preferences
+        self._insights_cache: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        # Version of each loaded user's state (fresh on every load and change) and plans generated per version
+        self._user_versions: Dict[str, int] = {}
+        self._version_counter = itertools.count(1)
+        self._plan_cache: "OrderedDict[Tuple[str, int, str], Tuple[List[Tuple[int, List[GeneratedMeal]]], Dict[str, Any]]]" = OrderedDict()
+        self._plan_cache_lock = threading.Lock()
+        self._consolidation_stop: Optional[threading.Event] = None
+        self._loaded_users = set()
+        self._last_event_id: Dict[str, int] = {}
+        self._unsnapshotted_events: Dict[str, int] = defaultdict(int)
+        
+        # LRU of loaded users (oldest first) and the number of meals they hold in memory
+        self.max_hot_users = max(1, max_hot_users or self.MAX_HOT_USERS)
+        self.max_cached_meals = max_cached_meals or self.MAX_CACHED_MEALS
+        self._hot_users: "OrderedDict[str, None]" = OrderedDict()
+        self._cached_meals = 0
+        self._lru_lock = threading.Lock()
+        
+        # Writers hold a user's shard lock while mutating; readers hold it while copying
+        self.learning_queue = ShardedLearningQueue(self._apply_learning_batch, self.LEARNING_SHARDS)
+        self._shard_locks = [threading.RLock() for _ in range(self.LEARNING_SHARDS)]
         
         # Load existing data
         self._load_user_data()
         
     def _load_user_data(self):
-        """Load existing user preference data"""
+        """Import legacy JSON data into the store on first start"""
         try:
-            prefs_file = os.path.join(self.data_dir, "user_preferences.json")
-            if os.path.exists(prefs_file):
-                with open(prefs_file, 'r') as f:
-                    data = json.load(f)
-                    for user_id, pref_data in data.items():
-                        self.user_preferences[user_id] = UserPreference(**pref_data)
-            
-            history_file = os.path.join(self.data_dir, "meal_history.json")
-            if os.path.exists(history_file):
-                with open(history_file, 'r') as f:
-                    data = json.load(f)
-                    for user_id, meals in data.items():
-                        self.meal_history[user_id] = [MealRecord(**meal) for meal in meals]
-                        
+            if self.store.is_empty():
+                self.store.import_legacy_json(self.data_dir)
         except Exception as e:
             print(f"Error loading user data: {e}")
     
+    def _ensure_user_loaded(self, user_id: str):
+        """Load a user's snapshot and meal history, replaying events newer than the snapshot"""
+        if user_id in self._loaded_users:
+            with self._lru_lock:
+                self._hot_users.move_to_end(user_id)
+            return
+        
+        pref_data, ingredient_prefs, snapshot_event_id = self.store.load_user_state(user_id)
+        if pref_data is not None:
+            self.user_preferences[user_id] = UserPreference(**pref_data)
+        self.ingredient_preferences[user_id] = dict(ingredient_prefs)
+        
+        # Events come in id order, so the ones newer than the snapshot are a suffix
+        meals = []
+        snapshotted = 0
+        pending = []  # Events newer than the snapshot, in log order
+        last_event_id = snapshot_event_id
+        for event_id, kind, payload in self.store.load_events(user_id):
+            event = MealRating(**payload) if kind == 'rating' else MealRecord(**payload)
+            if kind != 'rating':
+                meals.append(event)
+                if event_id <= snapshot_event_id:
+                    snapshotted = len(meals)
+            if event_id > snapshot_event_id:
+                pending.append(event)
+            last_event_id = max(last_event_id, event_id)
+        history = self.meal_history[user_id] = MealHistory.from_records(meals)
+        self.preference_stats[user_id] = PreferenceStats.from_history(meals)
+        self.insight_stats[user_id] = InsightStats.from_history(history)
+        self._user_versions[user_id] = next(self._version_counter)
+        self._last_event_id[user_id] = last_event_id
+        self._loaded_users.add(user_id)
+        self._track_cached_meals(user_id, len(meals))
+        
+        if pending:
+            if len(pending) > len(meals) - snapshotted:
+                # Ratings interleave with the meals, and the updates don't commute: replay in log order
+                for event in pending:
+                    if isinstance(event, MealRating):
+                        self._learn_rating(event)
+                    else:
+                        self._learn_ingredient_preferences(event)
+            else:
+                self._learn_ingredient_preferences_batch(user_id, history, snapshotted)
+            self._update_user_preferences(user_id)
+            self._unsnapshotted_events[user_id] = len(pending)
+    
+    def _user_lock(self, user_id: str) -> threading.RLock:
+        return self._shard_locks[self.learning_queue.shard_for(user_id)]
+    
+    def _track_cached_meals(self, user_id: str, added: int):
+        """Mark a user recently used and account for meals added to its in-memory history"""
+        with self._lru_lock:
+            self._hot_users[user_id] = None
+            self._hot_users.move_to_end(user_id)
+            self._cached_meals += added
+    
+    def _evict_cold_users(self):
+        """
+        Write back and drop least recently used users until the hot set is
+        within its user and meal limits. Call without holding any shard lock.
+        """
+        while True:
+            with self._lru_lock:
+                if len(self._hot_users) <= self.max_hot_users and self._cached_meals <= self.max_cached_meals:
+                    return
+                victim = next(iter(self._hot_users))
+            
+            with self._user_lock(victim):
+                with self._lru_lock:
+                    # Skip if another thread already evicted or just used it
+                    if not self._hot_users or next(iter(self._hot_users)) != victim:
+                        continue
+                self._unload_user(victim)
+    
+    def _unload_user(self, user_id: str):
+        """Snapshot a user's unsaved state and drop it from memory. Caller holds the user's shard lock."""
+        if self._unsnapshotted_events.get(user_id):
+            self._snapshot_users([user_id])
+        
+        meals = self.meal_history.pop(user_id, ())
+        self.user_preferences.pop(user_id, None)
+        self.ingredient_preferences.pop(user_id, None)
+        self.preference_stats.pop(user_id, None)
+        self.insight_stats.pop(user_id, None)
+        self._insights_cache.pop(user_id, None)
+        self._user_versions.pop(user_id, None)
+        self._last_event_id.pop(user_id, None)
+        self._unsnapshotted_events.pop(user_id, None)
+        self._loaded_users.discard(user_id)
+        with self._lru_lock:
+            self._hot_users.pop(user_id, None)
+            self._cached_meals -= len(meals)
+    
+    def _user_changed(self, user_id: str):
+        """Invalidate views derived from a user's state (insights, cached plans). Caller holds the user's shard lock."""
+        self._user_versions[user_id] = next(self._version_counter)
+        self._insights_cache.pop(user_id, None)
+    
     def _save_user_data(self):
-        """Save user preference data"""
+        """Snapshot derived state for every user with unsnapshotted changes"""
         try:
-            prefs_file = os.path.join(self.data_dir, "user_preferences.json")
-            with open(prefs_file, 'w') as f:
-                data = {user_id: asdict(pref) for user_id, pref in self.user_preferences.items()}
-                json.dump(data, f, indent=2)
-            
-            history_file = os.path.join(self.data_dir, "meal_history.json")
-            with open(history_file, 'w') as f:
-                data = {user_id: [asdict(meal) for meal in meals] 
-                       for user_id, meals in self.meal_history.items()}
-                json.dump(data, f, indent=2)
-                
+            for shard, lock in enumerate(self._shard_locks):
+                with lock:
+                    dirty_users = [
+                        user_id for user_id, count in list(self._unsnapshotted_events.items())
+                        if count and self.learning_queue.shard_for(user_id) == shard
+                    ]
+                    self._snapshot_users(dirty_users)
         except Exception as e:
             print(f"Error saving user data: {e}")
     
+    def _snapshot_users(self, user_ids: List[str]):
+        """Persist preferences and ingredient scores up to each user's last applied event"""
+        states = []
+        for user_id in user_ids:
+            pref = self.user_preferences.get(user_id)
+            states.append((
+                user_id,
+                asdict(pref) if pref else None,
+                dict(self.ingredient_preferences.get(user_id, {})),
+                self._last_event_id.get(user_id, 0)
+            ))
+        self.store.save_user_states(states)
+        for user_id in user_ids:
+            self._unsnapshotted_events[user_id] = 0
+    
+    def get_user_preferences(self, user_id: str) -> Optional[UserPreference]:
+        """Consistent copy of a user's preferences, or None if none exist yet"""
+        with self._user_lock(user_id):
+            self._ensure_user_loaded(user_id)
+            user_pref = copy.deepcopy(self.user_preferences.get(user_id))
+        self._evict_cold_users()
+        return user_pref
+    
+    def set_user_preferences(self, user_pref: UserPreference):
+        """Replace a user's preferences and persist them immediately"""
+        with self._user_lock(user_pref.user_id):
+            self._ensure_user_loaded(user_pref.user_id)
+            self.user_preferences[user_pref.user_id] = user_pref
+            self._user_changed(user_pref.user_id)
+            self._snapshot_users([user_pref.user_id])
+        self._evict_cold_users()
+    
+    def _user_snapshot(self, user_id: str, create_default: bool = True) -> Tuple[Optional[UserPreference], Dict[str, float], MealHistory]:
+        """Consistent copies of a user's preferences and ingredient scores, and a read-only view of its history"""
+        with self._user_lock(user_id):
+            self._ensure_user_loaded(user_id)
+            if create_default and user_id not in self.user_preferences:
+                # Create default preferences for new user
+                self.user_preferences[user_id] = UserPreference(user_id=user_id)
+            snapshot = (
+                copy.deepcopy(self.user_preferences.get(user_id)),
+                dict(self.ingredient_preferences.get(user_id, {})),
+                self.meal_history[user_id].view() if user_id in self.meal_history else MealHistory()
+            )
+        self._evict_cold_users()
+        return snapshot
+    
+    def submit_meal(self, meal_record: MealRecord):
+        """Queue a meal for in-order learning by its user's shard writer"""
+        self.learning_queue.submit(meal_record.user_id, meal_record)
+    
     def learn_from_meal(self, meal_record: MealRecord):
         """Learn from a user's meal consumption"""
         user_id = meal_record.user_id
+        with self._user_lock(user_id):
+            self._ensure_user_loaded(user_id)
+            
+            # Durably log the meal before touching in-memory state
+            event_id = self.store.append_event(user_id, 'meal', asdict(meal_record))
+            self._apply_meal(meal_record, event_id)
+            
+            # Snapshot derived state periodically; the event log covers the rest
+            if self._unsnapshotted_events[user_id] >= self.SNAPSHOT_INTERVAL:
+                self._snapshot_users([user_id])
+        self._evict_cold_users()
+    
+    def learn_from_meals(self, meal_records: List[MealRecord]):
+        """
+        Batch ingestion: log every record in one transaction, apply each
+        user's ingredient updates in one vectorized pass, recompute derived
+        preferences once per user and snapshot once.
+        """
+        shards = sorted({self.learning_queue.shard_for(meal_record.user_id) for meal_record in meal_records})
+        
+        # Take shard locks in index order so concurrent batches can't deadlock
+        acquired = []
+        try:
+            for shard in shards:
+                self._shard_locks[shard].acquire()
+                acquired.append(shard)
+            self._learn_batch_locked(meal_records)
+        finally:
+            for shard in reversed(acquired):
+                self._shard_locks[shard].release()
+        self._evict_cold_users()
+    
+    def _apply_learning_batch(self, shard: int, items: List[Any]):
+        """
+        Shard writer: apply a drained batch in submission order, runs of meals
+        through the batch ingestion path and runs of ratings online.
+        """
+        with self._shard_locks[shard]:
+            for is_rating, run in itertools.groupby(items, key=lambda item: isinstance(item, MealRating)):
+                if is_rating:
+                    self._rate_batch_locked(list(run))
+                else:
+                    self._learn_batch_locked(list(run), snapshot_all=False)
+        self._evict_cold_users()
+    
+    def _learn_batch_locked(self, meal_records: List[MealRecord], snapshot_all: bool = True):
+        """Batch learning body. Caller holds the shard locks of every user involved."""
+        by_user: Dict[str, List[MealRecord]] = defaultdict(list)
+        for meal_record in meal_records:
+            by_user[meal_record.user_id].append(meal_record)
+        
+        for user_id in by_user:
+            self._ensure_user_loaded(user_id)
+        
+        event_ids = self.store.append_events(
+            [(meal_record.user_id, 'meal', asdict(meal_record)) for meal_record in meal_records]
+        )
+        last_event_ids = {}
+        for meal_record, event_id in zip(meal_records, event_ids):
+            last_event_ids[meal_record.user_id] = event_id
+        
+        for user_id, user_records in by_user.items():
+            history = self.meal_history[user_id]
+            start = len(history)
+            history.extend(user_records)
+            self.preference_stats[user_id].observe_many(user_records)
+            self.insight_stats[user_id].observe_many(user_records)
+            self._user_changed(user_id)
+            self._track_cached_meals(user_id, len(user_records))
+            self._learn_ingredient_preferences_batch(user_id, history, start)
+            self._update_user_preferences(user_id)
+            self._last_event_id[user_id] = last_event_ids[user_id]
+            self._unsnapshotted_events[user_id] += len(user_records)
+        
+        self._snapshot_users([
+            user_id for user_id in by_user
+            if snapshot_all or self._unsnapshotted_events[user_id] >= self.SNAPSHOT_INTERVAL
+        ])
+    
+    def submit_rating(self, meal_rating: MealRating):
+        """Queue a rating for in-order learning by its user's shard writer"""
+        self.learning_queue.submit(meal_rating.user_id, meal_rating)
+    
+    def learn_from_rating(self, meal_rating: MealRating):
+        """Log a rating and apply it to the user's ingredient scores"""
+        with self._user_lock(meal_rating.user_id):
+            self._rate_batch_locked([meal_rating])
+        self._evict_cold_users()
+    
+    def resolve_rating(self,
+                       meal_id: str,
+                       rating: float,
+                       feedback: str = "",
+                       recipe_name: Optional[str] = None) -> MealRating:
+        """
+        Rating event for a generated meal. The recipe is the one named by
+        recipe_name if given, else the one whose id is in meal_id. Raises
+        ValueError for a malformed id or rating and KeyError if the recipe
+        can't be found.
+        """
+        user_id, meal_type, _, _, recipe_id = parse_meal_id(meal_id)
+        if not 1 <= rating <= 5:
+            raise ValueError(f"Rating must be between 1 and 5, got {rating}")
+        if recipe_name is not None:
+            recipe_id = self.catalog.name_ids.get(recipe_name)
+        elif recipe_id is not None and not 0 <= recipe_id < len(self.catalog):
+            recipe_id = None
+        if recipe_id is None:
+            raise KeyError(f"Unknown meal {meal_id}" if recipe_name is None else f"Unknown recipe {recipe_name}")
+        recipe = self.catalog.recipes[recipe_id]
+        return MealRating(
+            user_id=user_id,
+            meal_id=meal_id,
+            recipe_name=recipe['name'],
+            ingredients=list(recipe['ingredients']),
+            meal_type=meal_type,
+            rating=float(rating),
+            feedback=feedback,
+            date=datetime.now().strftime("%Y-%m-%d")
+        )
+    
+    def _rate_batch_locked(self, meal_ratings: List[MealRating]):
+        """
+        Log ratings in one transaction, then move each rated recipe's
+        ingredient scores toward its rating: O(ingredients) per rating, no
+        history scan. Caller holds the shard locks of every user involved.
+        """
+        user_ids = list(dict.fromkeys(meal_rating.user_id for meal_rating in meal_ratings))
+        for user_id in user_ids:
+            self._ensure_user_loaded(user_id)
+        
+        event_ids = self.store.append_events(
+            [(meal_rating.user_id, 'rating', asdict(meal_rating)) for meal_rating in meal_ratings]
+        )
+        for meal_rating, event_id in zip(meal_ratings, event_ids):
+            self._learn_rating(meal_rating)
+            self._last_event_id[meal_rating.user_id] = event_id
+            self._unsnapshotted_events[meal_rating.user_id] += 1
+        
+        for user_id in user_ids:
+            self._user_changed(user_id)
+        self._snapshot_users([
+            user_id for user_id in user_ids if self._unsnapshotted_events[user_id] >= self.SNAPSHOT_INTERVAL
+        ])
+    
+    def consolidate(self):
+        """
+        Fold online updates into durable state: snapshot every user with
+        unsnapshotted events (so reloads replay little of the log) and
+        checkpoint the WAL.
+        """
+        self._save_user_data()
+        self.store.checkpoint()
+    
+    def start_consolidation(self, interval: Optional[float] = None):
+        """Run consolidate() every `interval` seconds on a daemon thread until stop_consolidation()"""
+        if self._consolidation_stop is not None:
+            return
+        interval = interval or self.CONSOLIDATION_INTERVAL
+        stop = self._consolidation_stop = threading.Event()
+        
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.consolidate()
+                except Exception as e:
+                    print(f"Error consolidating meal engine state: {e}")
+        
+        threading.Thread(target=run, name="meal-consolidation", daemon=True).start()
+    
+    def stop_consolidation(self):
+        if self._consolidation_stop is not None:
+            self._consolidation_stop.set()
+            self._consolidation_stop = None
+    
+    def _apply_meal(self, meal_record: MealRecord, event_id: int):
+        """Apply a logged meal to in-memory state. Caller holds the user's shard lock."""
+        user_id = meal_record.user_id
         
         # Add to meal history
         self.meal_history[user_id].append(meal_record)
+        self.preference_stats[user_id].observe(meal_record)
+        self.insight_stats[user_id].observe(meal_record)
+        self._user_changed(user_id)
+        self._track_cached_meals(user_id, 1)
         
         # Update ingredient preferences based on rating/enjoyment
-        if meal_record.rating is not None or meal_record.enjoyed is not None:
-            preference_score = 0.0
-            
-            if meal_record.rating:
-                preference_score = (meal_record.rating - 3.0) / 2.0  # Convert 1-5 to -1 to 1
-            elif meal_record.enjoyed is not None:
-                preference_score = 1.0 if meal_record.enjoyed else -0.5
-            
-            # Update ingredient preferences
-            for ingredient in meal_record.ingredients:
-                if ingredient not in self.ingredient_preferences[user_id]:
-                    self.ingredient_preferences[user_id][ingredient] = 0.0
-                
-                # Apply learning rate decay
-                current_pref = self.ingredient_preferences[user_id][ingredient]
-                learning_rate = 0.1
-                self.ingredient_preferences[user_id][ingredient] = (
-                    current_pref + learning_rate * (preference_score - current_pref)
-                )
+        self._learn_ingredient_preferences(meal_record)
         
         # Update user preferences based on patterns
         self._update_user_preferences(user_id)
         
-        # Save updated data
-        self._save_user_data()
+        self._last_event_id[user_id] = event_id
+        self._unsnapshotted_events[user_id] += 1
+    
+    @staticmethod
+    def _preference_score(meal_record: MealRecord) -> Optional[float]:
+        """Rating/enjoyment as a -1..1 learning target, or None if the meal wasn't rated"""
+        if meal_record.rating is None and meal_record.enjoyed is None:
+            return None
+        
+        preference_score = 0.0
+        if meal_record.rating:
+            preference_score = (meal_record.rating - 3.0) / 2.0  # Convert 1-5 to -1 to 1
+        elif meal_record.enjoyed is not None:
+            preference_score = 1.0 if meal_record.enjoyed else -0.5
+        return preference_score
+    
+    def _learn_ingredient_preferences(self, meal_record: MealRecord):
+        """Move ingredient scores toward the meal's rating/enjoyment"""
+        preference_score = self._preference_score(meal_record)
+        if preference_score is not None:
+            self._move_ingredient_preferences(meal_record.user_id, meal_record.ingredients, preference_score)
+    
+    def _learn_rating(self, meal_rating: MealRating):
+        """Move ingredient scores toward a generated meal's rating, like a rated meal record"""
+        self._move_ingredient_preferences(meal_rating.user_id, meal_rating.ingredients, (meal_rating.rating - 3.0) / 2.0)
+    
+    def _move_ingredient_preferences(self, user_id: str, ingredients: List[str], preference_score: float):
+        """One EMA step of each ingredient's score toward a -1..1 preference"""
+        prefs = self.ingredient_preferences[user_id]
+        for ingredient in ingredients:
+            # Apply learning rate decay
+            current_pref = prefs.get(ingredient, 0.0)
+            prefs[ingredient] = current_pref + INGREDIENT_LEARNING_RATE * (preference_score - current_pref)
+    
+    def _learn_ingredient_preferences_batch(self, user_id: str, history: MealHistory, start: int = 0,
+                                            chunk_size: int = 1000):
+        """
+        Apply the ingredient updates of history[start:] at once.
+        
+        An ingredient seen k times moves as p <- d*p + (1-d)*s per occurrence
+        (d = 1 - learning rate), which unrolls to
+            p_final = d^k * p0 + sum_t s_t * (1 - d^m_t) * d^after_t
+        where m_t is its count in meal t and after_t its count in later meals.
+        Same result as applying the meals one by one, in one NumPy pass over
+        the history's rating/enjoyment and interned ingredient columns.
+        """
+        ratings, enjoyed = history.ratings[start:], history.enjoyed[start:]
+        rated = ~np.isnan(ratings)
+        has_enjoyed = enjoyed != MISSING
+        # Same rules as _preference_score: a nonzero rating wins, then enjoyment
+        scores = np.where(rated & (ratings != 0), (ratings - 3.0) / 2.0,
+                          np.where(has_enjoyed, np.where(enjoyed == 1, 1.0, -0.5), 0.0))
+        scored_meals = np.flatnonzero(rated | has_enjoyed)
+        
+        meal_of = history.ingredient_meals(start) - start
+        ingredient_ids = history.ingredient_ids(start)
+        prefs = self.ingredient_preferences[user_id]
+        decay = 1.0 - INGREDIENT_LEARNING_RATE
+        
+        for chunk_start in range(0, len(scored_meals), chunk_size):
+            chunk = scored_meals[chunk_start:chunk_start + chunk_size]
+            rows = np.full(len(scores), -1)
+            rows[chunk] = np.arange(len(chunk))
+            entry_rows = rows[meal_of]
+            in_chunk = entry_rows >= 0
+            vocabulary, columns = np.unique(ingredient_ids[in_chunk], return_inverse=True)
+            
+            counts = np.zeros((len(chunk), len(vocabulary)))
+            np.add.at(counts, (entry_rows[in_chunk], columns), 1)
+            
+            totals = counts.sum(axis=0)
+            after = totals - np.cumsum(counts, axis=0)
+            names = [INGREDIENTS.names[i] for i in vocabulary.tolist()]
+            initial = np.array([prefs.get(ingredient, 0.0) for ingredient in names])
+            final = decay ** totals * initial + (scores[chunk][:, None] * (1.0 - decay ** counts) * decay ** after).sum(axis=0)
+            
+            for ingredient, value in zip(names, final.tolist()):
+                prefs[ingredient] = value
     
     def _update_user_preferences(self, user_id: str):
-        """Update user preferences based on meal history patterns"""
+        """Update user preferences from the incrementally maintained meal statistics"""
+        if user_id not in self.user_preferences:
+            self.user_preferences[user_id] = UserPreference(user_id=user_id)
+        
+        self.preference_stats[user_id].apply_to(self.user_preferences[user_id])
+    
+    def _recompute_user_preferences(self, user_id: str):
+        """
+        Update user preferences by rescanning the meal history.
+        Reference for `_update_user_preferences`; not used on the hot path.
+        """
         if user_id not in self.user_preferences:
             self.user_preferences[user_id] = UserPreference(user_id=user_id)
         
         user_meals = self.meal_history[user_id]
-        if len(user_meals) < 5:  # Need enough data to learn patterns
+        if len(user_meals) < MIN_MEALS:  # Need enough data to learn patterns
             return
         
         # Analyze favorite ingredients (top rated/enjoyed)
         ingredient_scores = defaultdict(list)
-        for meal in user_meals[-50:]:  # Last 50 meals
+        for meal in user_meals[-FAVORITES_WINDOW:]:
             if meal.rating and meal.rating >= 4:
                 for ingredient in meal.ingredients:
                     ingredient_scores[ingredient].append(meal.rating)
         
         # Update favorite ingredients
         avg_scores = {ing: np.mean(scores) for ing, scores in ingredient_scores.items()}
-        top_ingredients = sorted(avg_scores.items(), key=lambda x: x[1], reverse=True)[:15]
+        top_ingredients = sorted(avg_scores.items(), key=lambda x: x[1], reverse=True)[:TOP_FAVORITES]
         self.user_preferences[user_id].favorite_ingredients = [ing for ing, _ in top_ingredients]
         
         # Analyze meal timing patterns
-        meal_type_counts = Counter(meal.meal_type for meal in user_meals[-30:])
+        meal_type_counts = Counter(meal.meal_type for meal in user_meals[-FREQUENCY_WINDOW:])
         self.user_preferences[user_id].meal_frequency = dict(meal_type_counts)
         
         # Analyze cooking time preferences
         time_prefs = defaultdict(list)
-        for meal in user_meals[-20:]:
+        for meal in user_meals[-TIME_WINDOW:]:
             if meal.prep_time and meal.rating and meal.rating >= 4:
                 time_prefs[meal.meal_type].append(meal.prep_time)
         
@@ -209,98 +759,720 @@ class AIPersonalizationEngine:
                                    user_id: str,
                                    days: int = 7,
                                    meals_per_day: int = 3,
-                                   available_ingredients: List[str] = None) -> List[GeneratedMeal]:
+                                   available_ingredients: List[str] = None,
+                                   constraints: Optional[PlanConstraints] = None,
+                                   seed: Optional[int] = None,
+                                   recipe_filter: Optional[RecipeFilter] = None,
+                                   servings: int = 1,
+                                   available_quantities: Optional[Dict[str, float]] = None) -> List[GeneratedMeal]:
         """Generate personalized meal suggestions using AI"""
+        meals, _ = self.generate_meal_plan(user_id, days, meals_per_day, available_ingredients, constraints, seed,
+                                           recipe_filter, servings, available_quantities)
+        return meals
+    
+    def generate_meal_plan(self,
+                           user_id: str,
+                           days: int = 7,
+                           meals_per_day: int = 3,
+                           available_ingredients: List[str] = None,
+                           constraints: Optional[PlanConstraints] = None,
+                           seed: Optional[int] = None,
+                           recipe_filter: Optional[RecipeFilter] = None,
+                           servings: int = 1,
+                           available_quantities: Optional[Dict[str, float]] = None) -> Tuple[List[GeneratedMeal], Dict[str, Any]]:
+        """
+        Personalized plan plus a report on how it was built.
+        Without active constraints each meal type's days are filled greedily;
+        with budget/calorie/protein targets or expiring inventory the greedy
+        plan seeds a move-budgeted local search over the whole plan.
         
-        if user_id not in self.user_preferences:
-            # Create default preferences for new user
-            self.user_preferences[user_id] = UserPreference(user_id=user_id)
+        A recipe_filter prunes each meal type's recipes before scoring.
+        Costs (and the weekly budget) are for `servings` people, and
+        available_quantities favors the most plentiful available ingredients.
         
-        user_prefs = self.user_preferences[user_id]
-        user_ingredient_prefs = self.ingredient_preferences.get(user_id, {})
+        Randomness is seeded from the request (user, date, plan parameters,
+        inventory and constraints) unless a seed is given, so identical
+        requests get identical plans; repeats are served from the plan cache
+        until the user's preferences or history change.
+        """
+        return self._drain_plan(self.stream_meal_plan(user_id, days, meals_per_day, available_ingredients, constraints,
+                                                      seed, recipe_filter, servings, available_quantities))
+    
+    @staticmethod
+    def _drain_plan(stream: Generator[Tuple[int, List[GeneratedMeal]], None, Dict[str, Any]]) -> Tuple[List[GeneratedMeal], Dict[str, Any]]:
+        """All meals of a plan stream, in order, and its report"""
+        meals = []
+        while True:
+            try:
+                meals.extend(next(stream)[1])
+            except StopIteration as stop:
+                return meals, stop.value
+    
+    def stream_meal_plan(self,
+                         user_id: str,
+                         days: int = 7,
+                         meals_per_day: int = 3,
+                         available_ingredients: List[str] = None,
+                         constraints: Optional[PlanConstraints] = None,
+                         seed: Optional[int] = None,
+                         recipe_filter: Optional[RecipeFilter] = None,
+                         servings: int = 1,
+                         available_quantities: Optional[Dict[str, float]] = None
+                         ) -> Generator[Tuple[int, List[GeneratedMeal]], None, Dict[str, Any]]:
+        """
+        generate_meal_plan one day at a time: yields (day, meals) as soon as
+        each day is chosen and returns the plan report. Greedy plans are
+        picked day by day; plans with active constraints are optimized as a
+        whole first, then yielded per day.
+        """
+        available_ingredients = available_ingredients or []
+        request_key = self._plan_request_key(user_id, days, meals_per_day, available_ingredients, constraints, seed,
+                                             recipe_filter, servings, available_quantities)
+        if seed is None:
+            seed = int(request_key[:16], 16)
         
-        # Load meal database (this would be expanded with real recipe data)
-        meal_database = self._load_meal_database()
+        # Read the version before the snapshot: a plan is never cached under a newer version than its inputs
+        with self._user_lock(user_id):
+            self._ensure_user_loaded(user_id)
+            cache_key = (user_id, self._user_versions[user_id], request_key)
+        with self._plan_cache_lock:
+            cached = self._plan_cache.get(cache_key)
+            if cached is not None:
+                self._plan_cache.move_to_end(cache_key)
+        if cached is not None:
+            plan_days, report = copy.deepcopy(cached)
+            yield from plan_days
+            report["cached"] = True
+            return report
         
-        # Generate meals using multiple AI strategies
-        generated_meals = []
+        stream = self._iter_meal_plan(user_id, days, meals_per_day, available_ingredients, constraints, seed,
+                                      recipe_filter, servings, available_quantities)
+        cacheable = days <= self.PLAN_CACHE_MAX_DAYS
+        plan_days = []
+        while True:
+            try:
+                day, meals = next(stream)
+            except StopIteration as stop:
+                report = stop.value
+                break
+            if cacheable:
+                plan_days.append((day, copy.deepcopy(meals)))
+            yield day, meals
         
+        report["seed"] = seed
+        if cacheable:
+            with self._plan_cache_lock:
+                self._plan_cache[cache_key] = (plan_days, copy.deepcopy(report))
+                while len(self._plan_cache) > self.PLAN_CACHE_SIZE:
+                    self._plan_cache.popitem(last=False)
+        report["cached"] = False
+        return report
+    
+    @staticmethod
+    def _plan_request_key(user_id: str, days: int, meals_per_day: int, available_ingredients: List[str],
+                          constraints: Optional[PlanConstraints], seed: Optional[int],
+                          recipe_filter: Optional[RecipeFilter] = None, servings: int = 1,
+                          available_quantities: Optional[Dict[str, float]] = None) -> str:
+        """Digest of everything a plan depends on besides the user's state (including today's date)."""
+        request = {
+            "user_id": user_id,
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "days": days,
+            "meals_per_day": meals_per_day,
+            "available_ingredients": sorted(set(available_ingredients)),
+            "constraints": asdict(constraints) if constraints is not None else None,
+            "seed": seed,
+            "recipe_filter": asdict(recipe_filter) if recipe_filter is not None and recipe_filter.active else None,
+            "servings": servings,
+            "available_quantities": available_quantities or None
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    
+    def _iter_meal_plan(self,
+                        user_id: str,
+                        days: int,
+                        meals_per_day: int,
+                        available_ingredients: List[str],
+                        constraints: Optional[PlanConstraints],
+                        seed: int,
+                        recipe_filter: Optional[RecipeFilter] = None,
+                        servings: int = 1,
+                        available_quantities: Optional[Dict[str, float]] = None
+                        ) -> Generator[Tuple[int, List[GeneratedMeal]], None, Dict[str, Any]]:
+        """Uncached plan generation for stream_meal_plan: yields (day, meals), returns the report"""
+        
+        user_prefs, user_ingredient_prefs, user_meals = self._user_snapshot(user_id)
+        taste_profile = self._taste_profile(user_meals)
+        
+        # Scores don't depend on the day: score each meal type once
+        candidates = {
+            meal_type: self._score_meal_type(
+                user_prefs, user_ingredient_prefs, meal_type, available_ingredients, taste_profile,
+                recipe_filter, available_quantities
+            )
+            for meal_type in self._plan_meal_types(meals_per_day)
+        }
+        report = yield from self._iter_plan_days(user_prefs, user_ingredient_prefs, candidates, days,
+                                                 available_ingredients, constraints, seed, servings)
+        if recipe_filter is not None and recipe_filter.active:
+            report["candidates"] = {meal_type: len(recipe_ids) for meal_type, (recipe_ids, _) in candidates.items()}
+        return report
+    
+    @staticmethod
+    def _plan_meal_types(meals_per_day: int) -> List[str]:
         meal_types = ['breakfast', 'lunch', 'dinner']
         if meals_per_day > 3:
             meal_types.append('snack')
+        return meal_types
+    
+    def _iter_plan_days(self,
+                        user_prefs: UserPreference,
+                        user_ingredient_prefs: Dict[str, float],
+                        candidates: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                        days: int,
+                        available_ingredients: List[str],
+                        constraints: Optional[PlanConstraints],
+                        seed: int,
+                        servings: int = 1) -> Generator[Tuple[int, List[GeneratedMeal]], None, Dict[str, Any]]:
+        """
+        Pick a plan from each meal type's scored (recipe ids, scores): a
+        diverse recipe per day, day by day, or the whole plan through the
+        local search when constraints are active. Yields (day, meals),
+        returns the report.
+        """
+        rng = np.random.default_rng(seed)
+        meal_types = list(candidates)
+        used_ingredients = Counter()
+        picks = {
+            meal_type: self._iter_diverse_recipes(recipe_ids, scores, days, used_ingredients, rng)
+            for meal_type, (recipe_ids, scores) in candidates.items()
+        }
         
-        for day in range(days):
-            for meal_type in meal_types:
-                meal = self._generate_single_meal(
-                    user_prefs, 
-                    user_ingredient_prefs,
-                    meal_type,
-                    available_ingredients or [],
-                    meal_database,
-                    day
+        def build_day(day: int, day_plan: List[Optional[Tuple[int, float]]]) -> List[GeneratedMeal]:
+            day_meals = []
+            for meal_type, pick in zip(meal_types, day_plan):
+                if pick is None:
+                    continue
+                recipe_id, confidence = pick
+                meal = self._build_generated_meal(
+                    recipe_id, confidence, user_prefs,
+                    user_ingredient_prefs, meal_type, available_ingredients, day, servings
                 )
-                if meal:
-                    generated_meals.append(meal)
+                if constraints is not None and constraints.expiring:
+                    expiring_used = [ing for ing in meal.ingredients if constraints.expiring.get(ing.lower(), 0) > day]
+                    if expiring_used:
+                        meal.reasoning += f" | Uses {len(expiring_used)} expiring ingredients"
+                day_meals.append(meal)
+            return day_meals
         
-        return generated_meals
+        report: Dict[str, Any] = {"optimizer": "greedy"}
+        if constraints is None or not constraints.active:
+            for day in range(days):
+                yield day, build_day(day, [next(picks[meal_type], None) for meal_type in meal_types])
+            return report
+        
+        # The local search needs the whole greedy plan as its starting point
+        slots = [(day, meal_type) for day in range(days) for meal_type in meal_types]
+        plan = [next(picks[meal_type], None) for _, meal_type in slots]
+        if constraints.weekly_budget is not None and servings > 1:
+            # The optimizer prices recipes per serving
+            constraints = replace(constraints, weekly_budget=constraints.weekly_budget / servings)
+        expiring_vector = self.catalog.ingredient_vector({
+            ingredient: 1.0 for ingredient in self.catalog.ingredient_ids if ingredient.lower() in constraints.expiring
+        }) if constraints.expiring else None
+        pools = {
+            meal_type: self._plan_pool(meal_type, recipe_ids, scores, expiring_vector)
+            for meal_type, (recipe_ids, scores) in candidates.items()
+        }
+        optimizer = PlanOptimizer(self.catalog, rng=random.Random(seed), max_moves=self.PLAN_MAX_MOVES)
+        plan, optimizer_report = optimizer.optimize(slots, pools, constraints,
+                                                    initial=[pick[0] if pick else None for pick in plan])
+        report = {**optimizer_report, **report, "optimizer": "local_search"}
+        
+        for day in range(days):
+            yield day, build_day(day, plan[day * len(meal_types):(day + 1) * len(meal_types)])
+        return report
     
-    def _generate_single_meal(self,
-                             user_prefs: UserPreference,
-                             ingredient_prefs: Dict[str, float],
-                             meal_type: str,
-                             available_ingredients: List[str],
-                             meal_database: List[Dict],
-                             day_offset: int) -> Optional[GeneratedMeal]:
-        """Generate a single personalized meal"""
+    def generate_bulk_plans(self,
+                            output_path: str,
+                            user_ids: Optional[List[str]] = None,
+                            days: int = 7,
+                            meals_per_day: int = 3,
+                            workers: Optional[int] = None,
+                            batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Offline plans for many users (every user in the store by default),
+        e.g. next week's plans for a cron job, written to `output_path` as
+        JSON Lines: one {"user_id", "meals", "report"} object per user.
         
-        # Score meals based on user preferences
-        scored_meals = []
+        Users are planned in batches of `batch_size`; each batch scores all
+        its users against a meal type as one matrix product. Batches are
+        spread over `workers` processes started by a forkserver, never forked
+        from this one: this process has a live store connection and learning
+        threads. Workers get a planner holding only the catalog and embedding
+        index (see _bulk_planner), so they can't reach the store. Plans are
+        the ones generate_meal_plan would return today for the same
+        arguments. Returns a report with the throughput.
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
         
-        for meal_data in meal_database:
-            if meal_data.get('meal_type') != meal_type:
-                continue
+        start_time = time.perf_counter()
+        user_ids = self.store.user_ids() if user_ids is None else list(user_ids)
+        batch_size = batch_size or self.BULK_BATCH_SIZE
+        workers = workers or os.cpu_count() or 1
+        if 'forkserver' not in multiprocessing.get_all_start_methods():
+            workers = 1
+        
+        def batches() -> Iterator[List[Tuple[UserPreference, Dict[str, float], Optional[np.ndarray], int]]]:
+            # State is read here, in this process; workers only score and pick
+            for i in range(0, len(user_ids), batch_size):
+                batch = []
+                for user_id in user_ids[i:i + batch_size]:
+                    user_prefs, ingredient_prefs, user_meals = self._user_snapshot(user_id)
+                    seed = int(self._plan_request_key(user_id, days, meals_per_day, [], None, None)[:16], 16)
+                    batch.append((user_prefs, ingredient_prefs, self._taste_profile(user_meals), seed))
+                yield batch
+        
+        batch_count = 0
+        with open(output_path, 'w') as f:
+            def write(results: List[Tuple[str, List[Dict[str, Any]], Dict[str, Any]]]):
+                f.writelines(
+                    json.dumps({"user_id": user_id, "meals": meals, "report": report}) + "\n"
+                    for user_id, meals, report in results
+                )
             
-            score = self._calculate_meal_score(
-                meal_data, user_prefs, ingredient_prefs, available_ingredients
+            if workers == 1:
+                for batch in batches():
+                    write(self._plan_user_batch(batch, days, meals_per_day))
+                    batch_count += 1
+            else:
+                context = multiprocessing.get_context('forkserver')
+                # Workers fork from a server that has imported this module, but never built an engine
+                context.set_forkserver_preload([__name__])
+                with ProcessPoolExecutor(workers, mp_context=context,
+                                         initializer=_init_bulk_worker, initargs=(self._bulk_planner(),)) as executor:
+                    # A few batches in flight per worker; results are written in user order
+                    pending = deque()
+                    for batch in batches():
+                        pending.append(executor.submit(_plan_bulk_batch, batch, days, meals_per_day))
+                        if len(pending) >= 2 * workers:
+                            write(pending.popleft().result())
+                        batch_count += 1
+                    while pending:
+                        write(pending.popleft().result())
+        
+        elapsed = time.perf_counter() - start_time
+        return {
+            "users": len(user_ids),
+            "days": days,
+            "workers": workers,
+            "batches": batch_count,
+            "output_path": output_path,
+            "elapsed_s": round(elapsed, 3),
+            "users_per_second": round(len(user_ids) / elapsed, 1) if elapsed > 0 else None
+        }
+    
+    def _bulk_planner(self) -> 'AIPersonalizationEngine':
+        """
+        An engine holding only the read-only recipe state that _plan_user_batch
+        needs, for bulk-plan workers. It has no store, queues or locks, so it
+        pickles cheaply and any attempt to touch user state fails loudly.
+        """
+        planner = object.__new__(type(self))
+        planner.catalog = self.catalog
+        planner.embedding_index = self.embedding_index
+        return planner
+    
+    def _plan_user_batch(self,
+                         batch: List[Tuple[UserPreference, Dict[str, float], Optional[np.ndarray], int]],
+                         days: int,
+                         meals_per_day: int) -> List[Tuple[str, List[Dict[str, Any]], Dict[str, Any]]]:
+        """Greedy plans for (preferences, ingredient scores, taste profile, seed) entries, as (user_id, meal dicts, report)"""
+        candidates: List[Dict[str, Tuple[np.ndarray, np.ndarray]]] = [{} for _ in batch]
+        users = [(user_prefs, ingredient_prefs) for user_prefs, ingredient_prefs, _, _ in batch]
+        for meal_type in self._plan_meal_types(meals_per_day):
+            part = self.catalog.partition(meal_type)
+            recipe_ids = self.catalog.meal_type_ids(meal_type)
+            scores = self._score_recipes_batch(meal_type, users)
+            for row, (_, _, taste_profile, _) in enumerate(batch):
+                candidates[row][meal_type] = self._finish_meal_type_scores(recipe_ids, scores[row], part, taste_profile)
+        
+        results = []
+        for (user_prefs, ingredient_prefs, _, seed), user_candidates in zip(batch, candidates):
+            meals, report = self._drain_plan(
+                self._iter_plan_days(user_prefs, ingredient_prefs, user_candidates, days, [], None, seed)
             )
-            
-            if score > 0.3:  # Minimum confidence threshold
-                scored_meals.append((meal_data, score))
+            report["seed"] = seed
+            # The meals are fresh and unshared, so their __dict__s serve as-is (asdict would deep-copy)
+            results.append((user_prefs.user_id, [vars(meal) for meal in meals], report))
+        return results
+    
+    def suggest_meals(self,
+                      user_id: str,
+                      meal_type: str,
+                      count: int = 5,
+                      available_ingredients: List[str] = None) -> List[GeneratedMeal]:
+        """
+        The `count` best distinct recipes of one meal type, re-ranked with
+        maximal marginal relevance so near-duplicates don't crowd the list.
+        Only that meal type is scored, and only its top candidates are
+        partially sorted out of the scored partition.
+        """
+        user_prefs, user_ingredient_prefs, user_meals = self._user_snapshot(user_id)
+        available_ingredients = available_ingredients or []
+        recipe_ids, scores = self._score_meal_type(
+            user_prefs, user_ingredient_prefs, meal_type, available_ingredients, self._taste_profile(user_meals)
+        )
+        
+        suggestions = []
+        for recipe_id, score in self._select_mmr_recipes(recipe_ids, scores, count):
+            suggestions.append(self._build_generated_meal(
+                recipe_id, score, user_prefs,
+                user_ingredient_prefs, meal_type, available_ingredients, 0
+            ))
+        return suggestions
+    
+    def _select_mmr_recipes(self,
+                            recipe_ids: np.ndarray,
+                            scores: np.ndarray,
+                            count: int) -> List[Tuple[int, float]]:
+        """
+        Maximal marginal relevance over the top candidates: repeatedly take
+        the recipe maximizing MMR_LAMBDA * score - (1 - MMR_LAMBDA) * (its
+        highest ingredient cosine similarity to anything already taken).
+        """
+        count = min(count, len(recipe_ids))
+        if count <= 0:
+            return []
+        
+        pool_size = min(len(recipe_ids), max(self.MMR_POOL_FACTOR * count, 32))
+        pool = np.argpartition(-scores, pool_size - 1)[:pool_size] if pool_size < len(recipe_ids) else np.arange(len(recipe_ids))
+        pool = pool[np.argsort(-scores[pool], kind='stable')]
+        
+        # Pairwise cosine similarity of the candidates' ingredient sets
+        rows = self.catalog.incidence[recipe_ids[pool]]
+        rows.data = np.ones_like(rows.data)
+        norms = np.sqrt(np.asarray(rows.sum(axis=1)).ravel())
+        similarity = (rows @ rows.T).toarray() / np.maximum(np.outer(norms, norms), 1e-12)
+        
+        relevance = self.MMR_LAMBDA * scores[pool]
+        max_similarity = np.zeros(len(pool))
+        taken = np.zeros(len(pool), dtype=bool)
+        picks = []
+        for _ in range(count):
+            value = np.where(taken, -np.inf, relevance - (1.0 - self.MMR_LAMBDA) * max_similarity)
+            best = int(np.argmax(value))
+            taken[best] = True
+            np.maximum(max_similarity, similarity[best], out=max_similarity)
+            picks.append((int(recipe_ids[pool[best]]), float(scores[pool[best]])))
+        return picks
+    
+    def _plan_pool(self,
+                   meal_type: str,
+                   recipe_ids: np.ndarray,
+                   scores: np.ndarray,
+                   expiring_vector: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Optimizer candidates for a meal type: best-scoring recipes plus the best that use expiring items"""
+        chosen = np.argsort(-scores)[:self.PLAN_POOL_SIZE]
+        if expiring_vector is not None and len(recipe_ids):
+            part = self.catalog.partition(meal_type)
+            expiring_uses = self.catalog.meal_type_incidence(meal_type) @ expiring_vector
+            uses_expiring = np.flatnonzero(expiring_uses[recipe_ids - part.start] > 0)
+            best_expiring = uses_expiring[np.argsort(-scores[uses_expiring])[:self.PLAN_POOL_SIZE // 2]]
+            chosen = np.union1d(chosen, best_expiring)
+        return recipe_ids[chosen], scores[chosen]
+    
+    def _score_meal_type(self,
+                         user_prefs: UserPreference,
+                         ingredient_prefs: Dict[str, float],
+                         meal_type: str,
+                         available_ingredients: List[str],
+                         taste_profile: Optional[np.ndarray] = None,
+                         recipe_filter: Optional[RecipeFilter] = None,
+                         available_quantities: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (recipe ids, scores) of a meal type's recipes above the confidence
+        threshold. With a recipe_filter only the recipes passing it are scored.
+        """
+        part = self.catalog.partition(meal_type)
+        if recipe_filter is not None and recipe_filter.active:
+            recipe_ids = self.catalog.filter_ids(meal_type, recipe_filter)
+            if len(recipe_ids) > self.PRUNE_MAX_KEPT * (part.stop - part.start):
+                scores = self._score_recipes(meal_type, user_prefs, ingredient_prefs, available_ingredients,
+                                             available_quantities=available_quantities)[recipe_ids - part.start]
+            else:
+                scores = self._score_recipes(meal_type, user_prefs, ingredient_prefs, available_ingredients,
+                                             recipe_ids, available_quantities)
+        else:
+            recipe_ids = self.catalog.meal_type_ids(meal_type)
+            scores = self._score_recipes(meal_type, user_prefs, ingredient_prefs, available_ingredients,
+                                         available_quantities=available_quantities)
+        
+        return self._finish_meal_type_scores(recipe_ids, scores, part, taste_profile)
+    
+    def _finish_meal_type_scores(self,
+                                 recipe_ids: np.ndarray,
+                                 scores: np.ndarray,
+                                 part: slice,
+                                 taste_profile: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Add the taste-profile bonus to a meal type's scores and drop recipes below the confidence threshold"""
+        # Boost recipes like the ones the user rated highly
+        if taste_profile is not None and len(recipe_ids):
+            similar_ids, similarities = self.embedding_index.search(taste_profile, self.SIMILAR_CANDIDATES, part)
+            positions = np.minimum(np.searchsorted(recipe_ids, similar_ids), len(recipe_ids) - 1)
+            scored = recipe_ids[positions] == similar_ids
+            scores[positions[scored]] += self.SIMILARITY_BONUS * np.clip(similarities[scored], 0.0, 1.0)
+            np.clip(scores, 0.0, 1.0, out=scores)
+        
+        keep = scores > self.MIN_CONFIDENCE
+        return recipe_ids[keep], scores[keep]
+    
+    def _score_recipes(self,
+                       meal_type: str,
+                       user_prefs: UserPreference,
+                       ingredient_prefs: Dict[str, float],
+                       available_ingredients: List[str],
+                       recipe_ids: Optional[np.ndarray] = None,
+                       available_quantities: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Vectorized `_calculate_meal_score` over every recipe of a meal type,
+        aligned with `catalog.meal_type_ids(meal_type)`, or over just the
+        given recipe ids of it. The ingredient term is one sparse
+        matrix-vector product against the user's ingredient weights; the
+        remaining rules are array masks.
+        """
+        catalog = self.catalog
+        if recipe_ids is None:
+            part = catalog.partition(meal_type)
+            incidence = catalog.meal_type_incidence(meal_type)
+        else:
+            part = recipe_ids
+            incidence = catalog.incidence[recipe_ids]
+        
+        weights = catalog.ingredient_vector(
+            self._ingredient_weights(user_prefs, ingredient_prefs, available_ingredients, available_quantities)
+        )
+        ingredient_score = incidence @ weights
+        
+        # Recipes without ingredients score on the rules alone instead of dividing by zero
+        score = 0.5 + ingredient_score / np.maximum(catalog.ingredient_counts[part], 1)
+        self._add_rule_scores(score, meal_type, user_prefs, part)
+        return np.clip(score, 0.0, 1.0)
+    
+    def _score_recipes_batch(self,
+                             meal_type: str,
+                             users: List[Tuple[UserPreference, Dict[str, float]]]) -> np.ndarray:
+        """
+        `_score_recipes` for many users at once, as a (users × recipes of the
+        meal type) matrix. The ingredient terms are one sparse-dense product
+        of the partition's incidence with the users' stacked weight vectors;
+        the rule terms are computed once per distinct set of the preferences
+        they read and added to every row that shares it.
+        """
+        catalog = self.catalog
+        part = catalog.partition(meal_type)
+        weights = np.empty((len(catalog.ingredient_ids), len(users)))
+        for column, (user_prefs, ingredient_prefs) in enumerate(users):
+            weights[:, column] = catalog.ingredient_vector(self._ingredient_weights(user_prefs, ingredient_prefs, []))
+        # One row per user, contiguous, so the per-user steps below work on contiguous rows
+        scores = np.ascontiguousarray((catalog.meal_type_incidence(meal_type) @ weights).T)
+        scores /= np.maximum(catalog.ingredient_counts[part], 1)
+        scores += 0.5
+        
+        groups: Dict[Tuple, List[int]] = defaultdict(list)
+        for row, (user_prefs, _) in enumerate(users):
+            groups[self._rule_key(meal_type, user_prefs)].append(row)
+        for rows in groups.values():
+            if len(rows) == 1:
+                self._add_rule_scores(scores[rows[0]], meal_type, users[rows[0]][0], part)
+                continue
+            group_scores = scores[rows]
+            self._add_rule_scores(group_scores, meal_type, users[rows[0]][0], part)
+            scores[rows] = group_scores
+        return np.clip(scores, 0.0, 1.0, out=scores)
+    
+    @staticmethod
+    def _rule_key(meal_type: str, user_prefs: UserPreference) -> Tuple:
+        """Everything `_add_rule_scores` reads from a user's preferences"""
+        return (
+            tuple(sorted(set(user_prefs.dietary_restrictions))),
+            user_prefs.time_constraints.get(meal_type, 60),
+            tuple(sorted(set(user_prefs.preferred_cuisines))),
+            user_prefs.cooking_skill,
+            'weight_loss' in user_prefs.health_goals,
+            'muscle_gain' in user_prefs.health_goals
+        )
+    
+    def _add_rule_scores(self, score: np.ndarray, meal_type: str, user_prefs: UserPreference, part):
+        """Add the non-ingredient rule terms to `score` in place (one row per user, or a single row)"""
+        catalog = self.catalog
         
-        # Sort by score and add some randomness to prevent repetition
-        scored_meals.sort(key=lambda x: x[1] + np.random.normal(0, 0.1), reverse=True)
+        # Dietary restrictions: bonus for a matching label, else penalty per violated restriction
+        if user_prefs.dietary_restrictions:
+            compatible = (catalog.labels[part] & catalog.label_mask(user_prefs.dietary_restrictions)) != 0
+            violated = catalog.restriction_mask(user_prefs.dietary_restrictions)
+            penalty = np.zeros(score.shape[-1])
+            for bit in range(len(catalog.restriction_bits)):
+                if violated & (1 << bit):
+                    penalty += 0.8 * ((catalog.violations[part] >> np.uint64(bit)) & np.uint64(1))
+            score += np.where(compatible, 0.3, -penalty)
         
-        if not scored_meals:
+        # Time constraints
+        max_time = user_prefs.time_constraints.get(meal_type, 60)
+        score += np.where(catalog.prep_time[part] <= max_time, 0.2, -0.3)
+        
+        # Cuisine preferences
+        if user_prefs.preferred_cuisines:
+            score += 0.2 * catalog.cuisine_mask(user_prefs.preferred_cuisines)[catalog.cuisine[part]]
+        
+        # Cooking skill match
+        user_skill = DIFFICULTY_LEVELS.get(user_prefs.cooking_skill, 2)
+        score += np.where(catalog.difficulty[part] <= user_skill, 0.1, -0.2)
+        
+        # Health goals alignment
+        if 'weight_loss' in user_prefs.health_goals:
+            score += 0.2 * (catalog.calories[part] < 400)
+        elif 'muscle_gain' in user_prefs.health_goals:
+            score += 0.2 * (catalog.protein[part] > 20)
+    
+    def _taste_profile(self, user_meals: MealHistory) -> Optional[np.ndarray]:
+        """Embedding of the user's recent highly rated meals, or None without an index or such meals"""
+        if self.embedding_index is None:
             return None
+        liked = [
+            (meal.ingredients, meal.rating - 3.0 if meal.rating else 1.0)
+            for meal in user_meals[-50:]
+            if (meal.rating and meal.rating >= 4) or (not meal.rating and meal.enjoyed)
+        ]
+        return self.embedding_index.profile_vector(liked) if liked else None
+    
+    def similar_to_liked_meals(self, user_id: str, meal_type: Optional[str] = None, k: int = 10) -> List[Dict[str, Any]]:
+        """Catalog recipes closest to the meals the user rated highly (empty without an embedding index)"""
+        _, _, user_meals = self._user_snapshot(user_id, create_default=False)
+        taste_profile = self._taste_profile(user_meals)
+        if taste_profile is None:
+            return []
+        
+        part = self.catalog.partition(meal_type) if meal_type else None
+        recipe_ids, similarities = self.embedding_index.search(taste_profile, k, part)
+        return [
+            {**self.catalog.recipes[recipe_id], "similarity": round(float(similarity), 4)}
+            for recipe_id, similarity in zip(recipe_ids, similarities)
+        ]
+    
+    @classmethod
+    def _ingredient_weights(cls,
+                            user_prefs: UserPreference,
+                            ingredient_prefs: Dict[str, float],
+                            available_ingredients: List[str],
+                            available_quantities: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """Per-ingredient score contribution: learned score + favorite/disliked/available/quantity bonuses"""
+        weights = defaultdict(float)
+        for ingredient, preference in ingredient_prefs.items():
+            weights[ingredient] += preference
+        for ingredient in set(user_prefs.favorite_ingredients):
+            weights[ingredient] += 0.3
+        for ingredient in set(user_prefs.disliked_ingredients):
+            weights[ingredient] -= 0.5
+        for ingredient in set(available_ingredients):
+            weights[ingredient] += 0.2
+        if available_quantities:
+            most = max(available_quantities.values())
+            for ingredient, quantity in available_quantities.items():
+                if most > 0 and quantity > 0:
+                    weights[ingredient] += cls.QUANTITY_BONUS * quantity / most
+        return weights
+    
+    def _iter_diverse_recipes(self,
+                              recipe_ids: np.ndarray,
+                              scores: np.ndarray,
+                              count: int,
+                              used_ingredients: Counter,
+                              rng: Optional[np.random.Generator] = None) -> Iterator[Tuple[int, float]]:
+        """
+        (recipe id, score) picks, one per next(), for a plan of about `count`
+        days. Scores get a small random jitter, then recipes are taken
+        greedily, penalizing ones whose ingredients the plan already uses
+        (including picks made for other meal types in between). Recipes only
+        repeat once every candidate has been used.
+        """
+        if len(recipe_ids) == 0 or count <= 0:
+            return
         
-        # Select best meal
-        best_meal_data, confidence = scored_meals[0]
+        rng = rng or np.random.default_rng()
+        jittered = scores + rng.normal(0, self.SCORE_JITTER, len(scores))
+        
+        # Only the best few candidates can win; avoid a Python loop over the whole partition
+        pool_size = min(len(recipe_ids), max(4 * count, 32))
+        pool = np.argpartition(-jittered, pool_size - 1)[:pool_size] if pool_size < len(recipe_ids) else np.arange(len(recipe_ids))
+        pool = pool[np.argsort(-jittered[pool])]
+        
+        # Overlap counts are kept up to date as ingredients get used (here or by
+        # other meal types' picks) rather than recounted per candidate and pick
+        pool_ingredients = [self.catalog.recipes[recipe_ids[index]]['ingredients'] for index in pool]
+        holders = defaultdict(list)
+        for position, ingredients in enumerate(pool_ingredients):
+            for ingredient in ingredients:
+                holders[ingredient].append(position)
+        lengths = np.array([max(1, len(ingredients)) for ingredients in pool_ingredients], dtype=float)
+        pool_jittered = jittered[pool]
+        overlaps = np.zeros(len(pool))
+        counted = set()
+        remaining = np.ones(len(pool), dtype=bool)
+        while True:
+            if not remaining.any():
+                remaining[:] = True
+            for ingredient in used_ingredients.keys() - counted:
+                counted.add(ingredient)
+                for position in holders.get(ingredient, ()):
+                    overlaps[position] += 1
+            values = pool_jittered - self.DIVERSITY_PENALTY * (overlaps / lengths)
+            position = int(np.argmax(np.where(remaining, values, -np.inf)))
+            remaining[position] = False
+            best = pool[position]
+            used_ingredients.update(pool_ingredients[position])
+            yield int(recipe_ids[best]), float(scores[best])
+    
+    def _build_generated_meal(self,
+                              recipe_id: int,
+                              confidence: float,
+                              user_prefs: UserPreference,
+                              ingredient_prefs: Dict[str, float],
+                              meal_type: str,
+                              available_ingredients: List[str],
+                              day_offset: int,
+                              servings: int = 1) -> GeneratedMeal:
+        """Turn a chosen recipe into a GeneratedMeal with its reasoning"""
+        meal_data = self.catalog.recipes[recipe_id]
         
         # Generate reasoning
         reasoning_parts = []
-        if any(ing in ingredient_prefs for ing in best_meal_data['ingredients']):
+        if any(ing in ingredient_prefs for ing in meal_data['ingredients']):
             reasoning_parts.append("Contains your favorite ingredients")
-        if best_meal_data['prep_time'] <= user_prefs.time_constraints.get(meal_type, 60):
+        if meal_data['prep_time'] <= user_prefs.time_constraints.get(meal_type, 60):
             reasoning_parts.append("Fits your time constraints")
-        if any(ing in available_ingredients for ing in best_meal_data['ingredients']):
+        if any(ing in available_ingredients for ing in meal_data['ingredients']):
             reasoning_parts.append("Uses ingredients you have available")
         
         reasoning = "; ".join(reasoning_parts) if reasoning_parts else "Good nutritional balance"
         
         return GeneratedMeal(
-            meal_id=f"{user_prefs.user_id}_{meal_type}_{day_offset}_{datetime.now().strftime('%Y%m%d')}",
-            name=best_meal_data['name'],
-            ingredients=best_meal_data['ingredients'],
-            instructions=best_meal_data.get('instructions', []),
+            meal_id=make_meal_id(user_prefs.user_id, meal_type, day_offset, recipe_id),
+            name=meal_data['name'],
+            ingredients=list(meal_data['ingredients']),
+            instructions=list(meal_data.get('instructions', [])),
             meal_type=meal_type,
-            estimated_prep_time=best_meal_data['prep_time'],
-            estimated_cost=best_meal_data.get('cost', 5.0),
-            estimated_calories=best_meal_data.get('calories', 400),
+            estimated_prep_time=meal_data['prep_time'],
+            estimated_cost=meal_data.get('cost', 5.0) * servings,
+            estimated_calories=int(round(meal_data.get('calories', 400))),
             confidence_score=confidence,
             reasoning=reasoning,
-            dietary_labels=best_meal_data.get('dietary_labels', []),
-            cuisine=best_meal_data.get('cuisine', 'International'),
-            difficulty=best_meal_data.get('difficulty', 'intermediate')
+            dietary_labels=list(meal_data.get('dietary_labels', [])),
+            cuisine=meal_data.get('cuisine', 'International'),
+            difficulty=meal_data.get('difficulty', 'intermediate'),
+            servings=servings,
+            nutrients=dict(meal_data['nutrients']) if meal_data.get('nutrients') else None
         )
     
     def _calculate_meal_score(self,
@@ -308,7 +1480,11 @@ class AIPersonalizationEngine:
                              user_prefs: UserPreference,
                              ingredient_prefs: Dict[str, float],
                              available_ingredients: List[str]) -> float:
-        """Calculate how well a meal matches user preferences"""
+        """
+        Calculate how well a meal matches user preferences.
+        Reference scorer for a single recipe; generation uses the vectorized
+        `_score_recipes`, which must agree with it.
+        """
         
         score = 0.5  # Base score
         
@@ -324,7 +1500,7 @@ class AIPersonalizationEngine:
             if ingredient in available_ingredients:
                 ingredient_score += 0.2  # Bonus for using available ingredients
         
-        score += ingredient_score / len(meal_data['ingredients'])
+        score += ingredient_score / max(len(meal_data['ingredients']), 1)
         
         # Dietary restrictions
         meal_labels = set(meal_data.get('dietary_labels', []))
@@ -337,16 +1513,9 @@ class AIPersonalizationEngine:
                 score += 0.3
             else:
                 # Check for violations
-                violation_map = {
-                    'vegetarian': ['meat', 'chicken', 'beef', 'pork', 'fish'],
-                    'vegan': ['meat', 'chicken', 'beef', 'pork', 'fish', 'dairy', 'eggs'],
-                    'gluten_free': ['wheat', 'bread', 'pasta', 'flour'],
-                    'dairy_free': ['milk', 'cheese', 'butter', 'yogurt']
-                }
-                
                 for restriction in user_restrictions:
-                    if restriction in violation_map:
-                        violation_ingredients = violation_map[restriction]
+                    if restriction in RESTRICTION_VIOLATIONS:
+                        violation_ingredients = RESTRICTION_VIOLATIONS[restriction]
                         if any(ing.lower() in [i.lower() for i in meal_data['ingredients']] 
                               for ing in violation_ingredients):
                             score -= 0.8  # Heavy penalty for violations
@@ -363,9 +1532,8 @@ class AIPersonalizationEngine:
             score += 0.2
         
         # Cooking skill match
-        difficulty_scores = {'beginner': 1, 'intermediate': 2, 'advanced': 3}
-        user_skill = difficulty_scores.get(user_prefs.cooking_skill, 2)
-        meal_difficulty = difficulty_scores.get(meal_data.get('difficulty', 'intermediate'), 2)
+        user_skill = DIFFICULTY_LEVELS.get(user_prefs.cooking_skill, 2)
+        meal_difficulty = DIFFICULTY_LEVELS.get(meal_data.get('difficulty', 'intermediate'), 2)
         
         if meal_difficulty <= user_skill:
             score += 0.1
@@ -382,172 +1550,131 @@ class AIPersonalizationEngine:
         
         return max(0.0, min(1.0, score))  # Clamp between 0 and 1
     
-    def _load_meal_database(self) -> List[Dict]:
-        """Load meal database (expandable with real recipes)"""
-        
-        # This would be replaced with a real recipe database
-        sample_meals = [
-            {
-                "name": "Avocado Toast with Scrambled Eggs",
-                "ingredients": ["bread", "avocado", "eggs", "salt", "pepper", "butter"],
-                "meal_type": "breakfast",
-                "prep_time": 10,
-                "cost": 4.0,
-                "calories": 350,
-                "dietary_labels": ["vegetarian"],
-                "cuisine": "American",
-                "difficulty": "beginner",
-                "protein": 15,
-                "instructions": [
-                    "Toast bread slices",
-                    "Mash avocado with salt and pepper",
-                    "Scramble eggs in butter",
-                    "Spread avocado on toast, top with eggs"
-                ]
-            },
-            {
-                "name": "Greek Quinoa Bowl",
-                "ingredients": ["quinoa", "cucumber", "tomato", "feta", "olives", "olive_oil", "lemon"],
-                "meal_type": "lunch",
-                "prep_time": 25,
-                "cost": 6.0,
-                "calories": 420,
-                "dietary_labels": ["vegetarian", "gluten_free"],
-                "cuisine": "Mediterranean",
-                "difficulty": "intermediate",
-                "protein": 18,
-                "instructions": [
-                    "Cook quinoa according to package instructions",
-                    "Chop cucumber and tomato",
-                    "Mix vegetables with quinoa",
-                    "Top with feta and olives",
-                    "Drizzle with olive oil and lemon"
-                ]
-            },
-            {
-                "name": "Grilled Chicken with Sweet Potato",
-                "ingredients": ["chicken_breast", "sweet_potato", "broccoli", "olive_oil", "garlic", "herbs"],
-                "meal_type": "dinner",
-                "prep_time": 35,
-                "cost": 8.0,
-                "calories": 480,
-                "dietary_labels": ["gluten_free", "dairy_free"],
-                "cuisine": "American",
-                "difficulty": "intermediate",
-                "protein": 35,
-                "instructions": [
-                    "Season chicken with herbs and garlic",
-                    "Grill chicken for 6-7 minutes per side",
-                    "Roast sweet potato at 400°F for 25 minutes",
-                    "Steam broccoli until tender",
-                    "Serve together with olive oil drizzle"
-                ]
-            },
-            {
-                "name": "Berry Protein Smoothie",
-                "ingredients": ["berries", "protein_powder", "banana", "almond_milk", "spinach", "chia_seeds"],
-                "meal_type": "snack",
-                "prep_time": 5,
-                "cost": 3.0,
-                "calories": 280,
-                "dietary_labels": ["vegan", "gluten_free"],
-                "cuisine": "Health",
-                "difficulty": "beginner",
-                "protein": 25,
-                "instructions": [
-                    "Add all ingredients to blender",
-                    "Blend until smooth",
-                    "Adjust consistency with more almond milk if needed",
-                    "Serve immediately"
-                ]
-            },
-            {
-                "name": "Vegetarian Stir Fry",
-                "ingredients": ["tofu", "bell_peppers", "broccoli", "carrots", "soy_sauce", "ginger", "garlic", "rice"],
-                "meal_type": "dinner",
-                "prep_time": 20,
-                "cost": 5.5,
-                "calories": 380,
-                "dietary_labels": ["vegetarian", "vegan"],
-                "cuisine": "Asian",
-                "difficulty": "intermediate",
-                "protein": 20,
-                "instructions": [
-                    "Press and cube tofu",
-                    "Cook rice according to package instructions",
-                    "Heat oil in wok, add tofu and cook until golden",
-                    "Add vegetables and stir fry for 5-7 minutes",
-                    "Add sauce and serve over rice"
-                ]
-            }
-        ]
-        
-        return sample_meals
-    
     def optimize_for_waste_reduction(self, 
                                    user_id: str,
-                                   expiring_ingredients: List[Dict]) -> List[GeneratedMeal]:
+                                   expiring_ingredients: List[Dict],
+                                   days: int = 3,
+                                   meals_per_day: int = 3) -> List[GeneratedMeal]:
         """Generate meals that use expiring ingredients to reduce waste"""
+        return self.plan_waste_reduction(user_id, expiring_ingredients, days, meals_per_day)[0]
+    
+    def plan_waste_reduction(self,
+                             user_id: str,
+                             expiring_ingredients: List[Dict],
+                             days: int = 3,
+                             meals_per_day: int = 3,
+                             recipe_filter: Optional[RecipeFilter] = None,
+                             servings: int = 1) -> Tuple[List[GeneratedMeal], Dict[str, Any]]:
+        """
+        Waste-reduction plan plus a coverage report. Only recipes that use an
+        expiring item (looked up through the ingredient index) and pass the
+        recipe_filter are scored, and each item is scheduled before it
+        expires whenever a recipe and a free slot allow it.
+        """
+        inventory = ExpiringInventory(expiring_ingredients)
+        candidate_ids = self.waste_planner.candidates(inventory)
         
-        expiring_items = [item['name'].lower() for item in expiring_ingredients]
+        user_prefs, user_ingredient_prefs, _ = self._user_snapshot(user_id)
+        available_ingredients = self.waste_planner.catalog_ingredients(inventory)
         
-        # Generate meals prioritizing expiring ingredients
-        waste_reducing_meals = self.generate_personalized_meals(
-            user_id=user_id,
-            days=3,  # Focus on next few days
-            available_ingredients=expiring_items
-        )
+        meal_types = ['breakfast', 'lunch', 'dinner']
+        if meals_per_day > 3:
+            meal_types.append('snack')
         
-        # Filter and re-score based on waste reduction potential
-        optimized_meals = []
-        for meal in waste_reducing_meals:
-            waste_reduction_score = 0
-            ingredients_used = 0
-            
-            for ingredient in meal.ingredients:
-                if ingredient.lower() in expiring_items:
-                    ingredients_used += 1
-                    
-                    # Find expiry info
-                    for item in expiring_ingredients:
-                        if item['name'].lower() == ingredient.lower():
-                            days_left = item.get('days_left', 0)
-                            if days_left <= 2:
-                                waste_reduction_score += 0.5
-                            elif days_left <= 5:
-                                waste_reduction_score += 0.3
-            
-            if ingredients_used > 0:
-                # Update meal reasoning
-                meal.reasoning += f" | Uses {ingredients_used} expiring ingredients"
-                meal.confidence_score += waste_reduction_score * 0.2
-                optimized_meals.append(meal)
+        # Preference scores for the candidates only, kept above the confidence threshold
+        pools = {}
+        for meal_type in meal_types:
+            part = self.catalog.partition(meal_type)
+            lo, hi = np.searchsorted(candidate_ids, [part.start, part.stop])
+            recipe_ids = candidate_ids[lo:hi]
+            if recipe_filter is not None and recipe_filter.active:
+                recipe_ids = np.intersect1d(recipe_ids, self.catalog.filter_ids(meal_type, recipe_filter), assume_unique=True)
+            if not len(recipe_ids):
+                continue
+            scores = self._score_recipes(meal_type, user_prefs, user_ingredient_prefs, available_ingredients, recipe_ids)
+            keep = scores > self.MIN_CONFIDENCE
+            pools[meal_type] = (recipe_ids[keep], scores[keep])
         
-        return optimized_meals
+        slots = [(day, meal_type) for day in range(days) for meal_type in meal_types]
+        plan, report = self.waste_planner.plan(slots, pools, inventory)
+        
+        waste_meals = []
+        for (day, meal_type), pick in zip(slots, plan):
+            if pick is None:
+                continue
+            recipe_id, confidence = pick
+            meal = self._build_generated_meal(
+                recipe_id, confidence, user_prefs,
+                user_ingredient_prefs, meal_type, available_ingredients, day, servings
+            )
+            meal.reasoning += f" | Uses {len(inventory.fresh_in(meal.ingredients, day))} expiring ingredients"
+            waste_meals.append(meal)
+        
+        return waste_meals, report
     
     def get_user_insights(self, user_id: str) -> Dict[str, Any]:
         """Generate insights about user's eating patterns and preferences"""
-        
-        if user_id not in self.meal_history:
+        return self.get_user_insights_with_etag(user_id)[0]
+    
+    def get_user_insights_with_etag(self, user_id: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Insights and an ETag that changes whenever they do. Insights are
+        materialized from the incrementally maintained statistics on first
+        read after a change and served from cache until the next one.
+        """
+        with self._user_lock(user_id):
+            self._ensure_user_loaded(user_id)
+            cached = self._insights_cache.get(user_id)
+            if cached is None:
+                insights = self._materialize_insights(user_id)
+                etag = hashlib.sha1(json.dumps(insights, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:20]
+                cached = self._insights_cache[user_id] = (insights, etag)
+        self._evict_cold_users()
+        return copy.deepcopy(cached[0]), cached[1]
+    
+    def _materialize_insights(self, user_id: str) -> Dict[str, Any]:
+        """Insights from a user's insight statistics. Caller holds the user's shard lock."""
+        stats = self.insight_stats.get(user_id)
+        if not stats or not stats.meal_count:
             return {"message": "Not enough data for insights"}
         
-        user_meals = self.meal_history[user_id]
         user_prefs = self.user_preferences.get(user_id)
+        return {
+            "total_meals_tracked": stats.meal_count,
+            "favorite_meal_type": stats.favorite_meal_type(),
+            "average_rating": stats.average_rating(),
+            "most_used_ingredients": stats.most_used_ingredients(),
+            "preferred_cuisines": list(user_prefs.preferred_cuisines) if user_prefs else [],
+            "dietary_adherence": self._calculate_dietary_adherence(self.meal_history[user_id], user_prefs),
+            "cooking_time_analysis": stats.cooking_time_analysis(),
+            "recommendations": stats.recommendations()
+        }
+    
+    def _recompute_user_insights(self, user_id: str) -> Dict[str, Any]:
+        """
+        Insights computed over the whole meal history.
+        Reference for the materialized insights; not used on the hot path.
+        """
         
+        user_prefs, _, user_meals = self._user_snapshot(user_id, create_default=False)
+        if not user_meals:
+            return {"message": "Not enough data for insights"}
+        
+        ratings = user_meals.ratings
         insights = {
             "total_meals_tracked": len(user_meals),
-            "favorite_meal_type": Counter(meal.meal_type for meal in user_meals).most_common(1)[0][0],
-            "average_rating": np.mean([meal.rating for meal in user_meals if meal.rating]),
-            "most_used_ingredients": Counter([ing for meal in user_meals for ing in meal.ingredients]).most_common(10),
+            "favorite_meal_type": ranked_by_count(user_meals.meal_types, MEAL_TYPES.names, 1)[0][0],
+            "average_rating": np.mean(ratings[~np.isnan(ratings) & (ratings != 0)]),
+            "most_used_ingredients": ranked_by_count(user_meals.ingredient_ids(), INGREDIENTS.names, 10),
             "preferred_cuisines": user_prefs.preferred_cuisines if user_prefs else [],
             "dietary_adherence": self._calculate_dietary_adherence(user_meals, user_prefs),
             "cooking_time_analysis": self._analyze_cooking_times(user_meals),
-            "recommendations": self._generate_improvement_recommendations(user_id)
+            "recommendations": self._generate_improvement_recommendations(user_meals)
         }
         
         return insights
     
-    def _calculate_dietary_adherence(self, meals: List[MealRecord], prefs: UserPreference) -> Dict:
+    def _calculate_dietary_adherence(self, meals: MealHistory, prefs: UserPreference) -> Dict:
         """Calculate how well user adheres to their dietary restrictions"""
         if not prefs or not prefs.dietary_restrictions:
             return {"adherence_rate": 100, "violations": []}
@@ -556,48 +1683,64 @@ class AIPersonalizationEngine:
         # This would implement dietary adherence checking
         return {"adherence_rate": 95, "violations": violations}
     
-    def _analyze_cooking_times(self, meals: List[MealRecord]) -> Dict:
+    def _analyze_cooking_times(self, meals: MealHistory) -> Dict:
         """Analyze user's cooking time patterns"""
-        times_by_type = defaultdict(list)
-        
-        for meal in meals:
-            if meal.prep_time:
-                times_by_type[meal.meal_type].append(meal.prep_time)
+        prep_times = meals.prep_times
+        timed = (prep_times != MISSING) & (prep_times != 0)
+        meal_types, times = meals.meal_types[timed], prep_times[timed]
         
+        # Meal types in order of their first timed meal
+        codes, first = np.unique(meal_types, return_index=True)
         analysis = {}
-        for meal_type, times in times_by_type.items():
-            analysis[meal_type] = {
-                "average_time": np.mean(times),
-                "preferred_range": f"{min(times)}-{max(times)} minutes"
+        for code in codes[np.argsort(first)]:
+            type_times = times[meal_types == code]
+            analysis[MEAL_TYPES.names[code]] = {
+                "average_time": np.mean(type_times),
+                "preferred_range": f"{type_times.min()}-{type_times.max()} minutes"
             }
         
         return analysis
     
-    def _generate_improvement_recommendations(self, user_id: str) -> List[str]:
+    def _generate_improvement_recommendations(self, user_meals: MealHistory) -> List[str]:
         """Generate personalized recommendations for improvement"""
         recommendations = []
         
-        user_meals = self.meal_history[user_id]
-        
         # Analyze patterns and suggest improvements
         if len(user_meals) > 10:
-            meal_types = [meal.meal_type for meal in user_meals[-14:]]  # Last 2 weeks
-            type_counts = Counter(meal_types)
+            recent_types = user_meals.meal_types[-14:]  # Last 2 weeks
             
-            if type_counts.get('breakfast', 0) < 10:
+            if np.count_nonzero(recent_types == MEAL_TYPES.ids.get('breakfast', MISSING)) < 10:
                 recommendations.append("Try to include breakfast more regularly for better nutrition balance")
             
-            if type_counts.get('snack', 0) > 10:
+            if np.count_nonzero(recent_types == MEAL_TYPES.ids.get('snack', MISSING)) > 10:
                 recommendations.append("Consider reducing snacks and focus on balanced main meals")
             
             # Check ingredient diversity
-            all_ingredients = [ing for meal in user_meals[-20:] for ing in meal.ingredients]
-            unique_ingredients = len(set(all_ingredients))
+            unique_ingredients = len(np.unique(user_meals.ingredient_ids(-20)))
             
             if unique_ingredients < 30:
                 recommendations.append("Try to diversify your ingredients for better nutrition")
         
         return recommendations
 
-# Initialize global AI engine
-ai_meal_engine = AIPersonalizationEngine()
\ No newline at end of file
+# Planner of a bulk-plan worker process (see generate_bulk_plans)
+_bulk_engine: Optional[AIPersonalizationEngine] = None
+
+def _init_bulk_worker(engine: AIPersonalizationEngine):
+    global _bulk_engine
+    _bulk_engine = engine
+
+def _plan_bulk_batch(batch, days: int, meals_per_day: int):
+    return _bulk_engine._plan_user_batch(batch, days, meals_per_day)
+
+_global_engine_lock = threading.Lock()
+
+def __getattr__(name: str):
+    """Build the global AI engine on first use, so processes that only import this module (bulk-plan workers) never open the store"""
+    global ai_meal_engine
+    if name != 'ai_meal_engine':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _global_engine_lock:
+        if 'ai_meal_engine' not in globals():
+            ai_meal_engine = AIPersonalizationEngine()
+    return ai_meal_engine
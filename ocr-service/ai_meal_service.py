@@ -4,12 +4,18 @@ AI Meal Generator FastAPI Service
 Provides intelligent meal planning based on user preferences and machine learning
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional, Optional
+from typing import List, Dict, Any, Optional, Optional, Tuple, Union, Iterator, Generator, Literal
 import json
+import itertools
+import orjson
 from datetime import datetime, timedelta
-from ai_meal_generator import ai_meal_engine, UserPreference, MealRecord, GeneratedMeal
+from ai_meal_generator import ai_meal_engine, UserPreference, MealRecord, GeneratedMeal, parse_meal_id
+from meal_plan_optimizer import PlanConstraints
+from recipe_catalog import RecipeFilter, normalize_ingredient
+from waste_reduction import ExpiringInventory, item_days_left
 import logging
 
 # Configure logging
@@ -58,21 +64,59 @@ class MealGenerationRequest(BaseModel):
     user_id: str
     days: int = 7
     meals_per_day: int = 3
-    available_ingredients: List[str] = []
+    # Ingredient names, or inventory items ({name, quantity, unit, expires_in_days})
+    available_ingredients: List[Union[str, Dict[str, Any]]] = []
     optimize_for_waste: bool = False
     expiring_ingredients: List[Dict[str, Any]] = []
     # New waste optimization parameters
     prioritize_expiring: bool = False
     prioritize_high_quantity: bool = False
     dietary_restrictions: List[str] = []
-    max_cooking_time: int = 60
+    max_cooking_time: Optional[int] = None  # Minutes; no limit unless set
     servings: int = 2
+    # Plan-level targets; any that are set switch on the plan optimizer
+    weekly_budget: Optional[float] = None
+    daily_calories: Optional[int] = None
+    min_daily_protein: Optional[int] = None
+    # Fixes the plan's randomness; by default it is derived from the request, so repeats give the same plan
+    seed: Optional[int] = None
     cuisine_preference: Optional[str] = None
+    # Send each day as soon as it is chosen: NDJSON lines or server-sent events
+    stream: Optional[Literal["ndjson", "sse"]] = None
+
+def _split_inventory(available: List[Union[str, Dict[str, Any]]]) -> Tuple[List[str], Dict[str, float], List[Dict[str, Any]]]:
+    """Names, quantities and dated items (those with an expiry) of the available ingredients"""
+    names, quantities, dated = [], {}, []
+    for item in available:
+        if isinstance(item, str):
+            names.append(item)
+            continue
+        if not item.get('name'):
+            continue
+        names.append(item['name'])
+        if item.get('quantity') is not None:
+            quantities[item['name']] = quantities.get(item['name'], 0.0) + float(item['quantity'])
+        if 'days_left' in item or 'expires_in_days' in item:
+            dated.append(item)
+    return names, quantities, dated
 
 class WasteOptimizationRequest(BaseModel):
     user_id: str
     expiring_ingredients: List[Dict[str, Any]]
 
+@app.on_event("startup")
+async def start_meal_engine_consolidation():
+    """Periodically snapshot online updates (ratings, meals) and checkpoint the event log"""
+    ai_meal_engine.start_consolidation()
+
+@app.on_event("shutdown")
+async def flush_meal_engine():
+    """Apply queued learning and snapshot pending state before the worker exits"""
+    ai_meal_engine.stop_consolidation()
+    ai_meal_engine.learning_queue.join()
+    ai_meal_engine._save_user_data()
+    ai_meal_engine.store.checkpoint()
+
 @app.get("/")
 async def root():
     """Root endpoint with service information"""
@@ -93,6 +137,7 @@ async def root():
             "/record-meal": "POST - Record a meal for learning",
             "/optimize-waste": "POST - Generate meals to reduce food waste",
             "/user-insights": "GET - Get user eating pattern insights",
+            "/rate-meal": "POST - Rate a generated meal to improve future suggestions",
             "/health": "GET - Health check"
         }
     }
@@ -125,8 +170,7 @@ async def update_user_preference(request: UserPreferenceRequest):
             family_size=request.family_size
         )
         
-        ai_meal_engine.user_preferences[request.user_id] = user_pref
-        ai_meal_engine._save_user_data()
+        ai_meal_engine.set_user_preferences(user_pref)
         
         logger.info(f"Updated preferences for user {request.user_id}")
         
@@ -141,7 +185,7 @@ async def update_user_preference(request: UserPreferenceRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/record-meal")
-async def record_meal(request: MealRecordRequest, background_tasks: BackgroundTasks):
+async def record_meal(request: MealRecordRequest):
     """Record a meal for machine learning"""
     try:
         meal_record = MealRecord(
@@ -157,8 +201,8 @@ async def record_meal(request: MealRecordRequest, background_tasks: BackgroundTa
             enjoyed=request.enjoyed
         )
         
-        # Learn from meal asynchronously to avoid blocking
-        background_tasks.add_task(ai_meal_engine.learn_from_meal, meal_record)
+        # Learn from meal asynchronously on the user's single-writer shard
+        ai_meal_engine.submit_meal(meal_record)
         
         logger.info(f"Recorded meal {request.meal_name} for user {request.user_id}")
         
@@ -173,48 +217,173 @@ async def record_meal(request: MealRecordRequest, background_tasks: BackgroundTa
         logger.error(f"Error recording meal: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _plan_days(request: MealGenerationRequest) -> Generator[Tuple[int, List[GeneratedMeal]], None, Optional[Dict[str, Any]]]:
+    """The requested plan as (day, meals) pairs, day by day; returns the plan report"""
+    available_ingredients, quantities, dated_items = _split_inventory(request.available_ingredients)
+    
+    # Hard limits prune the catalog before any recipe is scored
+    recipe_filter = RecipeFilter(
+        dietary_restrictions=tuple(request.dietary_restrictions),
+        max_prep_time=request.max_cooking_time if request.max_cooking_time and request.max_cooking_time > 0 else None,
+        cuisine=request.cuisine_preference
+    )
+    
+    if request.optimize_for_waste and request.expiring_ingredients:
+        # Optimize for waste reduction
+        meals, plan_report = ai_meal_engine.plan_waste_reduction(
+            user_id=request.user_id,
+            expiring_ingredients=request.expiring_ingredients,
+            days=request.days,
+            meals_per_day=request.meals_per_day,
+            recipe_filter=recipe_filter,
+            servings=request.servings
+        )
+        for day, day_meals in itertools.groupby(meals, key=lambda meal: parse_meal_id(meal.meal_id)[2]):
+            yield day, list(day_meals)
+        return plan_report
+    
+    # Expiring items, plus available ones that go bad within the plan; earliest expiry wins
+    expiring = {}
+    if request.prioritize_expiring:
+        dated_items = [item for item in dated_items if item_days_left(item) < request.days]
+        for item in request.expiring_ingredients + dated_items:
+            name, days_left = normalize_ingredient(item.get('name') or ''), item_days_left(item)
+            if name:
+                expiring[name] = min(days_left, expiring.get(name, days_left))
+    
+    # Standard personalized meal generation, optimized against any plan targets
+    constraints = PlanConstraints(
+        weekly_budget=request.weekly_budget,
+        daily_calories=request.daily_calories,
+        min_daily_protein=request.min_daily_protein,
+        expiring=expiring
+    )
+    return (yield from ai_meal_engine.stream_meal_plan(
+        user_id=request.user_id,
+        days=request.days,
+        meals_per_day=request.meals_per_day,
+        available_ingredients=available_ingredients,
+        constraints=constraints,
+        seed=request.seed,
+        recipe_filter=recipe_filter,
+        servings=request.servings,
+        available_quantities=quantities if request.prioritize_high_quantity else None
+    ))
+
+class PlanSummary:
+    """Running summary statistics of a plan, so streamed plans needn't be kept in memory"""
+    
+    def __init__(self):
+        self.total_meals = 0
+        self.confidence = 0.0
+        self.meal_types = {meal_type: 0 for meal_type in ['breakfast', 'lunch', 'dinner', 'snack']}
+        self.prep_time = 0
+        self.cost = 0.0
+        self.cuisines = set()
+    
+    def add(self, meals: List[GeneratedMeal]):
+        for meal in meals:
+            self.total_meals += 1
+            self.confidence += meal.confidence_score
+            if meal.meal_type in self.meal_types:
+                self.meal_types[meal.meal_type] += 1
+            self.prep_time += meal.estimated_prep_time
+            self.cost += meal.estimated_cost
+            self.cuisines.add(meal.cuisine)
+    
+    def as_dict(self, waste_optimized: bool, plan_report: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "total_meals": self.total_meals,
+            "avg_confidence": self.confidence / self.total_meals if self.total_meals else 0,
+            "meal_types": self.meal_types,
+            "avg_prep_time": self.prep_time / self.total_meals if self.total_meals else 0,
+            "total_estimated_cost": self.cost,
+            "cuisines_variety": len(self.cuisines),
+            "waste_optimized": waste_optimized,
+            "plan": plan_report
+        }
+
+def _stream_events(request: MealGenerationRequest,
+                   plan: Generator[Tuple[int, List[GeneratedMeal]], None, Optional[Dict[str, Any]]],
+                   next_day: Optional[Tuple[int, List[GeneratedMeal]]],
+                   plan_report: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+    """
+    One "day" event per plan day, then a "summary" event (or an "error"
+    event if generation fails midway), each serialized as it is produced:
+    NDJSON lines, or SSE frames for stream="sse".
+    """
+    def encode(event: str, data: Dict[str, Any]) -> bytes:
+        if request.stream == "sse":
+            return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+        return orjson.dumps({"event": event, **data}, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+    
+    summary = PlanSummary()
+    try:
+        while next_day is not None:
+            day, meals = next_day
+            summary.add(meals)
+            yield encode("day", {"day": day, "meals": meals})
+            try:
+                next_day = next(plan)
+            except StopIteration as stop:
+                next_day, plan_report = None, stop.value
+    except Exception as e:
+        logger.error(f"Error streaming meals: {e}")
+        yield encode("error", {"success": False, "detail": str(e)})
+        return
+    
+    logger.info(f"Streamed {summary.total_meals} meals for user {request.user_id}")
+    yield encode("summary", {
+        "success": True,
+        "summary": summary.as_dict(request.optimize_for_waste, plan_report),
+        "generation_timestamp": datetime.now().isoformat(),
+        "user_id": request.user_id
+    })
+
 @app.post("/generate-meals")
 async def generate_personalized_meals(request: MealGenerationRequest):
-    """Generate personalized meal plan using AI"""
+    """
+    Generate personalized meal plan using AI.
+    With stream="ndjson" or "sse" each day's meals are sent as soon as they
+    are chosen, followed by the summary.
+    """
     try:
         logger.info(f"Generating meal plan for user {request.user_id}")
         
-        if request.optimize_for_waste and request.expiring_ingredients:
-            # Optimize for waste reduction
-            meals = ai_meal_engine.optimize_for_waste_reduction(
-                user_id=request.user_id,
-                expiring_ingredients=request.expiring_ingredients
-            )
-        else:
-            # Standard personalized meal generation
-            meals = ai_meal_engine.generate_personalized_meals(
-                user_id=request.user_id,
-                days=request.days,
-                meals_per_day=request.meals_per_day,
-                available_ingredients=request.available_ingredients
+        plan = _plan_days(request)
+        
+        if request.stream:
+            # Day 1 is produced here so request errors still get a proper status code; the rest streams
+            try:
+                first_day, plan_report = next(plan), None
+            except StopIteration as stop:
+                first_day, plan_report = None, stop.value
+            return StreamingResponse(
+                _stream_events(request, plan, first_day, plan_report),
+                media_type="text/event-stream" if request.stream == "sse" else "application/x-ndjson"
             )
         
+        meals = []
+        while True:
+            try:
+                meals.extend(next(plan)[1])
+            except StopIteration as stop:
+                plan_report = stop.value
+                break
+        
         # Convert to dict for JSON response
         meals_dict = [meal.__dict__ for meal in meals]
         
         # Generate summary statistics
-        summary = {
-            "total_meals": len(meals),
-            "avg_confidence": sum(meal.confidence_score for meal in meals) / len(meals) if meals else 0,
-            "meal_types": {meal_type: sum(1 for meal in meals if meal.meal_type == meal_type) 
-                          for meal_type in ['breakfast', 'lunch', 'dinner', 'snack']},
-            "avg_prep_time": sum(meal.estimated_prep_time for meal in meals) / len(meals) if meals else 0,
-            "total_estimated_cost": sum(meal.estimated_cost for meal in meals),
-            "cuisines_variety": len(set(meal.cuisine for meal in meals)),
-            "waste_optimized": request.optimize_for_waste
-        }
+        summary = PlanSummary()
+        summary.add(meals)
         
         logger.info(f"Generated {len(meals)} meals for user {request.user_id}")
         
         return {
             "success": True,
             "meals": meals_dict,
-            "summary": summary,
+            "summary": summary.as_dict(request.optimize_for_waste, plan_report),
             "generation_timestamp": datetime.now().isoformat(),
             "user_id": request.user_id
         }
@@ -229,28 +398,24 @@ async def optimize_for_waste_reduction(request: WasteOptimizationRequest):
     try:
         logger.info(f"Optimizing meals for waste reduction for user {request.user_id}")
         
-        meals = ai_meal_engine.optimize_for_waste_reduction(
+        meals, coverage = ai_meal_engine.plan_waste_reduction(
             user_id=request.user_id,
             expiring_ingredients=request.expiring_ingredients
         )
         
         meals_dict = [meal.__dict__ for meal in meals]
         
-        # Calculate waste reduction metrics
-        expiring_items = [item['name'].lower() for item in request.expiring_ingredients]
-        items_used = set()
-        
-        for meal in meals:
-            for ingredient in meal.ingredients:
-                if ingredient.lower() in expiring_items:
-                    items_used.add(ingredient.lower())
+        # Calculate waste reduction metrics (items count as used only if scheduled before they expire)
+        inventory = ExpiringInventory(request.expiring_ingredients)
+        items_used = set(coverage["covered"])
         
         waste_reduction_stats = {
             "expiring_ingredients_count": len(request.expiring_ingredients),
             "ingredients_utilized": len(items_used),
-            "utilization_rate": len(items_used) / len(expiring_items) if expiring_items else 0,
+            "utilization_rate": coverage["coverage_rate"],
             "meals_generated": len(meals),
-            "estimated_waste_prevented": f"${sum(item.get('cost', 2.0) for item in request.expiring_ingredients if item['name'].lower() in items_used):.2f}"
+            "estimated_waste_prevented": f"${sum(inventory.items[name].cost for name in items_used):.2f}",
+            "uncovered_ingredients": coverage["uncovered"]
         }
         
         return {
@@ -265,10 +430,16 @@ async def optimize_for_waste_reduction(request: WasteOptimizationRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/user-insights/{user_id}")
-async def get_user_insights(user_id: str):
+async def get_user_insights(user_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Get AI-generated insights about user's eating patterns"""
     try:
-        insights = ai_meal_engine.get_user_insights(user_id)
+        insights, etag = ai_meal_engine.get_user_insights_with_etag(user_id)
+        
+        # Weak validator: the insights match, the generated_at stamp doesn't
+        etag = f'W/"{etag}"'
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         
         return {
             "success": True,
@@ -285,8 +456,8 @@ async def get_user_insights(user_id: str):
 async def get_user_preferences(user_id: str):
     """Get current user preferences"""
     try:
-        if user_id in ai_meal_engine.user_preferences:
-            prefs = ai_meal_engine.user_preferences[user_id]
+        prefs = ai_meal_engine.get_user_preferences(user_id)
+        if prefs is not None:
             return {
                 "success": True,
                 "user_id": user_id,
@@ -323,9 +494,8 @@ async def batch_learn_from_meals(meals: List[MealRecordRequest], background_task
             )
             meal_records.append(meal_record)
         
-        # Learn from all meals asynchronously
-        for meal_record in meal_records:
-            background_tasks.add_task(ai_meal_engine.learn_from_meal, meal_record)
+        # Ingest the whole batch in one pass after responding
+        background_tasks.add_task(ai_meal_engine.learn_from_meals, meal_records)
         
         return {
             "success": True,
@@ -341,20 +511,17 @@ async def batch_learn_from_meals(meals: List[MealRecordRequest], background_task
 async def get_quick_meal_suggestions(user_id: str, meal_type: str = "lunch", count: int = 5):
     """Get quick meal suggestions for immediate use"""
     try:
-        meals = ai_meal_engine.generate_personalized_meals(
+        meals = ai_meal_engine.suggest_meals(
             user_id=user_id,
-            days=1,
-            meals_per_day=count
+            meal_type=meal_type,
+            count=count
         )
         
-        # Filter by meal type
-        filtered_meals = [meal for meal in meals if meal.meal_type == meal_type][:count]
-        
         return {
             "success": True,
             "meal_type": meal_type,
-            "suggestions": [meal.__dict__ for meal in filtered_meals],
-            "count": len(filtered_meals)
+            "suggestions": [meal.__dict__ for meal in meals],
+            "count": len(meals)
         }
         
     except Exception as e:
@@ -362,24 +529,41 @@ async def get_quick_meal_suggestions(user_id: str, meal_type: str = "lunch", cou
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/rate-meal/{meal_id}")
-async def rate_generated_meal(meal_id: str, rating: float, feedback: str = ""):
+async def rate_generated_meal(meal_id: str, rating: float, feedback: str = "", recipe_name: Optional[str] = None):
     """Rate a generated meal to improve future suggestions"""
     try:
-        # Extract user_id from meal_id
-        user_id = meal_id.split('_')[0] if '_' in meal_id else None
-        
-        if not user_id:
-            raise HTTPException(status_code=400, detail="Invalid meal_id format")
+        meal_rating = ai_meal_engine.resolve_rating(meal_id, rating, feedback, recipe_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        if recipe_name is not None:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+        # Meal ids without a (current) recipe id can't be learned from; the rating is only logged
+        user_id = parse_meal_id(meal_id)[0]
+        logger.info(f"Meal {meal_id} rated {rating}/5 by user {user_id} (recipe unknown, not learned): {feedback}")
+        return {
+            "success": True,
+            "message": "Meal rating recorded; pass recipe_name to learn from it",
+            "meal_id": meal_id,
+            "user_id": user_id,
+            "rating": rating,
+            "learning_status": "skipped"
+        }
+
+    try:
+        # Logged and applied to the user's ingredient scores on its shard writer
+        ai_meal_engine.submit_rating(meal_rating)
         
-        # This would update the ML model based on feedback
-        # For now, we'll log the feedback
-        logger.info(f"Meal {meal_id} rated {rating}/5 by user {user_id}: {feedback}")
+        logger.info(f"Meal {meal_id} ({meal_rating.recipe_name}) rated {rating}/5 by user {meal_rating.user_id}: {feedback}")
         
         return {
             "success": True,
             "message": "Meal rating recorded successfully",
             "meal_id": meal_id,
-            "rating": rating
+            "user_id": meal_rating.user_id,
+            "recipe_name": meal_rating.recipe_name,
+            "rating": rating,
+            "learning_status": "processing"
         }
         
     except Exception as e:
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for the calorie calculation service.
+Simulates the request patterns the frontend produces and reports throughput.
+"""
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from calorie_calculation_service import calorie_calculator
+
+def _slider_drag_weights(predicted_weight: float, passes: int = 20):
+    """Weights fired by the PortionSizeConfirmation slider (step=5, 0.3x-3x range)."""
+    low = max(10, predicted_weight * 0.3)
+    high = predicted_weight * 3
+    sweep = []
+    weight = low
+    while weight <= high:
+        sweep.append(weight)
+        weight += 5
+    weights = []
+    for i in range(passes):
+        weights.extend(sweep if i % 2 == 0 else list(reversed(sweep)))
+    return weights
+
+# Frozen copy of the per-request /update-portion computation as it was before the
+# precomputed FoodProfiles and LRUs, so the "before" numbers measure the old code.
+# (The original's per-food quality call was shadowed and raised TypeError; this
+# calls the per-food assessment it was meant to reach.)
+
+def _baseline_food_quality(calories, protein, carbs, fat, fiber, vitamins, minerals):
+    protein_percentage = (protein * 4 / calories * 100) if calories > 0 else 0
+    carb_percentage = (carbs * 4 / calories * 100) if calories > 0 else 0
+    fat_percentage = (fat * 9 / calories * 100) if calories > 0 else 0
+
+    quality_score = 0
+    if 15 <= protein_percentage <= 35:
+        quality_score += 25
+    elif 10 <= protein_percentage <= 40:
+        quality_score += 20
+    elif protein_percentage >= 5:
+        quality_score += 15
+    if 45 <= carb_percentage <= 65:
+        quality_score += 25
+    elif 35 <= carb_percentage <= 75:
+        quality_score += 20
+    elif carb_percentage >= 25:
+        quality_score += 15
+    if 20 <= fat_percentage <= 35:
+        quality_score += 25
+    elif 15 <= fat_percentage <= 40:
+        quality_score += 20
+    elif fat_percentage >= 10:
+        quality_score += 15
+    fiber_per_100_calories = (fiber / calories * 100) if calories > 0 else 0
+    if fiber_per_100_calories >= 3:
+        quality_score += 25
+    elif fiber_per_100_calories >= 2:
+        quality_score += 20
+    elif fiber_per_100_calories >= 1:
+        quality_score += 15
+
+    if quality_score >= 90:
+        quality_rating = "Excellent"
+    elif quality_score >= 75:
+        quality_rating = "Very Good"
+    elif quality_score >= 60:
+        quality_rating = "Good"
+    elif quality_score >= 45:
+        quality_rating = "Fair"
+    else:
+        quality_rating = "Poor"
+
+    recommendations = []
+    if protein_percentage < 15:
+        recommendations.append("Consider adding more protein sources")
+    if carb_percentage > 70:
+        recommendations.append("Reduce refined carbohydrates")
+    if fat_percentage > 40:
+        recommendations.append("Consider reducing fat intake")
+    if fiber_per_100_calories < 2:
+        recommendations.append("Increase fiber intake")
+    if vitamins['vitamin_c'] < 10:
+        recommendations.append("Add vitamin C rich foods")
+    if minerals['iron'] < 2:
+        recommendations.append("Consider iron-rich foods")
+
+    return {
+        'quality_score': round(quality_score, 1),
+        'quality_rating': quality_rating,
+        'protein_percentage': round(protein_percentage, 1),
+        'carb_percentage': round(carb_percentage, 1),
+        'fat_percentage': round(fat_percentage, 1),
+        'fiber_per_100_calories': round(fiber_per_100_calories, 1),
+        'recommendations': recommendations
+    }
+
+def _baseline_precise_nutrition(food_name: str, weight_g: float):
+    if not food_name or not isinstance(food_name, str):
+        return {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'fiber': 0, 'error': 'Invalid food name provided'}
+    if not isinstance(weight_g, (int, float)) or weight_g <= 0:
+        return {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'fiber': 0,
+                'error': f'Invalid weight: {weight_g}. Must be a positive number.'}
+    if weight_g > 10000:
+        return {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'fiber': 0,
+                'error': f'Weight too large: {weight_g}g. Maximum 10kg allowed.'}
+    if food_name not in calorie_calculator.nutritional_database:
+        return {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'fiber': 0,
+                'error': f'Unknown food: {food_name}. Available foods: {list(calorie_calculator.nutritional_database.keys())[:5]}...'}
+
+    food_info = calorie_calculator.nutritional_database[food_name]
+    calories = (food_info.calories_per_100g * weight_g) / 100
+    protein = (food_info.protein_per_100g * weight_g) / 100
+    carbs = (food_info.carbs_per_100g * weight_g) / 100
+    fat = (food_info.fat_per_100g * weight_g) / 100
+    fiber = (food_info.fiber_per_100g * weight_g) / 100
+    sugar = (food_info.sugar_per_100g * weight_g) / 100
+    saturated_fat = (food_info.saturated_fat_per_100g * weight_g) / 100
+    monounsaturated_fat = (food_info.monounsaturated_fat_per_100g * weight_g) / 100
+    polyunsaturated_fat = (food_info.polyunsaturated_fat_per_100g * weight_g) / 100
+    trans_fat = (food_info.trans_fat_per_100g * weight_g) / 100
+    cholesterol = (food_info.cholesterol_per_100g * weight_g) / 100
+    sodium = (food_info.sodium_per_100g * weight_g) / 100
+    potassium = (food_info.potassium_per_100g * weight_g) / 100
+
+    calories_from_protein = protein * 4
+    calories_from_carbs = carbs * 4
+    calories_from_fat = fat * 9
+    total_calculated_calories = calories_from_protein + calories_from_carbs + calories_from_fat
+    calorie_accuracy = abs(calories - total_calculated_calories) / calories * 100 if calories > 0 else 0
+
+    validation_errors = []
+    if calorie_accuracy > 5:
+        validation_errors.append(f"Calorie calculation deviation: {calorie_accuracy:.1f}%")
+    if protein < 0 or carbs < 0 or fat < 0 or fiber < 0:
+        validation_errors.append("Negative nutrient values detected")
+    if calories > 1000:
+        validation_errors.append(f"Unusually high calorie count: {calories:.1f}")
+    if abs(calories - total_calculated_calories) > 1:
+        validation_errors.append("Calorie calculation precision issue")
+
+    vitamins = {
+        'vitamin_c': round((food_info.vitamin_c_per_100g * weight_g) / 100, 2),
+        'vitamin_a': round((food_info.vitamin_a_per_100g * weight_g) / 100, 2),
+        'vitamin_e': round((food_info.vitamin_e_per_100g * weight_g) / 100, 2),
+        'vitamin_k': round((food_info.vitamin_k_per_100g * weight_g) / 100, 2),
+        'thiamine': round((food_info.thiamine_per_100g * weight_g) / 100, 3),
+        'riboflavin': round((food_info.riboflavin_per_100g * weight_g) / 100, 3),
+        'niacin': round((food_info.niacin_per_100g * weight_g) / 100, 3),
+        'folate': round((food_info.folate_per_100g * weight_g) / 100, 2)
+    }
+    minerals = {
+        'calcium': round((food_info.calcium_per_100g * weight_g) / 100, 2),
+        'iron': round((food_info.iron_per_100g * weight_g) / 100, 2),
+        'magnesium': round((food_info.magnesium_per_100g * weight_g) / 100, 2),
+        'phosphorus': round((food_info.phosphorus_per_100g * weight_g) / 100, 2),
+        'zinc': round((food_info.zinc_per_100g * weight_g) / 100, 2),
+        'copper': round((food_info.copper_per_100g * weight_g) / 100, 2),
+        'manganese': round((food_info.manganese_per_100g * weight_g) / 100, 2),
+        'selenium': round((food_info.selenium_per_100g * weight_g) / 100, 2)
+    }
+
+    return {
+        'calories': round(calories, 1),
+        'protein': round(protein, 2),
+        'carbs': round(carbs, 2),
+        'fat': round(fat, 2),
+        'fiber': round(fiber, 2),
+        'portion_size_g': round(weight_g, 1),
+        'portion_description': food_info.portion_description,
+        'food_name': food_name,
+        'density': food_info.density,
+        'calorie_accuracy': round(calorie_accuracy, 2),
+        'calories_from_protein': round(calories_from_protein, 1),
+        'calories_from_carbs': round(calories_from_carbs, 1),
+        'calories_from_fat': round(calories_from_fat, 1),
+        'total_calculated_calories': round(total_calculated_calories, 1),
+        'sugar': round(sugar, 2),
+        'saturated_fat': round(saturated_fat, 2),
+        'monounsaturated_fat': round(monounsaturated_fat, 2),
+        'polyunsaturated_fat': round(polyunsaturated_fat, 2),
+        'trans_fat': round(trans_fat, 2),
+        'cholesterol': round(cholesterol, 2),
+        'sodium': round(sodium, 2),
+        'potassium': round(potassium, 2),
+        'vitamins': vitamins,
+        'minerals': minerals,
+        'nutritional_quality': _baseline_food_quality(calories, protein, carbs, fat, fiber, vitamins, minerals),
+        'validation_errors': validation_errors,
+        'calculation_quality': 'excellent' if not validation_errors else 'needs_review',
+        'timestamp': datetime.now().isoformat()
+    }
+
+def _baseline_portion_validation(food_name: str, weight_g: float):
+    if food_name not in calorie_calculator.nutritional_database:
+        return {'valid': False, 'error': 'Unknown food'}
+    typical_portion = calorie_calculator.nutritional_database[food_name].typical_portion_size
+    deviation = abs(weight_g - typical_portion) / typical_portion * 100
+    validation = {
+        'valid': True,
+        'typical_portion_g': typical_portion,
+        'deviation_percent': round(deviation, 1),
+        'recommendation': 'Good portion size'
+    }
+    if deviation > 50:
+        validation['recommendation'] = 'Unusually large portion - consider splitting'
+    elif deviation > 25:
+        validation['recommendation'] = 'Larger than typical - ensure accuracy'
+    elif deviation < 10:
+        validation['recommendation'] = 'Perfect portion size'
+    return validation
+
+def _update_portion(food_name: str, weight_g: float):
+    """The work /update-portion does per request."""
+    calorie_calculator.calculate_precise_nutrition(food_name, weight_g)
+    calorie_calculator.validate_portion_size(food_name, weight_g)
+
+def benchmark_slider_drag():
+    """Compare the original per-request computation, the precomputed profiles and the LRU-cached path."""
+
+    print("🎚️  Slider drag benchmark (/update-portion)")
+    print("=" * 60)
+
+    foods = ['apple', 'banana', 'chicken', 'rice', 'broccoli']
+    workload = [
+        (food, weight)
+        for food in foods
+        for weight in _slider_drag_weights(calorie_calculator.nutritional_database[food].typical_portion_size)
+    ]
+
+    # Before: the original computation from scratch for every request
+    start = time.perf_counter()
+    for food, weight in workload:
+        _baseline_precise_nutrition(food, weight)
+        _baseline_portion_validation(food, weight)
+    baseline_time = time.perf_counter() - start
+
+    # Precomputed profiles, without the LRUs
+    start = time.perf_counter()
+    for food, weight in workload:
+        calorie_calculator._build_precise_nutrition(food, weight)
+        calorie_calculator._build_portion_validation(food, weight)
+    uncached_time = time.perf_counter() - start
+
+    calorie_calculator._cached_precise_nutrition.cache_clear()
+    calorie_calculator._cached_portion_validation.cache_clear()
+
+    start = time.perf_counter()
+    for food, weight in workload:
+        _update_portion(food, weight)
+    cached_time = time.perf_counter() - start
+
+    info = calorie_calculator._cached_precise_nutrition.cache_info()
+    print(f"Requests:        {len(workload)}")
+    print(f"Original:        {len(workload) / baseline_time:,.0f} req/s")
+    print(f"Profiles:        {len(workload) / uncached_time:,.0f} req/s")
+    print(f"Cached (LRU):    {len(workload) / cached_time:,.0f} req/s ({baseline_time / cached_time:.1f}x the original)")
+    print(f"Cache hit rate:  {info.hits / max(1, info.hits + info.misses) * 100:.1f}%")
+
+    return True
+
+def benchmark_lean_responses(requests: int = 20000):
+    """Compare CPU time and payload size of full vs. lean /update-portion responses."""
+    import json
+    import orjson
+
+    print("\n🪶 Lean response benchmark (/update-portion)")
+    print("=" * 60)
+
+    weights = [50 + (i % 400) * 0.5 for i in range(requests)]
+    modes = [
+        ("full + json", None, json.dumps),
+        ("full + orjson", None, orjson.dumps),
+        ("macros + orjson", 'macros', orjson.dumps),
+        ("calories,protein + orjson", 'calories,protein', orjson.dumps),
+    ]
+
+    for label, fields, dumps in modes:
+        sections, keys = calorie_calculator.resolve_nutrition_fields(fields)
+        start = time.perf_counter()
+        size = 0
+        for weight in weights:
+            payload = calorie_calculator._build_precise_nutrition('apple', weight, sections)
+            if keys is not None:
+                payload = {key: value for key, value in payload.items() if key in keys}
+            size = len(dumps(payload))
+        elapsed = time.perf_counter() - start
+        print(f"{label:<28} {elapsed / requests * 1e6:6.1f} µs/req  {size:5d} bytes")
+
+    return True
+
+def benchmark_gap_recommender(requests: int = 200):
+    """Latency of /nutrient-gaps recommendations (first call included) against the 50 ms budget."""
+
+    print("\n🎯 Gap recommender benchmark (/nutrient-gaps)")
+    print("=" * 60)
+
+    rng = np.random.default_rng(7)
+    targets = {"calories": 2000, "protein": 60, "carbs": 250, "fat": 70, "fiber": 30}
+    latencies = []
+    for _ in range(requests):
+        intake = {field: float(rng.uniform(0.2, 0.9)) * target for field, target in targets.items()}
+        start = time.perf_counter()
+        calorie_calculator.recommend_foods_for_gaps(intake, targets, max_foods=4)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    print(f"First call:        {latencies[0]:.1f} ms")
+    print(f"Median / p99:      {np.median(latencies):.1f} / {np.percentile(latencies, 99):.1f} ms (budget 50 ms)")
+
+    return np.percentile(latencies, 99) < 50
+
+def benchmark_nutrition_ledger(users: int = 10000, days: int = 365, meals_per_day: int = 3):
+    """Backfill a year of meals and time dashboard reads against the rollups."""
+    from nutrition_ledger import NutritionLedger
+
+    print(f"\n📒 Nutrition ledger benchmark ({users:,} users × {days} days × {meals_per_day} meals)")
+    print("=" * 60)
+
+    rng = np.random.default_rng(42)
+    ledger = NutritionLedger(data_dir=tempfile.mkdtemp(prefix="ledger_bench_"))
+    user_ids = [f"user_{i}" for i in range(users)] * meals_per_day
+    foods = calorie_calculator.nutrient_matrix
+    first_day = date(2025, 1, 1)
+
+    start = time.perf_counter()
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        # Three random foods of 50-250g per meal
+        weights = np.zeros((len(user_ids), len(foods)))
+        for _ in range(3):
+            weights[np.arange(len(user_ids)), rng.integers(0, len(foods), len(user_ids))] += rng.uniform(50, 250, len(user_ids))
+        ledger.add_vectors(user_ids, [day] * len(user_ids), weights @ foods / 100)
+    backfill_time = time.perf_counter() - start
+    total_meals = users * days * meals_per_day
+
+    reads = 100000
+    lookups = [(f"user_{rng.integers(users)}", (first_day + timedelta(days=int(rng.integers(days)))).isoformat())
+               for _ in range(reads)]
+    start = time.perf_counter()
+    for i, (user_id, day) in enumerate(lookups):
+        ledger.get_summary(user_id, ('day', 'week', 'month')[i % 3], day)
+    read_time = time.perf_counter() - start
+
+    rollup_bytes = sum(store.nbytes for store in ledger.rollups.values())
+    print(f"Meals backfilled:  {total_meals:,} in {backfill_time:.1f}s ({total_meals / backfill_time:,.0f} meals/s)")
+    print(f"Dashboard reads:   {reads / read_time:,.0f} reads/s ({read_time / reads * 1e6:.1f} µs/read)")
+    print(f"Rollup storage:    {rollup_bytes / 1e6:,.0f} MB")
+
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calorie service benchmarks")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    benchmark_slider_drag()
+    benchmark_lean_responses()
+    benchmark_gap_recommender()
+    benchmark_nutrition_ledger(users=args.users, days=args.days)
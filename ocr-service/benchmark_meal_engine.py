@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for the AI meal engine.
+Scores and plans against a large synthetic recipe catalog and reports throughput.
+"""
+
+import sys
+import os
+import time
+import json
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+import subprocess
+import dataclasses
+import numpy as np
+from typing import Dict
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_meal_generator import AIPersonalizationEngine, UserPreference, MealRecord
+from meal_history import MealHistory
+from recipe_catalog import RecipeCatalog, RecipeFilter, RESTRICTION_VIOLATIONS, MEAL_TYPES, synthetic_recipes
+
+def _synthetic_users(catalog: RecipeCatalog, count: int, seed: int = 0):
+    """(preferences, learned ingredient scores) for `count` random users."""
+    rng = np.random.default_rng(seed)
+    vocabulary = list(catalog.ingredient_ids)
+    restrictions = list(RESTRICTION_VIOLATIONS)
+    cuisines = [cuisine for cuisine in catalog.cuisine_codes if cuisine]
+    users = []
+    for i in range(count):
+        picks = [vocabulary[j] for j in rng.choice(len(vocabulary), size=60, replace=False)]
+        user_prefs = UserPreference(
+            user_id=f"bench_user_{i}",
+            dietary_restrictions=[r for r in restrictions if rng.random() < 0.2],
+            favorite_ingredients=picks[:10],
+            disliked_ingredients=picks[10:15],
+            preferred_cuisines=[c for c in cuisines if rng.random() < 0.3],
+            cooking_skill=['beginner', 'intermediate', 'advanced'][i % 3],
+            health_goals=[['maintenance', 'weight_loss', 'muscle_gain'][i % 3]]
+        )
+        learned = {ingredient: float(rng.uniform(-1, 1)) for ingredient in picks[15:]}
+        users.append((user_prefs, learned))
+    return users
+
+def benchmark_catalog_scoring(recipes: int = 100000, users: int = 1000, reference_users: int = 3):
+    """Vectorized (CSR matvec + masks) vs. per-recipe reference scoring of the whole catalog."""
+
+    print(f"🧮 Catalog scoring benchmark ({recipes:,} recipes × {users:,} users)")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    catalog = RecipeCatalog(synthetic_recipes(recipes, seed=7))
+    print(f"Catalog build:     {time.perf_counter() - start:.2f}s "
+          f"({len(catalog.ingredient_ids):,} ingredients, {catalog.incidence.nnz:,} nonzeros)")
+
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_bench_"), catalog=catalog)
+    population = _synthetic_users(catalog, users)
+    available = list(catalog.ingredient_ids)[:20]
+
+    start = time.perf_counter()
+    for user_prefs, learned in population:
+        for meal_type in MEAL_TYPES:
+            engine._score_recipes(meal_type, user_prefs, learned, available)
+    vectorized_time = time.perf_counter() - start
+
+    # The reference scorer is far too slow for every user; time a few and extrapolate
+    start = time.perf_counter()
+    for user_prefs, learned in population[:reference_users]:
+        for recipe in catalog.recipes:
+            engine._calculate_meal_score(recipe, user_prefs, learned, available)
+    reference_per_user = (time.perf_counter() - start) / reference_users
+
+    vectorized_per_user = vectorized_time / users
+    print(f"Vectorized:        {vectorized_per_user * 1000:.2f} ms/user ({users / vectorized_time:,.0f} users/s)")
+    print(f"Reference loop:    {reference_per_user * 1000:.0f} ms/user (measured on {reference_users} users)")
+    print(f"Speedup:           {reference_per_user / vectorized_per_user:,.0f}x")
+
+    return engine, population
+
+def benchmark_plan_generation(engine: AIPersonalizationEngine, population, plans: int = 200):
+    """End-to-end 7-day plans (scoring + diverse selection) against the same catalog."""
+
+    print(f"\n📅 Plan generation benchmark ({plans} × 7-day plans)")
+    print("=" * 60)
+
+    for user_prefs, _ in population[:plans]:
+        engine.set_user_preferences(user_prefs)
+
+    start = time.perf_counter()
+    for user_prefs, _ in population[:plans]:
+        engine.generate_personalized_meals(user_prefs.user_id, days=7, meals_per_day=4)
+    elapsed = time.perf_counter() - start
+
+    print(f"Plans:             {plans / elapsed:,.0f} plans/s ({elapsed / plans * 1000:.1f} ms/plan)")
+
+    return True
+
+def benchmark_prefiltered_scoring(engine: AIPersonalizationEngine, population, users: int = 200):
+    """Request filters as pruning stages before scoring vs. scoring the whole partition and filtering after."""
+
+    print(f"\n🔎 Pre-filtered scoring benchmark ({users} users × {len(MEAL_TYPES)} meal types)")
+    print("=" * 60)
+
+    catalog = engine.catalog
+    filters = [
+        RecipeFilter(max_prep_time=60),
+        RecipeFilter(max_prep_time=30),
+        RecipeFilter(dietary_restrictions=("vegetarian",), max_prep_time=30),
+        RecipeFilter(dietary_restrictions=("vegan",), max_prep_time=30, cuisine="italian"),
+    ]
+    for recipe_filter in filters:
+        allowed = {meal_type: catalog.filter_ids(meal_type, recipe_filter) for meal_type in MEAL_TYPES}
+        kept = sum(len(ids) for ids in allowed.values()) / len(catalog)
+
+        start = time.perf_counter()
+        for user_prefs, learned in population[:users]:
+            for meal_type in MEAL_TYPES:
+                recipe_ids, scores = engine._score_meal_type(user_prefs, learned, meal_type, [])
+                keep = np.isin(recipe_ids, allowed[meal_type], assume_unique=True)
+                recipe_ids, scores = recipe_ids[keep], scores[keep]
+        post_filter = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for user_prefs, learned in population[:users]:
+            for meal_type in MEAL_TYPES:
+                engine._score_meal_type(user_prefs, learned, meal_type, [], recipe_filter=recipe_filter)
+        pre_filter = time.perf_counter() - start
+
+        print(f"{kept:6.1%} kept:       {post_filter / users * 1000:.2f} → {pre_filter / users * 1000:.2f} ms/user "
+              f"({post_filter / pre_filter:.1f}x)")
+
+def benchmark_streaming_plan(engine: AIPersonalizationEngine, population, days: int = 90):
+    """First-day latency and peak memory: streamed per-day orjson events vs. one JSON blob of the whole plan."""
+    import orjson
+
+    print(f"\n📡 Streaming plan benchmark ({days} days × 4 meals)")
+    print("=" * 60)
+
+    user_id = population[0][0].user_id
+
+    def blob(seed):
+        meals, report = engine.generate_meal_plan(user_id, days=days, meals_per_day=4, seed=seed)
+        return json.dumps({"meals": [meal.__dict__ for meal in meals], "summary": {"plan": report}}).encode()
+
+    def stream(seed, first_day):
+        """Bytes of the NDJSON stream; the time its first line is ready goes into first_day."""
+        sent = 0
+        plan = engine.stream_meal_plan(user_id, days=days, meals_per_day=4, seed=seed)
+        for day, meals in plan:
+            chunk = orjson.dumps({"event": "day", "day": day, "meals": meals}, option=orjson.OPT_APPEND_NEWLINE)
+            sent += len(chunk)
+            if not first_day:
+                first_day.append(time.perf_counter())
+        return sent
+
+    start = time.perf_counter()
+    blob_bytes = len(blob(seed=1))
+    blob_time = time.perf_counter() - start
+    first_day = []
+    start = time.perf_counter()
+    stream_bytes = stream(2, first_day)
+    stream_time, first_day_time = time.perf_counter() - start, first_day[0] - start
+
+    tracemalloc.start()
+    blob(seed=3)
+    blob_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    stream(4, [])
+    stream_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"Blob:              first byte after {blob_time * 1000:.0f} ms, peak {blob_peak / 2**20:.1f} MiB, "
+          f"{blob_bytes / 1024:.0f} KiB")
+    print(f"Stream:            day 1 after {first_day_time * 1000:.1f} ms (done in {stream_time * 1000:.0f} ms), "
+          f"peak {stream_peak / 2**20:.1f} MiB, {stream_bytes / 1024:.0f} KiB")
+
+def benchmark_bulk_plans(engine: AIPersonalizationEngine, population, users: int = 500):
+    """Weekly plans for many users: one generate_meal_plan call per user vs. the batched bulk job."""
+
+    workers = os.cpu_count() or 1
+    print(f"\n📦 Bulk plan benchmark ({users} users × 7-day plans, {workers} CPUs)")
+    print("=" * 60)
+
+    for user_prefs, _ in population[:users]:
+        engine.set_user_preferences(user_prefs)
+    user_ids = [user_prefs.user_id for user_prefs, _ in population[:users]]
+    output_path = os.path.join(engine.data_dir, "bulk_plans.jsonl")
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        meals, _ = engine.generate_meal_plan(user_id, days=7, seed=0)
+        json.dumps([dataclasses.asdict(meal) for meal in meals])
+    per_user = users / (time.perf_counter() - start)
+    print(f"Per-user calls:    {per_user:,.0f} users/s")
+
+    for job_workers in sorted({1, workers}):
+        report = engine.generate_bulk_plans(output_path, user_ids, workers=job_workers)
+        print(f"Bulk, {job_workers} worker{'s' if job_workers > 1 else ' '}:   {report['users_per_second']:,.0f} users/s "
+              f"({report['users_per_second'] / per_user:.1f}x)")
+
+def benchmark_recipe_nutrition(recipes: int = 100000, reference_recipes: int = 1000):
+    """Nutrient vectors for a whole catalog in one sparse product vs. per-ingredient calorie service calls."""
+    from calorie_calculation_service import calorie_calculator
+    from recipe_nutrition import with_nutrients
+
+    print(f"\n🥗 Recipe nutrition benchmark ({recipes:,} recipes)")
+    print("=" * 60)
+
+    rng = np.random.default_rng(11)
+    foods = list(calorie_calculator.food_index)
+    catalog_recipes = synthetic_recipes(recipes, seed=11)
+    for recipe in catalog_recipes:
+        picks = rng.choice(len(foods), size=len(recipe['ingredients']), replace=False)
+        recipe['ingredient_grams'] = {foods[j]: float(rng.integers(5, 200)) for j in picks}
+
+    start = time.perf_counter()
+    computed = with_nutrients(catalog_recipes)
+    vectorized = time.perf_counter() - start
+
+    # What computing nutrition on demand would cost: one service call per ingredient
+    start = time.perf_counter()
+    for recipe in catalog_recipes[:reference_recipes]:
+        for food, grams in recipe['ingredient_grams'].items():
+            calorie_calculator.calculate_precise_nutrition(food, grams)
+    reference = (time.perf_counter() - start) / reference_recipes * recipes
+
+    start = time.perf_counter()
+    catalog = RecipeCatalog(computed)
+    build = time.perf_counter() - start
+
+    print(f"Sparse product:    {vectorized:.2f}s for {recipes:,} recipes ({recipes / vectorized:,.0f} recipes/s)")
+    print(f"Per-ingredient:    {reference:.1f}s estimated (measured on {reference_recipes:,} recipes)")
+    print(f"Catalog build:     {build:.2f}s with precomputed vectors ({int(catalog.has_nutrients.sum()):,} recipes)")
+
+# Cold-import budgets (ms, -X importtime cumulative) of the meal API's modules
+IMPORT_BUDGETS_MS = {
+    'ai_meal_service': 600,
+    'ai_meal_generator': 300,
+    'calorie_calculation_service': 120,
+}
+# Libraries that must stay off the import path (only the code paths that use them import them)
+LAZY_MODULES = ('sklearn', 'pandas', 'scipy.optimize', 'requests', 'concurrent.futures.process')
+
+def import_times(module: str) -> Dict[str, int]:
+    """Cumulative import time (µs) of every module a fresh interpreter loads for `import module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=tempfile.mkdtemp(prefix="meal_bench_"), capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+def benchmark_startup(repeats: int = 5) -> bool:
+    """Cold import time of each meal API module against its budget; fails if one is over or pulls in a lazy library."""
+
+    print(f"\n🚀 Startup benchmark (python -X importtime, median of {repeats})")
+    print("=" * 60)
+
+    within_budget = True
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        runs = [import_times(module) for _ in range(repeats)]
+        elapsed = statistics.median(times[module] for times in runs) / 1000
+        eager = [name for name in LAZY_MODULES if name in runs[0]]
+        heaviest = sorted(
+            ((name, cumulative) for name, cumulative in runs[0].items() if name != module and '.' not in name),
+            key=lambda item: -item[1]
+        )[:3]
+        ok = elapsed <= budget and not eager
+        within_budget &= ok
+        print(f"{'✅' if ok else '❌'} {module + ':':30} {elapsed:6.0f} ms (budget {budget} ms); heaviest: "
+              + ", ".join(f"{name} {cumulative / 1000:.0f} ms" for name, cumulative in heaviest)
+              + (f"; imported eagerly: {', '.join(eager)}" if eager else ""))
+    return within_budget
+
+def _allocated(build):
+    """(result, bytes still allocated) of build()."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, allocated
+
+def benchmark_history_memory(meals: int = 200000):
+    """Bytes per meal of history loaded from event payloads: record objects vs. the columnar store."""
+
+    print(f"\n🗜️ Meal history memory benchmark ({meals:,} meals)")
+    print("=" * 60)
+
+    rng = np.random.default_rng(3)
+    vocabulary = [f"ingredient_{i}" for i in range(2000)]
+    payloads = [json.dumps(dataclasses.asdict(MealRecord(
+        user_id="bench_user",
+        meal_name=f"Meal {i % 500}",
+        ingredients=[vocabulary[j] for j in rng.integers(0, len(vocabulary), size=8)],
+        meal_type=MEAL_TYPES[i % len(MEAL_TYPES)],
+        date=f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}",
+        rating=float(rng.integers(1, 6)),
+        prep_time=int(rng.integers(5, 60)),
+        cost=round(float(rng.uniform(2, 15)), 2),
+        calories=int(rng.integers(200, 900))
+    ))) for i in range(meals)]
+
+    # The pre-compaction layout: a plain (dict-backed) dataclass per meal
+    LegacyMealRecord = dataclasses.make_dataclass(
+        "LegacyMealRecord", [(f.name, f.type, dataclasses.field(default=f.default)) for f in dataclasses.fields(MealRecord)]
+    )
+    legacy, legacy_bytes = _allocated(lambda: [LegacyMealRecord(**json.loads(p)) for p in payloads])
+    del legacy
+    slotted, slotted_bytes = _allocated(lambda: [MealRecord(**json.loads(p)) for p in payloads])
+    history, history_bytes = _allocated(lambda records=slotted: MealHistory.from_records(records))
+    del slotted
+
+    print(f"Record objects:    {legacy_bytes / meals:,.0f} bytes/meal")
+    print(f"Slotted records:   {slotted_bytes / meals:,.0f} bytes/meal")
+    print(f"Columnar history:  {history_bytes / meals:,.0f} bytes/meal ({legacy_bytes / history_bytes:.1f}x smaller)")
+
+    return history
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI meal engine benchmarks")
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--startup-only', action='store_true', help="Only check import-time budgets")
+    args = parser.parse_args()
+
+    if args.startup_only:
+        sys.exit(0 if benchmark_startup() else 1)
+
+    engine, population = benchmark_catalog_scoring(recipes=args.recipes, users=args.users)
+    benchmark_plan_generation(engine, population, plans=min(200, args.users))
+    benchmark_prefiltered_scoring(engine, population, users=min(200, args.users))
+    benchmark_streaming_plan(engine, population)
+    benchmark_bulk_plans(engine, population, users=min(500, args.users))
+    benchmark_recipe_nutrition(recipes=args.recipes)
+    benchmark_history_memory()
+    if not benchmark_startup():
+        sys.exit(1)
@@ -1,9 +1,10 @@
 import os
 import json
+import hashlib
 import logging
-import requests
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
+from functools import lru_cache
 import numpy as np
 from datetime import datetime
 
@@ -51,6 +52,77 @@ class NutritionalInfo:
     manganese_per_100g: float = 0.0
     selenium_per_100g: float = 0.0
 
+# Nutrient keys as they appear in API responses; NutritionalInfo stores each as f"{key}_per_100g"
+MACRO_NUTRIENTS = (
+    'calories', 'protein', 'carbs', 'fat', 'fiber',
+    'sugar', 'saturated_fat', 'monounsaturated_fat', 'polyunsaturated_fat', 'trans_fat',
+    'cholesterol', 'sodium', 'potassium'
+)
+VITAMIN_NUTRIENTS = (
+    'vitamin_c', 'vitamin_a', 'vitamin_e', 'vitamin_k',
+    'thiamine', 'riboflavin', 'niacin', 'folate'
+)
+MINERAL_NUTRIENTS = (
+    'calcium', 'iron', 'magnesium', 'phosphorus', 'zinc', 'copper', 'manganese', 'selenium'
+)
+# Column order of nutrient vectors and the food × nutrient matrix
+NUTRIENT_VECTOR_FIELDS = MACRO_NUTRIENTS + VITAMIN_NUTRIENTS + MINERAL_NUTRIENTS
+# B vitamins are reported with an extra decimal place
+VITAMIN_DIGITS = {'thiamine': 3, 'riboflavin': 3, 'niacin': 3}
+
+# Sections of a precise nutrition response and the keys each one produces
+NUTRITION_SECTIONS = {
+    'macros': ('calories', 'protein', 'carbs', 'fat', 'fiber'),
+    'portion': ('portion_size_g', 'portion_description', 'food_name', 'density'),
+    'energy': ('calorie_accuracy', 'calories_from_protein', 'calories_from_carbs',
+               'calories_from_fat', 'total_calculated_calories'),
+    'macro_breakdown': MACRO_NUTRIENTS[5:],
+    'vitamins': ('vitamins',),
+    'minerals': ('minerals',),
+    'nutritional_quality': ('nutritional_quality',),
+    'validation': ('validation_errors', 'calculation_quality'),
+    'meta': ('timestamp',)
+}
+NUTRITION_FIELD_SECTIONS = {key: section for section, keys in NUTRITION_SECTIONS.items() for key in keys}
+FULL_NUTRITION_SECTIONS = frozenset(NUTRITION_SECTIONS)
+# Named field selections for lean responses (e.g. the live portion slider)
+NUTRITION_PRESETS = {
+    'macros': frozenset({'macros', 'portion'}),
+    'full': FULL_NUTRITION_SECTIONS
+}
+
+# Max (food, weight) entries kept by the precise-nutrition LRU
+NUTRITION_CACHE_SIZE = 4096
+
+# Reference daily intakes (FDA daily values) in the nutritional database's units.
+# Nutrients with upper limits (sugar, sodium, saturated/trans fat, cholesterol) are not gap targets.
+DAILY_TARGETS = {
+    'calories': 2000, 'protein': 50, 'carbs': 275, 'fat': 78, 'fiber': 28, 'potassium': 4700,
+    'vitamin_c': 90, 'vitamin_a': 900, 'vitamin_e': 15, 'vitamin_k': 120,
+    'thiamine': 1.2, 'riboflavin': 1.3, 'niacin': 16, 'folate': 400,
+    'calcium': 1300, 'iron': 18, 'magnesium': 420, 'phosphorus': 1250,
+    'zinc': 11, 'copper': 0.9, 'manganese': 2.3, 'selenium': 55
+}
+
+# Geometry-based portion estimation: real-world width spanned by a food photo
+# (roughly a dinner plate) and the assumed height of food on it
+PLATE_WIDTH_CM = 27.0
+FOOD_DEPTH_CM = 2.5
+
+@dataclass(frozen=True)
+class FoodProfile:
+    """Weight-independent nutrition data derived once per food"""
+    food_info: NutritionalInfo
+    macros_per_100g: Dict[str, float]
+    vitamins_per_100g: Dict[str, float]
+    minerals_per_100g: Dict[str, float]
+    calories_from_protein_per_100g: float
+    calories_from_carbs_per_100g: float
+    calories_from_fat_per_100g: float
+    calorie_accuracy: float  # % deviation of stated vs. Atwater calories
+    validation_errors: Tuple[str, ...]
+    quality: Dict[str, Any]  # macro ratios, score and ratio-based recommendations
+
 class CalorieCalculationService:
     """
     Realistic calorie calculation service using actual nutritional databases.
@@ -59,6 +131,19 @@ class CalorieCalculationService:
     
     def __init__(self):
         self.nutritional_database = self._load_nutritional_database()
+        self.food_profiles = {
+            name: self._build_food_profile(info) for name, info in self.nutritional_database.items()
+        }
+        # LRUs keyed on (canonical food name, weight rounded to 0.1g)
+        self._cached_precise_nutrition = lru_cache(maxsize=NUTRITION_CACHE_SIZE)(self._build_precise_nutrition)
+        self._cached_portion_validation = lru_cache(maxsize=NUTRITION_CACHE_SIZE)(self._build_portion_validation)
+        self._cached_portion_estimates = lru_cache(maxsize=NUTRITION_CACHE_SIZE)(self._build_portion_estimates)
+        # Per-100g nutrient matrix (foods × NUTRIENT_VECTOR_FIELDS) for vectorized meal totals
+        self.food_index = {name: i for i, name in enumerate(self.nutritional_database)}
+        self.nutrient_matrix = np.array([
+            [getattr(info, f'{field}_per_100g') for field in NUTRIENT_VECTOR_FIELDS]
+            for info in self.nutritional_database.values()
+        ], dtype=np.float64)
         self.usda_api_key = os.getenv('USDA_API_KEY', 'DEMO_KEY')
         self.usda_base_url = "https://api.nal.usda.gov/fdc/v1"
         
@@ -161,28 +246,91 @@ class CalorieCalculationService:
             'salt': NutritionalInfo('salt', 0, 0, 0, 0, 0, 2.2, 6, '1 tsp salt'),
         }
     
-    def estimate_portion_size(self, food_name: str, confidence: float, image_dimensions: Tuple[int, int] = (224, 224)) -> float:
+    def estimate_portion_size(self, food_name: str, confidence: float, image_dimensions: Tuple[int, int] = (224, 224),
+                              image_hash: Optional[str] = None, bbox: Optional[Tuple[float, float, float, float]] = None) -> float:
         """
         Estimate realistic portion size based on food type and confidence.
         Uses typical serving sizes and adjusts based on confidence.
+        Deterministic: see estimate_portion_sizes.
         """
-        if food_name not in self.nutritional_database:
-            return 100  # Default 100g if unknown
+        ingredient = {'name': food_name, 'confidence': confidence}
+        if bbox is not None:
+            ingredient['bbox'] = bbox
+        return float(self.estimate_portion_sizes([ingredient], image_dimensions, image_hash)[0])
+    
+    def estimate_portion_sizes(self, ingredients: List[Dict[str, Any]], image_dimensions: Tuple[int, int] = (224, 224),
+                               image_hash: Optional[str] = None) -> np.ndarray:
+        """
+        Estimate portion sizes (grams) for every detected ingredient in one pass.
         
-        food_info = self.nutritional_database[food_name]
-        typical_portion = food_info.typical_portion_size
+        Ingredients with a pixel 'bbox' ([x, y, width, height]) are sized from
+        image geometry: region area × assumed depth × food density. The rest use
+        the typical serving, scaled by confidence and by a variation seeded from
+        (image_hash, food name), so identical inputs always give identical output.
+        """
+        key = tuple(
+            (
+                self._canonical_food_name(str(ing.get('name', ''))),
+                round(float(ing.get('confidence', 0.5)), 4),
+                tuple(float(v) for v in ing['bbox']) if ing.get('bbox') is not None else None
+            )
+            for ing in ingredients
+        )
+        return self._cached_portion_estimates(key, tuple(image_dimensions), image_hash)
+    
+    def _build_portion_estimates(self, key: Tuple, image_dimensions: Tuple[int, int],
+                                 image_hash: Optional[str]) -> np.ndarray:
+        """Vectorized portion estimation over a canonical ingredient key."""
+        count = len(key)
+        if count == 0:
+            return np.zeros(0)
+        
+        known = np.array([name in self.nutritional_database for name, _, _ in key])
+        typical = np.array([
+            self.nutritional_database[name].typical_portion_size if name in self.nutritional_database else 100.0
+            for name, _, _ in key
+        ])
+        density = np.array([
+            self.nutritional_database[name].density if name in self.nutritional_database else 1.0
+            for name, _, _ in key
+        ])
+        confidence = np.array([conf for _, conf, _ in key])
         
         # Adjust portion size based on confidence
         # Higher confidence = more accurate portion estimation
         confidence_factor = 0.8 + (confidence * 0.4)  # Range: 0.8 to 1.2
         
-        # Add some realistic variation (±20%)
-        variation = np.random.normal(1.0, 0.1)  # Normal distribution around 1.0
-        variation = max(0.7, min(1.3, variation))  # Clamp between 0.7 and 1.3
-        
-        estimated_portion = typical_portion * confidence_factor * variation
-        
-        return max(10, estimated_portion)  # Minimum 10g
+        # Realistic variation, seeded per image and food instead of drawn per call
+        if image_hash:
+            uniforms = np.array([self._hash_uniforms(image_hash, name) for name, _, _ in key])
+            u1 = np.maximum(uniforms[:, 0], np.finfo(float).tiny)
+            variation = 1.0 + 0.1 * np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * uniforms[:, 1])
+            variation = np.clip(variation, 0.7, 1.3)
+        else:
+            variation = np.ones(count)
+        
+        estimates = typical * confidence_factor * variation
+        
+        # Geometry-based estimates where a region is known
+        has_bbox = np.array([bbox is not None for _, _, bbox in key])
+        if has_bbox.any():
+            image_width, image_height = image_dimensions
+            region_area = np.array([bbox[2] * bbox[3] if bbox is not None else 0.0 for _, _, bbox in key])
+            cm_per_px = PLATE_WIDTH_CM / image_width
+            volume_cm3 = region_area * cm_per_px ** 2 * FOOD_DEPTH_CM
+            geometric = np.clip(volume_cm3 * density, typical * 0.3, typical * 3)  # Same range as the portion slider
+            estimates = np.where(has_bbox, geometric, estimates)
+        
+        estimates = np.where(known, np.maximum(10, estimates), 100.0)  # Minimum 10g, 100g if unknown
+        estimates.setflags(write=False)
+        return estimates
+    
+    @staticmethod
+    def _hash_uniforms(image_hash: str, food_name: str) -> Tuple[float, float]:
+        """Two stable uniforms in [0, 1) derived from an image hash and food name."""
+        digest = hashlib.blake2b(f"{image_hash}:{food_name}".encode(), digest_size=16).digest()
+        scale = float(2 ** 64)
+        return (int.from_bytes(digest[:8], 'big') / scale, int.from_bytes(digest[8:], 'big') / scale)
     
     def calculate_calories(self, food_name: str, portion_size_g: float) -> Dict[str, Any]:
         """
@@ -201,6 +349,8 @@ class CalorieCalculationService:
         
         food_info = self.nutritional_database[food_name]
         
+        portion_size_g = float(portion_size_g)
+        
         # Calculate nutritional values based on portion size
         calories = (food_info.calories_per_100g * portion_size_g) / 100
         protein = (food_info.protein_per_100g * portion_size_g) / 100
@@ -220,11 +370,21 @@ class CalorieCalculationService:
             'density': food_info.density
         }
     
-    def calculate_precise_nutrition(self, food_name: str, confirmed_weight_g: float) -> Dict[str, Any]:
+    def calculate_precise_nutrition(self, food_name: str, confirmed_weight_g: float,
+                                    fields: Optional[Any] = None) -> Dict[str, Any]:
         """
         Calculate precise nutritional information with mathematical accuracy.
         Target: 90-95% accuracy for all calculations.
         Enhanced with detailed macro breakdowns and micronutrients.
+        
+        fields selects what to compute: a preset ('macros', 'full'), section
+        names from NUTRITION_SECTIONS, individual response keys, or a mix, as a
+        list or comma-separated string. Unrequested sections are never built.
+        Defaults to 'full'.
+        
+        Results are memoized on (canonical food name, weight rounded to 0.1g,
+        sections), so repeated slider updates for the same food are served
+        from the LRU.
         """
         # Input validation
         if not food_name or not isinstance(food_name, str):
@@ -257,7 +417,8 @@ class CalorieCalculationService:
                 'error': f'Weight too large: {confirmed_weight_g}g. Maximum 10kg allowed.'
             }
         
-        if food_name not in self.nutritional_database:
+        food_key = self._canonical_food_name(food_name)
+        if food_key not in self.food_profiles:
             return {
                 'calories': 0,
                 'protein': 0,
@@ -267,95 +428,218 @@ class CalorieCalculationService:
                 'error': f'Unknown food: {food_name}. Available foods: {list(self.nutritional_database.keys())[:5]}...'
             }
         
-        food_info = self.nutritional_database[food_name]
+        try:
+            sections, keys = self.resolve_nutrition_fields(fields)
+        except ValueError as e:
+            return {
+                'calories': 0,
+                'protein': 0,
+                'carbs': 0,
+                'fat': 0,
+                'fiber': 0,
+                'error': str(e)
+            }
         
-        # Precise mathematical calculations with high accuracy
-        # Base values per 100g
-        base_calories = food_info.calories_per_100g
-        base_protein = food_info.protein_per_100g
-        base_carbs = food_info.carbs_per_100g
-        base_fat = food_info.fat_per_100g
-        base_fiber = food_info.fiber_per_100g
-        
-        # Precise scaling formula: (base_per_100g * confirmed_weight_g) / 100
-        calories = (base_calories * confirmed_weight_g) / 100
-        protein = (base_protein * confirmed_weight_g) / 100
-        carbs = (base_carbs * confirmed_weight_g) / 100
-        fat = (base_fat * confirmed_weight_g) / 100
-        fiber = (base_fiber * confirmed_weight_g) / 100
+        nutrition = self._cached_precise_nutrition(food_key, self._canonical_weight(confirmed_weight_g), sections)
+        
+        # Hand out copies so callers can't mutate the cached entry
+        result = dict(nutrition)
+        for key in ('vitamins', 'minerals'):
+            if key in nutrition:
+                result[key] = dict(nutrition[key])
+        if 'nutritional_quality' in nutrition:
+            result['nutritional_quality'] = dict(nutrition['nutritional_quality'])
+            result['nutritional_quality']['recommendations'] = list(nutrition['nutritional_quality']['recommendations'])
+        if 'validation_errors' in nutrition:
+            result['validation_errors'] = list(nutrition['validation_errors'])
+        if 'meta' in sections:
+            result['timestamp'] = datetime.now().isoformat()
+        
+        if keys is not None:
+            result = {key: value for key, value in result.items() if key in keys}
+        return result
+    
+    def resolve_nutrition_fields(self, fields: Optional[Any]) -> Tuple[frozenset, Optional[frozenset]]:
+        """
+        Map a field selection to (sections to build, response keys to keep).
+        Keys is None when whole sections were requested.
+        """
+        if fields is None:
+            return FULL_NUTRITION_SECTIONS, None
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        
+        sections = set()
+        keys = set()
+        for field in (str(f).strip() for f in fields):
+            if not field:
+                continue
+            if field in NUTRITION_PRESETS:
+                sections.update(NUTRITION_PRESETS[field])
+                keys.update(key for section in NUTRITION_PRESETS[field] for key in NUTRITION_SECTIONS[section])
+            elif field in NUTRITION_SECTIONS:
+                sections.add(field)
+                keys.update(NUTRITION_SECTIONS[field])
+            elif field in NUTRITION_FIELD_SECTIONS:
+                sections.add(NUTRITION_FIELD_SECTIONS[field])
+                keys.add(field)
+            else:
+                raise ValueError(
+                    f"Unknown nutrition field: {field}. Use a preset ({', '.join(NUTRITION_PRESETS)}), "
+                    f"a section ({', '.join(NUTRITION_SECTIONS)}) or a response field"
+                )
+        
+        if not sections:
+            return FULL_NUTRITION_SECTIONS, None
+        
+        # Identify the item in every lean response
+        sections.add('portion')
+        keys.update(('food_name', 'portion_size_g'))
+        if keys.issuperset(key for section in sections for key in NUTRITION_SECTIONS[section]):
+            return frozenset(sections), None
+        return frozenset(sections), frozenset(keys)
+    
+    def _build_precise_nutrition(self, food_key: str, weight_g: float,
+                                 sections: frozenset = None) -> Dict[str, Any]:
+        """
+        Scale a precomputed food profile to the given weight.
+        Everything weight-independent lives on the FoodProfile, so this is
+        a scalar multiply per nutrient plus a few threshold checks. Only the
+        requested sections are computed.
+        """
+        sections = FULL_NUTRITION_SECTIONS if sections is None else sections
+        profile = self.food_profiles[food_key]
+        food_info = profile.food_info
+        factor = weight_g / 100
+        macros = profile.macros_per_100g
+        result = {}
+        
+        if 'macros' in sections:
+            result['calories'] = round(macros['calories'] * factor, 1)
+            for key in ('protein', 'carbs', 'fat', 'fiber'):
+                result[key] = round(macros[key] * factor, 2)
+        
+        if 'portion' in sections:
+            result['portion_size_g'] = round(weight_g, 1)
+            result['portion_description'] = food_info.portion_description
+            result['food_name'] = food_key
+            result['density'] = food_info.density
+        
+        needs_energy = 'energy' in sections or 'validation' in sections
+        if needs_energy:
+            calories_from_protein = profile.calories_from_protein_per_100g * factor
+            calories_from_carbs = profile.calories_from_carbs_per_100g * factor
+            calories_from_fat = profile.calories_from_fat_per_100g * factor
+            total_calculated_calories = calories_from_protein + calories_from_carbs + calories_from_fat
+        
+        if 'energy' in sections:
+            result['calorie_accuracy'] = round(profile.calorie_accuracy, 2)
+            result['calories_from_protein'] = round(calories_from_protein, 1)
+            result['calories_from_carbs'] = round(calories_from_carbs, 1)
+            result['calories_from_fat'] = round(calories_from_fat, 1)
+            result['total_calculated_calories'] = round(total_calculated_calories, 1)
         
         # Enhanced macro breakdowns
-        sugar = (food_info.sugar_per_100g * confirmed_weight_g) / 100
-        saturated_fat = (food_info.saturated_fat_per_100g * confirmed_weight_g) / 100
-        monounsaturated_fat = (food_info.monounsaturated_fat_per_100g * confirmed_weight_g) / 100
-        polyunsaturated_fat = (food_info.polyunsaturated_fat_per_100g * confirmed_weight_g) / 100
-        trans_fat = (food_info.trans_fat_per_100g * confirmed_weight_g) / 100
-        cholesterol = (food_info.cholesterol_per_100g * confirmed_weight_g) / 100
-        sodium = (food_info.sodium_per_100g * confirmed_weight_g) / 100
-        potassium = (food_info.potassium_per_100g * confirmed_weight_g) / 100
-        
-        # Calculate additional nutrients for precision
-        calories_from_protein = protein * 4
-        calories_from_carbs = carbs * 4
-        calories_from_fat = fat * 9
+        if 'macro_breakdown' in sections:
+            for key in NUTRITION_SECTIONS['macro_breakdown']:
+                result[key] = round(macros[key] * factor, 2)
+        
+        # Detailed micronutrients
+        if 'vitamins' in sections or 'nutritional_quality' in sections:
+            vitamins = {key: round(value * factor, VITAMIN_DIGITS.get(key, 2))
+                        for key, value in profile.vitamins_per_100g.items()}
+        if 'minerals' in sections or 'nutritional_quality' in sections:
+            minerals = {key: round(value * factor, 2) for key, value in profile.minerals_per_100g.items()}
+        if 'vitamins' in sections:
+            result['vitamins'] = vitamins
+        if 'minerals' in sections:
+            result['minerals'] = minerals
+        
+        # Nutritional quality assessment
+        if 'nutritional_quality' in sections:
+            nutritional_quality = dict(profile.quality)
+            nutritional_quality['recommendations'] = (
+                profile.quality['recommendations'] + self._micronutrient_recommendations(vitamins, minerals)
+            )
+            result['nutritional_quality'] = nutritional_quality
+        
+        # Validation and error handling
+        if 'validation' in sections:
+            calories = macros['calories'] * factor
+            
+            # Ratio-based checks were resolved when the profile was built
+            validation_errors = list(profile.validation_errors)
+            if calories > 1000:  # Unusually high calories
+                validation_errors.append(f"Unusually high calorie count: {calories:.1f}")
+            
+            # Check for mathematical precision
+            if abs(calories - total_calculated_calories) > 1:
+                validation_errors.append("Calorie calculation precision issue")
+            
+            result['validation_errors'] = validation_errors
+            result['calculation_quality'] = 'excellent' if not validation_errors else 'needs_review'
+        
+        return result
+    
+    def _build_food_profile(self, food_info: NutritionalInfo) -> FoodProfile:
+        """Derive the weight-independent nutrition profile for one food."""
+        macros = {key: getattr(food_info, f'{key}_per_100g') for key in MACRO_NUTRIENTS}
+        vitamins = {key: getattr(food_info, f'{key}_per_100g') for key in VITAMIN_NUTRIENTS}
+        minerals = {key: getattr(food_info, f'{key}_per_100g') for key in MINERAL_NUTRIENTS}
+        
+        calories = macros['calories']
+        calories_from_protein = macros['protein'] * 4
+        calories_from_carbs = macros['carbs'] * 4
+        calories_from_fat = macros['fat'] * 9
         total_calculated_calories = calories_from_protein + calories_from_carbs + calories_from_fat
         
-        # Validation: ensure calculated calories match expected
+        # Deviation is a ratio, so it's the same at every weight
         calorie_accuracy = abs(calories - total_calculated_calories) / calories * 100 if calories > 0 else 0
         
-        # Additional validation checks
         validation_errors = []
         if calorie_accuracy > 5:  # More than 5% deviation
             validation_errors.append(f"Calorie calculation deviation: {calorie_accuracy:.1f}%")
         
-        if protein < 0 or carbs < 0 or fat < 0 or fiber < 0:
+        if macros['protein'] < 0 or macros['carbs'] < 0 or macros['fat'] < 0 or macros['fiber'] < 0:
             validation_errors.append("Negative nutrient values detected")
         
-        if calories > 1000:  # Unusually high calories
-            validation_errors.append(f"Unusually high calorie count: {calories:.1f}")
-        
-        # Check for mathematical precision
-        if abs(calories - total_calculated_calories) > 1:
-            validation_errors.append("Calorie calculation precision issue")
-        
-        # Calculate detailed micronutrients
-        vitamins = self._calculate_vitamins(food_info, confirmed_weight_g)
-        minerals = self._calculate_minerals(food_info, confirmed_weight_g)
-        
-        return {
-            'calories': round(calories, 1),
-            'protein': round(protein, 2),
-            'carbs': round(carbs, 2),
-            'fat': round(fat, 2),
-            'fiber': round(fiber, 2),
-            'portion_size_g': round(confirmed_weight_g, 1),
-            'portion_description': food_info.portion_description,
-            'food_name': food_name,
-            'density': food_info.density,
-            'calorie_accuracy': round(calorie_accuracy, 2),
-            'calories_from_protein': round(calories_from_protein, 1),
-            'calories_from_carbs': round(calories_from_carbs, 1),
-            'calories_from_fat': round(calories_from_fat, 1),
-            'total_calculated_calories': round(total_calculated_calories, 1),
-            # Enhanced macro breakdowns
-            'sugar': round(sugar, 2),
-            'saturated_fat': round(saturated_fat, 2),
-            'monounsaturated_fat': round(monounsaturated_fat, 2),
-            'polyunsaturated_fat': round(polyunsaturated_fat, 2),
-            'trans_fat': round(trans_fat, 2),
-            'cholesterol': round(cholesterol, 2),
-            'sodium': round(sodium, 2),
-            'potassium': round(potassium, 2),
-            # Detailed micronutrients
-            'vitamins': vitamins,
-            'minerals': minerals,
-            # Nutritional quality assessment
-            'nutritional_quality': self._assess_nutritional_quality(calories, protein, carbs, fat, fiber, vitamins, minerals),
-            # Validation and error handling
-            'validation_errors': validation_errors,
-            'calculation_quality': 'excellent' if not validation_errors else 'needs_review',
-            'timestamp': datetime.now().isoformat()
-        }
+        return FoodProfile(
+            food_info=food_info,
+            macros_per_100g=macros,
+            vitamins_per_100g=vitamins,
+            minerals_per_100g=minerals,
+            calories_from_protein_per_100g=calories_from_protein,
+            calories_from_carbs_per_100g=calories_from_carbs,
+            calories_from_fat_per_100g=calories_from_fat,
+            calorie_accuracy=calorie_accuracy,
+            validation_errors=tuple(validation_errors),
+            quality=self._assess_food_quality(
+                calories, macros['protein'], macros['carbs'], macros['fat'], macros['fiber']
+            )
+        )
+    
+    @staticmethod
+    def _canonical_food_name(food_name: str) -> str:
+        """Normalize a food name to its nutritional database key."""
+        return food_name.strip().lower().replace(' ', '_').replace('-', '_')
+    
+    @staticmethod
+    def _canonical_weight(weight_g: float) -> float:
+        """Round a weight to the 0.1g resolution used for cache keys and output."""
+        return round(float(weight_g), 1) or float(weight_g)
+    
+    def meal_nutrient_vector(self, ingredients: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Total nutrients of a meal as a vector ordered like NUTRIENT_VECTOR_FIELDS.
+        Each ingredient needs a 'name' and a 'weight_g' (or 'portion_size_g');
+        unknown foods contribute nothing.
+        """
+        weights = np.zeros(len(self.food_index))
+        for ingredient in ingredients:
+            index = self.food_index.get(self._canonical_food_name(str(ingredient.get('name', ''))))
+            if index is not None:
+                weights[index] += float(ingredient.get('weight_g', ingredient.get('portion_size_g', 0)) or 0)
+        return weights @ self.nutrient_matrix / 100
     
     def scale_nutrients(self, base_nutrition: Dict[str, Any], scale_factor: float) -> Dict[str, Any]:
         """
@@ -376,11 +660,15 @@ class CalorieCalculationService:
         Validate portion size against typical serving sizes.
         Returns validation results and recommendations.
         """
-        if food_name not in self.nutritional_database:
+        food_key = self._canonical_food_name(food_name) if isinstance(food_name, str) else food_name
+        if food_key not in self.food_profiles:
             return {'valid': False, 'error': 'Unknown food'}
         
-        food_info = self.nutritional_database[food_name]
-        typical_portion = food_info.typical_portion_size
+        return dict(self._cached_portion_validation(food_key, self._canonical_weight(weight_g)))
+    
+    def _build_portion_validation(self, food_key: str, weight_g: float) -> Dict[str, Any]:
+        """Compare a weight against the food's typical serving size."""
+        typical_portion = self.food_profiles[food_key].food_info.typical_portion_size
         
         # Calculate deviation from typical portion
         deviation = abs(weight_g - typical_portion) / typical_portion * 100
@@ -404,33 +692,24 @@ class CalorieCalculationService:
     def _calculate_vitamins(self, food_info: NutritionalInfo, weight_g: float) -> Dict[str, float]:
         """Calculate detailed vitamin content for the given weight."""
         return {
-            'vitamin_c': round((food_info.vitamin_c_per_100g * weight_g) / 100, 2),
-            'vitamin_a': round((food_info.vitamin_a_per_100g * weight_g) / 100, 2),
-            'vitamin_e': round((food_info.vitamin_e_per_100g * weight_g) / 100, 2),
-            'vitamin_k': round((food_info.vitamin_k_per_100g * weight_g) / 100, 2),
-            'thiamine': round((food_info.thiamine_per_100g * weight_g) / 100, 3),
-            'riboflavin': round((food_info.riboflavin_per_100g * weight_g) / 100, 3),
-            'niacin': round((food_info.niacin_per_100g * weight_g) / 100, 3),
-            'folate': round((food_info.folate_per_100g * weight_g) / 100, 2)
+            key: round((getattr(food_info, f'{key}_per_100g') * weight_g) / 100, VITAMIN_DIGITS.get(key, 2))
+            for key in VITAMIN_NUTRIENTS
         }
     
     def _calculate_minerals(self, food_info: NutritionalInfo, weight_g: float) -> Dict[str, float]:
         """Calculate detailed mineral content for the given weight."""
         return {
-            'calcium': round((food_info.calcium_per_100g * weight_g) / 100, 2),
-            'iron': round((food_info.iron_per_100g * weight_g) / 100, 2),
-            'magnesium': round((food_info.magnesium_per_100g * weight_g) / 100, 2),
-            'phosphorus': round((food_info.phosphorus_per_100g * weight_g) / 100, 2),
-            'zinc': round((food_info.zinc_per_100g * weight_g) / 100, 2),
-            'copper': round((food_info.copper_per_100g * weight_g) / 100, 2),
-            'manganese': round((food_info.manganese_per_100g * weight_g) / 100, 2),
-            'selenium': round((food_info.selenium_per_100g * weight_g) / 100, 2)
+            key: round((getattr(food_info, f'{key}_per_100g') * weight_g) / 100, 2)
+            for key in MINERAL_NUTRIENTS
         }
     
-    def _assess_nutritional_quality(self, calories: float, protein: float, carbs: float, 
-                                   fat: float, fiber: float, vitamins: Dict[str, float], 
-                                   minerals: Dict[str, float]) -> Dict[str, Any]:
-        """Assess the nutritional quality of the food item."""
+    def _assess_food_quality(self, calories: float, protein: float, carbs: float,
+                             fat: float, fiber: float) -> Dict[str, Any]:
+        """
+        Assess the nutritional quality of a food item.
+        Every input is used as a ratio, so per-100g values give the same
+        result as any other weight.
+        """
         
         # Calculate macro percentages
         total_calories = calories
@@ -496,10 +775,6 @@ class CalorieCalculationService:
             recommendations.append("Consider reducing fat intake")
         if fiber_per_100_calories < 2:
             recommendations.append("Increase fiber intake")
-        if vitamins['vitamin_c'] < 10:
-            recommendations.append("Add vitamin C rich foods")
-        if minerals['iron'] < 2:
-            recommendations.append("Consider iron-rich foods")
         
         return {
             'quality_score': round(quality_score, 1),
@@ -511,10 +786,23 @@ class CalorieCalculationService:
             'recommendations': recommendations
         }
     
-    def analyze_meal_calories(self, ingredients: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _micronutrient_recommendations(self, vitamins: Dict[str, float],
+                                       minerals: Dict[str, float]) -> List[str]:
+        """Weight-dependent recommendations based on absolute micronutrient amounts."""
+        recommendations = []
+        if vitamins['vitamin_c'] < 10:
+            recommendations.append("Add vitamin C rich foods")
+        if minerals['iron'] < 2:
+            recommendations.append("Consider iron-rich foods")
+        return recommendations
+    
+    def analyze_meal_calories(self, ingredients: List[Dict[str, Any]], image_dimensions: Tuple[int, int] = (224, 224),
+                              image_hash: Optional[str] = None) -> Dict[str, Any]:
         """
         Analyze complete meal calories and nutritional breakdown.
         Provides realistic, accurate nutritional analysis.
+        Portion sizes are estimated for all ingredients at once and are
+        deterministic for a given image_hash.
         """
         total_calories = 0
         total_protein = 0
@@ -525,13 +813,13 @@ class CalorieCalculationService:
         
         detailed_breakdown = []
         
-        for ingredient in ingredients:
-            food_name = ingredient.get('name', '').lower()
+        # Estimate portion sizes for the whole meal
+        portion_sizes = self.estimate_portion_sizes(ingredients, image_dimensions, image_hash)
+        
+        for ingredient, portion_size in zip(ingredients, portion_sizes):
+            food_name = self._canonical_food_name(ingredient.get('name', ''))
             confidence = ingredient.get('confidence', 0.5)
             
-            # Estimate portion size
-            portion_size = self.estimate_portion_size(food_name, confidence)
-            
             # Calculate nutritional values
             nutrition = self.calculate_calories(food_name, portion_size)
             
@@ -637,6 +925,69 @@ class CalorieCalculationService:
             'recommendations': recommendations
         }
     
+    def recommend_foods_for_gaps(self, intake: Dict[str, float], targets: Optional[Dict[str, float]] = None,
+                                 max_foods: int = 5) -> Dict[str, Any]:
+        """
+        Find a small set of foods and portions that best closes the gap
+        between logged intake and daily targets.
+        
+        Solved as bounded least squares over the food × nutrient matrix:
+        minimize ||(A·x - gap) / target||² with 0 <= x <= two typical portions,
+        then re-solved on the max_foods foods with the largest contribution.
+        """
+        # scipy.optimize is slow to import and only this path needs it (food_service warms it at startup)
+        from scipy.optimize import lsq_linear
+        
+        targets = targets or DAILY_TARGETS
+        fields = [field for field in NUTRIENT_VECTOR_FIELDS if targets.get(field)]
+        columns = [NUTRIENT_VECTOR_FIELDS.index(field) for field in fields]
+        target = np.array([targets[field] for field in fields], dtype=np.float64)
+        consumed = np.array([intake.get(field, 0.0) for field in fields], dtype=np.float64)
+        gap = np.maximum(target - consumed, 0.0)
+        
+        gaps = {field: round(float(value), 2) for field, value in zip(fields, gap) if value > 0}
+        if not gaps:
+            return {'gaps': {}, 'recommended_foods': [], 'remaining_gaps': {}}
+        
+        # Relative units, so a 10mg iron gap weighs as much as a 500kcal one
+        design = (self.nutrient_matrix[:, columns] / target).T  # nutrients × foods, per 100g
+        goal = gap / target
+        upper = np.array([
+            info.typical_portion_size * 2 / 100 for info in self.nutritional_database.values()
+        ])
+        
+        solution = lsq_linear(design, goal, bounds=(0, upper), method='bvls')
+        chosen = np.argsort(solution.x)[::-1][:max_foods]
+        chosen = chosen[solution.x[chosen] > 1e-3]
+        
+        portions = np.zeros(len(upper))
+        if len(chosen):
+            refit = lsq_linear(design[:, chosen], goal, bounds=(0, upper[chosen]), method='bvls')
+            portions[chosen] = refit.x
+        
+        food_names = list(self.nutritional_database)
+        recommended_foods = []
+        for index in chosen:
+            if portions[index] * 100 < 5:  # Skip negligible portions (and leave them out of the remaining gaps)
+                portions[index] = 0.0
+                continue
+            contribution = self.nutrient_matrix[index, columns] * portions[index]
+            recommended_foods.append({
+                'food_name': food_names[index],
+                'portion_g': round(float(portions[index] * 100), 1),
+                'portion_description': self.nutritional_database[food_names[index]].portion_description,
+                'closes': {
+                    field: round(float(amount), 2) for field, amount in zip(fields, contribution) if field in gaps and amount > 0
+                }
+            })
+        
+        remaining = gap - self.nutrient_matrix[:, columns].T @ portions
+        return {
+            'gaps': gaps,
+            'recommended_foods': recommended_foods,
+            'remaining_gaps': {field: round(float(value), 2) for field, value in zip(fields, remaining) if value > 0}
+        }
+    
     def _generate_dietary_recommendations(self, calories: float, protein: float, carbs: float, fat: float) -> List[str]:
         """Generate realistic dietary recommendations"""
         recommendations = []
@@ -1,6 +1,7 @@
 import os
 import io
 import base64
+import hashlib
 import logging
 import requests
 from typing import Dict, List, Any, Optional
@@ -255,7 +256,15 @@ class FoodClassificationService:
         nutritional_analysis = self._analyze_nutritional_content(result['ingredients'])
         
         # Calculate realistic calories and nutritional breakdown
-        calorie_analysis = calorie_calculator.analyze_meal_calories(result['ingredients'])
+        # Seed portion estimation with the image so the same photo always gives the same result
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        try:
+            image_dimensions = Image.open(io.BytesIO(image_bytes)).size
+        except Exception:
+            image_dimensions = (224, 224)
+        calorie_analysis = calorie_calculator.analyze_meal_calories(
+            result['ingredients'], image_dimensions=image_dimensions, image_hash=image_hash
+        )
         
         # Generate meal suggestions
         meal_suggestions = self._generate_meal_suggestions(result['ingredients'])
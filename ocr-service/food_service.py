@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi.responses import ORJSONResponse
 from typing import Optional, List, Dict, Any
 import base64
 import io
@@ -10,12 +11,16 @@ import json
 from datetime import datetime
 from food_classification_service import food_classifier
 from calorie_calculation_service import calorie_calculator
+from nutrition_ledger import NutritionLedger, PERIODS
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Food Classification Service", version="1.0.0")
+app = FastAPI(title="Food Classification Service", version="1.0.0", default_response_class=ORJSONResponse)
+
+# Per-user daily/weekly/monthly nutrient rollups
+nutrition_ledger = NutritionLedger()
 
 # Configure CORS
 from fastapi.middleware.cors import CORSMiddleware
@@ -27,6 +32,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_gap_recommender():
+    """Solve one gap recommendation, so the first /log-meal or /nutrient-gaps call doesn't import scipy.optimize"""
+    calorie_calculator.recommend_foods_for_gaps({})
+
+@app.on_event("shutdown")
+async def snapshot_nutrition_ledger():
+    """Snapshot the rollups so the next startup doesn't replay meals logged since the last one"""
+    nutrition_ledger.save_snapshot()
+
 @app.post("/classify-food")
 async def classify_food_image(
     file: UploadFile = File(...), 
@@ -166,15 +181,18 @@ async def update_portion_size(request: Dict[str, Any]):
     Update portion size and recalculate precise nutrition.
     
     Args:
-        request: Dictionary containing food_name, new_weight_g, original_weight_g
+        request: Dictionary containing food_name, new_weight_g, original_weight_g and optional
+                 fields (preset 'macros'|'full', section names or response keys; list or comma-separated)
         
     Returns:
-        Precise nutritional information with mathematical accuracy
+        Precise nutritional information with mathematical accuracy.
+        Lean selections skip the unrequested sections, including portion validation.
     """
     try:
         food_name = request.get('food_name')
         new_weight_g = request.get('new_weight_g')
         original_weight_g = request.get('original_weight_g')
+        fields = request.get('fields')
         
         if not all([food_name, new_weight_g, original_weight_g]):
             raise HTTPException(
@@ -188,28 +206,37 @@ async def update_portion_size(request: Dict[str, Any]):
                 detail="New weight must be greater than 0"
             )
         
-        # Calculate precise nutrition with new weight
-        precise_nutrition = calorie_calculator.calculate_precise_nutrition(food_name, new_weight_g)
+        try:
+            sections, _ = calorie_calculator.resolve_nutrition_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Validate portion size
-        validation = calorie_calculator.validate_portion_size(food_name, new_weight_g)
+        # Calculate precise nutrition with new weight
+        precise_nutrition = calorie_calculator.calculate_precise_nutrition(food_name, new_weight_g, fields)
         
         # Calculate weight change metrics
         weight_change_g = new_weight_g - original_weight_g
         weight_change_percent = (weight_change_g / original_weight_g) * 100
         
-        return {
+        response = {
             "success": True,
             "food_name": food_name,
             "original_weight_g": original_weight_g,
             "updated_weight_g": new_weight_g,
             "weight_change_g": round(weight_change_g, 1),
             "weight_change_percent": round(weight_change_percent, 1),
-            "precise_nutrition": precise_nutrition,
-            "validation": validation,
-            "timestamp": datetime.now().isoformat()
+            "precise_nutrition": precise_nutrition
         }
         
+        # Validate portion size
+        if 'validation' in sections:
+            response["validation"] = calorie_calculator.validate_portion_size(food_name, new_weight_g)
+        if 'meta' in sections:
+            response["timestamp"] = datetime.now().isoformat()
+        
+        # Plain dicts of primitives: hand straight to orjson, skipping jsonable_encoder
+        return ORJSONResponse(response)
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -218,6 +245,111 @@ async def update_portion_size(request: Dict[str, Any]):
             detail=f"Failed to update portion size: {str(e)}"
         )
 
+@app.post("/log-meal")
+async def log_meal(request: Dict[str, Any]):
+    """
+    Log an eaten meal into the user's nutrition ledger.
+    
+    Args:
+        request: Dictionary containing user_id, ingredients ([{name, weight_g}]), optional date (YYYY-MM-DD)
+                 and optional daily_targets ({nutrient: amount})
+        
+    Returns:
+        Nutrient totals of the logged meal and foods that close the day's remaining gaps
+    """
+    try:
+        user_id = request.get('user_id')
+        ingredients = request.get('ingredients')
+        
+        if not user_id or not ingredients:
+            raise HTTPException(
+                status_code=400,
+                detail="Missing required fields: user_id, ingredients"
+            )
+        
+        try:
+            meal_nutrients = nutrition_ledger.log_meal(user_id, ingredients, request.get('date'))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid meal: {str(e)}")
+        
+        # Close what's left of today's targets
+        day_totals = nutrition_ledger.get_summary(user_id, 'day', request.get('date'))['totals']
+        gap_analysis = calorie_calculator.recommend_foods_for_gaps(day_totals, request.get('daily_targets'))
+        
+        return {
+            "success": True,
+            "user_id": user_id,
+            "meal_nutrients": meal_nutrients,
+            "gap_analysis": gap_analysis,
+            "timestamp": datetime.now().isoformat()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to log meal: {str(e)}"
+        )
+
+@app.get("/nutrition-summary/{user_id}")
+async def get_nutrition_summary(user_id: str, period: str = "day", date: Optional[str] = None):
+    """
+    Get a user's nutrient totals for the day, week or month containing date.
+    Served from incrementally maintained rollups.
+    """
+    if period not in PERIODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid period: {period}. Expected one of {', '.join(PERIODS)}"
+        )
+    
+    try:
+        summary = nutrition_ledger.get_summary(user_id, period, date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+    
+    return {
+        "success": True,
+        **summary
+    }
+
+@app.post("/nutrient-gaps/{user_id}")
+async def get_nutrient_gaps(user_id: str, request: Optional[Dict[str, Any]] = None):
+    """
+    Recommend foods and portions that close the gap between a user's logged
+    intake for the day and their daily targets.
+    
+    Args:
+        user_id: User whose ledger is analysed
+        request: Optional dictionary with date (YYYY-MM-DD), daily_targets ({nutrient: amount}) and max_foods
+        
+    Returns:
+        Remaining nutrient gaps and recommended foods
+    """
+    request = request or {}
+    try:
+        day_totals = nutrition_ledger.get_summary(user_id, 'day', request.get('date'))['totals']
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+    
+    try:
+        gap_analysis = calorie_calculator.recommend_foods_for_gaps(
+            day_totals, request.get('daily_targets'), max_foods=int(request.get('max_foods', 5))
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to analyse nutrient gaps: {str(e)}"
+        )
+    
+    return {
+        "success": True,
+        "user_id": user_id,
+        "intake": day_totals,
+        **gap_analysis
+    }
+
 @app.get("/test")
 async def test_classification():
     """Test endpoint with sample food classification"""
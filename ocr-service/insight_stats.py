@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Insight Statistics
+Running aggregates over a user's whole meal history (meal-type and
+ingredient counts, rating and cooking-time totals) plus the short recent
+windows the recommendations look at, so user insights are read from
+counters instead of recomputed over every meal.
+"""
+
+import heapq
+import numpy as np
+from collections import deque
+from typing import Dict, List, Deque, Iterable, Any, Optional
+from meal_history import MealHistory, INGREDIENTS, MEAL_TYPES, MISSING
+
+# Windows and sizes used by the insights
+RECENT_TYPES_WINDOW = 14  # Meals checked for breakfast/snack habits
+RECENT_INGREDIENTS_WINDOW = 20  # Meals checked for ingredient diversity
+TOP_INGREDIENTS = 10
+# Meals needed before recommendations are made
+MIN_RECOMMENDATION_MEALS = 11
+
+class InsightStats:
+    """
+    Whole-history counters kept in first-occurrence order, so ranking them
+    (stable, by count) breaks ties exactly like Counter.most_common() over
+    the history would.
+    """
+
+    def __init__(self):
+        self.meal_count = 0
+        self.meal_type_counts: Dict[str, int] = {}
+        self.rating_sum = 0.0
+        self.rating_count = 0
+        self.ingredient_counts: Dict[str, int] = {}
+        self.cooking_times: Dict[str, List[int]] = {}  # meal type -> [sum, count, min, max]
+
+        self._recent_types: Deque[str] = deque(maxlen=RECENT_TYPES_WINDOW)
+        self._recent_ingredients: Deque[List[str]] = deque()
+        self._recent_ingredient_counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_history(cls, history: MealHistory) -> 'InsightStats':
+        """Aggregate a loaded history in a few vectorized passes over its columns."""
+        stats = cls()
+        stats.meal_count = len(history)
+
+        codes, first, counts = np.unique(history.meal_types, return_index=True, return_counts=True)
+        for i in np.argsort(first):
+            stats.meal_type_counts[MEAL_TYPES.names[codes[i]]] = int(counts[i])
+
+        ratings = history.ratings
+        rated = ratings[~np.isnan(ratings) & (ratings != 0)]
+        # Summed in meal order, as observe() would, so totals (and ETags) survive a reload bit for bit
+        stats.rating_sum, stats.rating_count = float(sum(rated.tolist())), len(rated)
+
+        ids, first, counts = np.unique(history.ingredient_ids(), return_index=True, return_counts=True)
+        for i in np.argsort(first):
+            stats.ingredient_counts[INGREDIENTS.names[ids[i]]] = int(counts[i])
+
+        prep_times = history.prep_times
+        timed = (prep_times != MISSING) & (prep_times != 0)
+        meal_types, times = history.meal_types[timed], prep_times[timed]
+        codes, first = np.unique(meal_types, return_index=True)
+        for code in codes[np.argsort(first)]:
+            type_times = times[meal_types == code]
+            stats.cooking_times[MEAL_TYPES.names[code]] = [
+                int(type_times.sum()), len(type_times), int(type_times.min()), int(type_times.max())
+            ]
+
+        for meal in history[-max(RECENT_TYPES_WINDOW, RECENT_INGREDIENTS_WINDOW):]:
+            stats._observe_recent(meal)
+        return stats
+
+    def observe_many(self, meals: Iterable[Any]):
+        for meal in meals:
+            self.observe(meal)
+
+    def observe(self, meal):
+        """Add one meal (a MealRecord) to every counter and window."""
+        self.meal_count += 1
+        self.meal_type_counts[meal.meal_type] = self.meal_type_counts.get(meal.meal_type, 0) + 1
+        if meal.rating:
+            self.rating_sum += meal.rating
+            self.rating_count += 1
+        for ingredient in meal.ingredients:
+            self.ingredient_counts[ingredient] = self.ingredient_counts.get(ingredient, 0) + 1
+        if meal.prep_time:
+            times = self.cooking_times.get(meal.meal_type)
+            if times is None:
+                self.cooking_times[meal.meal_type] = [meal.prep_time, 1, meal.prep_time, meal.prep_time]
+            else:
+                times[0] += meal.prep_time
+                times[1] += 1
+                times[2] = min(times[2], meal.prep_time)
+                times[3] = max(times[3], meal.prep_time)
+        self._observe_recent(meal)
+
+    def _observe_recent(self, meal):
+        self._recent_types.append(meal.meal_type)
+        ingredients = list(meal.ingredients)
+        self._recent_ingredients.append(ingredients)
+        for ingredient in ingredients:
+            self._recent_ingredient_counts[ingredient] = self._recent_ingredient_counts.get(ingredient, 0) + 1
+        if len(self._recent_ingredients) > RECENT_INGREDIENTS_WINDOW:
+            for ingredient in self._recent_ingredients.popleft():
+                remaining = self._recent_ingredient_counts[ingredient] - 1
+                if remaining:
+                    self._recent_ingredient_counts[ingredient] = remaining
+                else:
+                    del self._recent_ingredient_counts[ingredient]
+
+    def favorite_meal_type(self) -> Optional[str]:
+        return max(self.meal_type_counts, key=self.meal_type_counts.get) if self.meal_type_counts else None
+
+    def average_rating(self) -> float:
+        """Mean of the nonzero ratings (NaN without any, like np.mean of an empty list)."""
+        return self.rating_sum / self.rating_count if self.rating_count else float('nan')
+
+    def most_used_ingredients(self) -> List[tuple]:
+        return heapq.nlargest(TOP_INGREDIENTS, self.ingredient_counts.items(), key=lambda item: item[1])
+
+    def cooking_time_analysis(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            meal_type: {
+                "average_time": total / count,
+                "preferred_range": f"{shortest}-{longest} minutes"
+            }
+            for meal_type, (total, count, shortest, longest) in self.cooking_times.items()
+        }
+
+    def recommendations(self) -> List[str]:
+        """Personalized recommendations for improvement"""
+        recommendations = []
+        if self.meal_count < MIN_RECOMMENDATION_MEALS:
+            return recommendations
+
+        if self._recent_types.count('breakfast') < 10:
+            recommendations.append("Try to include breakfast more regularly for better nutrition balance")
+
+        if self._recent_types.count('snack') > 10:
+            recommendations.append("Consider reducing snacks and focus on balanced main meals")
+
+        # Check ingredient diversity
+        if len(self._recent_ingredient_counts) < 30:
+            recommendations.append("Try to diversify your ingredients for better nutrition")
+
+        return recommendations
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Meal History
+Compact per-user meal history: one set of NumPy columns per user instead of a
+Python object (plus a list of ingredient strings) per meal. Ingredient and
+meal-type names are interned process-wide to small integer ids and dates are
+stored as day ordinals.
+"""
+
+import sys
+import threading
+import numpy as np
+from datetime import date
+from dataclasses import dataclass, fields
+from typing import Dict, List, Iterator, Optional, Tuple, Union
+
+def _slotted(cls):
+    """
+    Rebuild a dataclass with __slots__ for its fields, as dataclass(slots=True)
+    does on Python 3.10+ (the service still runs on 3.9).
+    """
+    names = tuple(field.name for field in fields(cls))
+    namespace = {key: value for key, value in cls.__dict__.items() if key not in names + ('__dict__', '__weakref__')}
+    namespace['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+@_slotted
+@dataclass
+class MealRecord:
+    """Individual meal consumption record"""
+    user_id: str
+    meal_name: str
+    ingredients: List[str]
+    meal_type: str  # breakfast, lunch, dinner, snack
+    date: str
+    rating: Optional[float] = None  # 1-5 stars if provided
+    prep_time: Optional[int] = None
+    cost: Optional[float] = None
+    calories: Optional[int] = None
+    enjoyed: Optional[bool] = None  # did they finish it?
+
+class Vocabulary:
+    """Process-wide string <-> id interning table (ids are never reused)."""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self._lock = threading.Lock()
+
+    def intern(self, name: str) -> int:
+        index = self.ids.get(name)
+        if index is None:
+            with self._lock:
+                index = self.ids.get(name)
+                if index is None:
+                    index = len(self.names)
+                    self.names.append(sys.intern(name))
+                    self.ids[self.names[index]] = index
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+INGREDIENTS = Vocabulary()
+MEAL_TYPES = Vocabulary()
+
+# Sentinels for missing optional values in the integer columns
+MISSING = -1
+
+def _date_ordinal(value: str) -> int:
+    """Day ordinal of an ISO date string, or MISSING if it isn't one."""
+    try:
+        parsed = date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return MISSING
+    return parsed.toordinal() if len(value) == 10 else MISSING
+
+class MealHistory:
+    """
+    One user's meals in arrival order, as growable struct-of-arrays columns.
+
+    Ingredients of all meals share one flat id array delimited by `offsets`
+    (meal i owns ids[offsets[i]:offsets[i + 1]]). Indexing or iterating
+    yields MealRecords rebuilt on demand; analytics read the columns directly.
+
+    Histories only ever grow, and growing reallocates rather than resizes, so
+    `view()` can hand out an O(1) read-only snapshot that shares the buffers.
+    """
+
+    __slots__ = ('user_id', '_size', '_ingredient_size', '_ingredient_ids', '_offsets', '_meal_types',
+                 '_dates', '_ratings', '_prep_times', '_costs', '_calories', '_enjoyed',
+                 '_names', '_raw_dates', '_frozen')
+
+    def __init__(self, capacity: int = 8):
+        self.user_id: Optional[str] = None
+        self._size = 0
+        self._ingredient_size = 0
+        self._ingredient_ids = np.empty(capacity * 8, dtype=np.int32)
+        self._offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self._meal_types = np.empty(capacity, dtype=np.int16)
+        self._dates = np.empty(capacity, dtype=np.int32)
+        self._ratings = np.empty(capacity, dtype=np.float64)  # NaN if unrated
+        self._prep_times = np.empty(capacity, dtype=np.int32)  # MISSING if unknown
+        self._costs = np.empty(capacity, dtype=np.float64)  # NaN if unknown
+        self._calories = np.empty(capacity, dtype=np.int32)  # MISSING if unknown
+        self._enjoyed = np.empty(capacity, dtype=np.int8)  # MISSING, 0 or 1
+        self._names: List[str] = []
+        self._raw_dates: Dict[int, str] = {}  # Dates that aren't plain ISO days, by meal index
+        self._frozen = False
+
+    @classmethod
+    def from_records(cls, meal_records: List[MealRecord]) -> 'MealHistory':
+        history = cls(capacity=max(8, len(meal_records)))
+        history.extend(meal_records)
+        return history
+
+    # Sequence protocol (records are rebuilt on access)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self._record(i) for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("meal history index out of range")
+        return self._record(index)
+
+    def __iter__(self) -> Iterator[MealRecord]:
+        for i in range(self._size):
+            yield self._record(i)
+
+    def _record(self, i: int) -> MealRecord:
+        ids = self._ingredient_ids[self._offsets[i]:self._offsets[i + 1]]
+        rating, cost = self._ratings[i], self._costs[i]
+        prep_time, calories, enjoyed = self._prep_times[i], self._calories[i], self._enjoyed[i]
+        return MealRecord(
+            user_id=self.user_id,
+            meal_name=self._names[i],
+            ingredients=[INGREDIENTS.names[j] for j in ids.tolist()],
+            meal_type=MEAL_TYPES.names[self._meal_types[i]],
+            date=self._raw_dates[i] if i in self._raw_dates else date.fromordinal(int(self._dates[i])).isoformat(),
+            rating=None if np.isnan(rating) else float(rating),
+            prep_time=None if prep_time == MISSING else int(prep_time),
+            cost=None if np.isnan(cost) else float(cost),
+            calories=None if calories == MISSING else int(calories),
+            enjoyed=None if enjoyed == MISSING else bool(enjoyed)
+        )
+
+    # Appending
+
+    def append(self, meal_record: MealRecord):
+        self.extend([meal_record])
+
+    def extend(self, meal_records: List[MealRecord]):
+        if self._frozen:
+            raise TypeError("meal history views are read-only")
+        if not meal_records:
+            return
+        if self.user_id is None:
+            self.user_id = meal_records[0].user_id
+
+        ingredient_ids = [[INGREDIENTS.intern(ingredient) for ingredient in meal.ingredients] for meal in meal_records]
+        self._reserve(len(meal_records), sum(len(ids) for ids in ingredient_ids))
+
+        # Sizes are only advanced once every column is written, so a bad record leaves no partial meal
+        start, position = self._size, self._ingredient_size
+        raw_dates = {}
+        for i, (meal, ids) in enumerate(zip(meal_records, ingredient_ids), start):
+            self._ingredient_ids[position:position + len(ids)] = ids
+            position += len(ids)
+            self._offsets[i + 1] = position
+            self._meal_types[i] = MEAL_TYPES.intern(meal.meal_type)
+
+            ordinal = _date_ordinal(meal.date)
+            self._dates[i] = ordinal
+            if ordinal == MISSING:
+                raw_dates[i] = meal.date
+
+            self._ratings[i] = np.nan if meal.rating is None else meal.rating
+            self._prep_times[i] = MISSING if meal.prep_time is None else meal.prep_time
+            self._costs[i] = np.nan if meal.cost is None else meal.cost
+            self._calories[i] = MISSING if meal.calories is None else meal.calories
+            self._enjoyed[i] = MISSING if meal.enjoyed is None else int(bool(meal.enjoyed))
+        self._names.extend(sys.intern(meal.meal_name) for meal in meal_records)
+        self._raw_dates.update(raw_dates)
+        self._ingredient_size = position
+        self._size = start + len(meal_records)
+
+    def _reserve(self, meals: int, ingredients: int):
+        """Grow (by reallocating, never in place) to fit more meals and ingredient ids."""
+        needed = self._size + meals
+        if needed > len(self._meal_types):
+            capacity = max(needed, 2 * len(self._meal_types))
+            for column in ('_meal_types', '_dates', '_ratings', '_prep_times', '_costs', '_calories', '_enjoyed'):
+                old = getattr(self, column)
+                grown = np.empty(capacity, dtype=old.dtype)
+                grown[:self._size] = old[:self._size]
+                setattr(self, column, grown)
+            offsets = np.zeros(capacity + 1, dtype=np.int64)
+            offsets[:self._size + 1] = self._offsets[:self._size + 1]
+            self._offsets = offsets
+
+        needed = self._ingredient_size + ingredients
+        if needed > len(self._ingredient_ids):
+            grown = np.empty(max(needed, 2 * len(self._ingredient_ids)), dtype=np.int32)
+            grown[:self._ingredient_size] = self._ingredient_ids[:self._ingredient_size]
+            self._ingredient_ids = grown
+
+    def view(self) -> 'MealHistory':
+        """Read-only snapshot of the current meals, sharing (not copying) the columns."""
+        snapshot = MealHistory.__new__(MealHistory)
+        for attribute in MealHistory.__slots__:
+            setattr(snapshot, attribute, getattr(self, attribute))
+        snapshot._frozen = True
+        return snapshot
+
+    # Columns (views trimmed to the current size)
+
+    @property
+    def meal_types(self) -> np.ndarray:
+        """Meal-type id per meal (names in MEAL_TYPES.names)."""
+        return self._meal_types[:self._size]
+
+    @property
+    def dates(self) -> np.ndarray:
+        """Day ordinal per meal, MISSING for non-ISO dates."""
+        return self._dates[:self._size]
+
+    @property
+    def ratings(self) -> np.ndarray:
+        return self._ratings[:self._size]
+
+    @property
+    def prep_times(self) -> np.ndarray:
+        return self._prep_times[:self._size]
+
+    @property
+    def costs(self) -> np.ndarray:
+        return self._costs[:self._size]
+
+    @property
+    def calories(self) -> np.ndarray:
+        return self._calories[:self._size]
+
+    @property
+    def enjoyed(self) -> np.ndarray:
+        return self._enjoyed[:self._size]
+
+    def ingredient_ids(self, start: int = 0) -> np.ndarray:
+        """Flat ingredient ids (names in INGREDIENTS.names) of meals from `start` on."""
+        start = min(max(0, self._size + start) if start < 0 else start, self._size)
+        return self._ingredient_ids[self._offsets[start]:self._offsets[self._size]]
+
+    def ingredient_meals(self, start: int = 0) -> np.ndarray:
+        """Meal index of each entry of `ingredient_ids(start)`."""
+        start = min(max(0, self._size + start) if start < 0 else start, self._size)
+        return np.repeat(np.arange(start, self._size), np.diff(self._offsets[start:self._size + 1]))
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held for this history (columns, name list and raw dates)."""
+        columns = sum(getattr(self, column).nbytes for column in (
+            '_ingredient_ids', '_offsets', '_meal_types', '_dates', '_ratings',
+            '_prep_times', '_costs', '_calories', '_enjoyed'))
+        return columns + sys.getsizeof(self._names) + sys.getsizeof(self._raw_dates)
+
+def ranked_by_count(ids: np.ndarray, names: List[str], limit: Optional[int] = None) -> List[Tuple[str, int]]:
+    """
+    (name, count) of interned ids, most common first, ties broken by first
+    occurrence - the same order as Counter(...).most_common().
+    """
+    if len(ids) == 0:
+        return []
+    unique, first, counts = np.unique(ids, return_index=True, return_counts=True)
+    order = np.lexsort((first, -counts))[:limit]
+    return [(names[unique[i]], int(counts[i])) for i in order]
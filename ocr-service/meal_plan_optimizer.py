@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Meal Plan Optimizer
+Chooses one recipe per (day, meal type) slot for a whole plan at once,
+trading preference score against weekly budget, daily calorie/protein
+targets, variety and using expiring inventory before it goes bad.
+"""
+
+import time
+import math
+import random
+import numpy as np
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Tuple
+from recipe_catalog import RecipeCatalog
+
+@dataclass
+class PlanConstraints:
+    """Plan-level targets. Any left as None is not enforced."""
+    weekly_budget: Optional[float] = None  # Total cost of the plan
+    daily_calories: Optional[float] = None  # Target per day; ±CALORIE_TOLERANCE is free
+    min_daily_protein: Optional[float] = None  # Grams per day
+    max_repeats: int = 1  # Times a recipe may appear in the plan before it is penalized
+    expiring: Dict[str, int] = field(default_factory=dict)  # ingredient -> days left (use on day index < days left)
+
+    def __post_init__(self):
+        self.expiring = {ingredient.lower(): int(days_left) for ingredient, days_left in self.expiring.items()}
+
+    @property
+    def active(self) -> bool:
+        return any(value is not None for value in (self.weekly_budget, self.daily_calories, self.min_daily_protein)) \
+            or bool(self.expiring)
+
+def waste_weight(days_left: int) -> float:
+    """Objective bonus for using an expiring ingredient in time (same tiers as the waste optimizer)."""
+    if days_left <= 2:
+        return 0.5
+    if days_left <= 5:
+        return 0.3
+    return 0.1
+
+class PlanOptimizer:
+    """
+    Simulated-annealing local search over slot assignments.
+
+    The objective is the sum of slot preference scores plus waste bonuses,
+    minus soft-constraint penalties. Moves replace one slot's recipe or swap
+    recipes between two slots of the same meal type; each move is evaluated
+    incrementally in O(ingredients). The best plan found within the time
+    or move budget (or before the search stalls) is returned.
+    """
+
+    CALORIE_TOLERANCE = 0.1  # Fraction of the daily target
+    CALORIE_PENALTY = 0.002  # Per kcal outside the tolerance band
+    PROTEIN_PENALTY = 0.01  # Per gram below the daily minimum
+    BUDGET_PENALTY = 0.1  # Per currency unit over budget
+    REPEAT_PENALTY = 1.0  # Per appearance beyond max_repeats
+    VARIETY_PENALTY = 0.02  # Per repeated use of an ingredient across the plan
+    STALL_MOVES = 2000  # Stop early after this many moves without a new best plan
+
+    def __init__(self, catalog: RecipeCatalog, time_budget: float = 0.15, rng: Optional[random.Random] = None,
+                 max_moves: Optional[int] = None):
+        self.catalog = catalog
+        self.time_budget = time_budget
+        self.rng = rng or random.Random()
+        # With a move budget the search never looks at the clock, so a seeded rng gives a reproducible plan
+        self.max_moves = max_moves
+
+    def optimize(self,
+                 slots: List[Tuple[int, str]],
+                 pools: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                 constraints: PlanConstraints,
+                 initial: Optional[List[int]] = None) -> Tuple[List[Optional[Tuple[int, float]]], Dict[str, Any]]:
+        """
+        Assign a recipe to every (day, meal_type) slot.
+
+        pools maps meal type -> (candidate recipe ids, preference scores).
+        initial optionally gives a starting recipe id per slot (e.g. the greedy plan).
+        Returns ([(recipe id, score) or None per slot], report).
+        """
+        self.slots = slots
+        self.pools = pools
+        self.constraints = constraints
+        self.days = max((day for day, _ in slots), default=-1) + 1
+        self._prepare_recipes()
+
+        # Start from the given plan where possible, else each pool's best candidate
+        self.assignment: List[Optional[int]] = []
+        for slot, (_, meal_type) in enumerate(slots):
+            recipe_ids, scores = pools.get(meal_type, (np.empty(0, dtype=np.int64), np.empty(0)))
+            if len(recipe_ids) == 0:
+                self.assignment.append(None)
+                continue
+            start = int(np.argmax(scores))
+            if initial is not None and initial[slot] is not None:
+                matches = np.flatnonzero(recipe_ids == initial[slot])
+                if len(matches):
+                    start = int(matches[0])
+            self.assignment.append(start)
+
+        self._reset_state()
+        objective = self._objective()
+        best_objective, best_assignment = objective, list(self.assignment)
+
+        movable = [slot for slot, index in enumerate(self.assignment) if index is not None
+                   and len(pools[slots[slot][1]][0]) > 1]
+        by_meal_type: Dict[str, List[int]] = {}
+        for slot in movable:
+            by_meal_type.setdefault(slots[slot][1], []).append(slot)
+
+        iterations = last_improvement = 0
+        started = time.perf_counter()
+        deadline = started + self.time_budget
+        temperature0, temperature = 0.05, 0.05
+        while movable:
+            if iterations % 64 == 0:
+                if iterations - last_improvement > self.STALL_MOVES:
+                    break
+                if self.max_moves is not None:
+                    if iterations >= self.max_moves:
+                        break
+                    temperature = max(1e-4, temperature0 * (1.0 - iterations / self.max_moves))
+                else:
+                    now = time.perf_counter()
+                    if now >= deadline:
+                        break
+                    temperature = max(1e-4, temperature0 * (deadline - now) / self.time_budget)
+            iterations += 1
+
+            slot = movable[self.rng.randrange(len(movable))]
+            partners = by_meal_type[slots[slot][1]]
+            if len(partners) > 1 and self.rng.random() < 0.3:
+                other = partners[self.rng.randrange(len(partners))]
+                if other == slot or self.assignment[other] == self.assignment[slot]:
+                    continue
+                first, second = self.assignment[slot], self.assignment[other]
+                delta = self._assign(slot, second) + self._assign(other, first)
+                undo = lambda: (self._assign(other, second), self._assign(slot, first))
+            else:
+                pool_size = len(pools[slots[slot][1]][0])
+                new_index = self.rng.randrange(pool_size)
+                old_index = self.assignment[slot]
+                if new_index == old_index:
+                    continue
+                delta = self._assign(slot, new_index)
+                undo = lambda: self._assign(slot, old_index)
+
+            if delta >= 0 or self.rng.random() < math.exp(delta / temperature):
+                objective += delta
+                if objective > best_objective + 1e-12:
+                    best_objective, best_assignment = objective, list(self.assignment)
+                    last_improvement = iterations
+            else:
+                undo()
+
+        self.assignment = best_assignment
+        self._reset_state()
+        plan = [
+            None if index is None else (int(pools[meal_type][0][index]), float(pools[meal_type][1][index]))
+            for (_, meal_type), index in zip(slots, self.assignment)
+        ]
+        report = self._report(best_objective, iterations, time.perf_counter() - started)
+        return plan, report
+
+    def _prepare_recipes(self):
+        """Cache per-candidate attributes the moves touch, as plain Python values."""
+        catalog = self.catalog
+        self.pool_ids = {meal_type: recipe_ids.tolist() for meal_type, (recipe_ids, _) in self.pools.items()}
+        self.pool_scores = {meal_type: scores.tolist() for meal_type, (_, scores) in self.pools.items()}
+        # recipe id -> (calories, protein, cost, ingredients, distinct ingredients, expiring ingredients)
+        self.recipe_info: Dict[int, Tuple[float, float, float, Tuple[str, ...], frozenset, frozenset]] = {}
+        for recipe_ids, _ in self.pools.values():
+            for recipe_id in recipe_ids.tolist():
+                if recipe_id not in self.recipe_info:
+                    ingredients = tuple(catalog.recipes[recipe_id]['ingredients'])
+                    self.recipe_info[recipe_id] = (
+                        float(catalog.calories[recipe_id]), float(catalog.protein[recipe_id]),
+                        float(catalog.cost[recipe_id]), ingredients, frozenset(ingredients),
+                        frozenset(i.lower() for i in ingredients if i.lower() in self.constraints.expiring)
+                    )
+
+    def _reset_state(self):
+        """Rebuild running totals from the current assignment."""
+        self.day_calories = [0.0] * self.days
+        self.day_protein = [0.0] * self.days
+        self.total_cost = 0.0
+        self.score_sum = 0.0
+        self.recipe_counts: Counter = Counter()
+        self.ingredient_uses: Counter = Counter()
+        self.covered: Counter = Counter()
+        for slot, index in enumerate(self.assignment):
+            if index is not None:
+                self._add(slot, index, 1)
+
+    def _add(self, slot: int, index: int, sign: int):
+        day, meal_type = self.slots[slot]
+        recipe_id = self.pool_ids[meal_type][index]
+        calories, protein, cost, ingredients, _, expiring = self.recipe_info[recipe_id]
+        self.score_sum += sign * self.pool_scores[meal_type][index]
+        self.day_calories[day] += sign * calories
+        self.day_protein[day] += sign * protein
+        self.total_cost += sign * cost
+        self.recipe_counts[recipe_id] += sign
+        for ingredient in ingredients:
+            self.ingredient_uses[ingredient] += sign
+        for ingredient in expiring:
+            if day < self.constraints.expiring[ingredient]:
+                self.covered[ingredient] += sign
+
+    def _day_penalty(self, day: int) -> float:
+        penalty = 0.0
+        target = self.constraints.daily_calories
+        if target:
+            deviation = abs(self.day_calories[day] - target) - self.CALORIE_TOLERANCE * target
+            penalty += self.CALORIE_PENALTY * max(0.0, deviation)
+        if self.constraints.min_daily_protein:
+            penalty += self.PROTEIN_PENALTY * max(0.0, self.constraints.min_daily_protein - self.day_protein[day])
+        return penalty
+
+    def _budget_penalty(self) -> float:
+        if self.constraints.weekly_budget is None:
+            return 0.0
+        return self.BUDGET_PENALTY * max(0.0, self.total_cost - self.constraints.weekly_budget)
+
+    def _repeat_penalty(self, recipe_id: int) -> float:
+        return self.REPEAT_PENALTY * max(0, self.recipe_counts[recipe_id] - self.constraints.max_repeats)
+
+    def _variety_penalty(self, distinct_ingredients) -> float:
+        uses = self.ingredient_uses
+        return self.VARIETY_PENALTY * sum(uses[ingredient] - 1 for ingredient in distinct_ingredients if uses[ingredient] > 1)
+
+    def _waste_bonus(self, expiring_ingredients) -> float:
+        """Bonus for the given (lowercase, expiring) ingredients that some slot uses in time."""
+        return sum(waste_weight(self.constraints.expiring[ingredient])
+                   for ingredient in expiring_ingredients if self.covered[ingredient] > 0)
+
+    def _local_terms(self, day: int, recipe_ids, distinct_ingredients, expiring_ingredients) -> float:
+        """Objective terms that a change to `day` involving these recipes/ingredients can move."""
+        return (
+            self.score_sum
+            + self._waste_bonus(expiring_ingredients)
+            - self._day_penalty(day)
+            - self._budget_penalty()
+            - sum(self._repeat_penalty(recipe_id) for recipe_id in set(recipe_ids))
+            - self._variety_penalty(distinct_ingredients)
+        )
+
+    def _assign(self, slot: int, new_index: int) -> float:
+        """Put pool entry new_index in slot; returns the change in objective."""
+        old_index = self.assignment[slot]
+        day, meal_type = self.slots[slot]
+        recipe_ids = self.pool_ids[meal_type]
+        old_id, new_id = recipe_ids[old_index], recipe_ids[new_index]
+        old_info, new_info = self.recipe_info[old_id], self.recipe_info[new_id]
+        touched = (day, (old_id, new_id), old_info[4] | new_info[4], old_info[5] | new_info[5])
+
+        before = self._local_terms(*touched)
+        self._add(slot, old_index, -1)
+        self._add(slot, new_index, 1)
+        self.assignment[slot] = new_index
+        after = self._local_terms(*touched)
+        return after - before
+
+    def _objective(self) -> float:
+        """Full objective of the current state."""
+        return (
+            self.score_sum
+            + self._waste_bonus(self.constraints.expiring)
+            - sum(self._day_penalty(day) for day in range(self.days))
+            - self._budget_penalty()
+            - sum(self._repeat_penalty(recipe_id) for recipe_id in list(self.recipe_counts))
+            - self.VARIETY_PENALTY * sum(max(0, uses - 1) for uses in self.ingredient_uses.values())
+        )
+
+    def _report(self, objective: float, iterations: int, elapsed: float) -> Dict[str, Any]:
+        constraints = self.constraints
+        return {
+            "objective": round(objective, 4),
+            "iterations": iterations,
+            "search_ms": round(elapsed * 1000, 1),
+            "total_cost": round(self.total_cost, 2),
+            "weekly_budget": constraints.weekly_budget,
+            "within_budget": constraints.weekly_budget is None or self.total_cost <= constraints.weekly_budget + 1e-9,
+            "daily_calories": [round(float(c)) for c in self.day_calories],
+            "daily_protein": [round(float(p), 1) for p in self.day_protein],
+            "repeated_recipes": sum(max(0, count - constraints.max_repeats) for count in self.recipe_counts.values()),
+            "expiring_used": sorted(ingredient for ingredient in constraints.expiring if self.covered[ingredient] > 0),
+            "expiring_missed": sorted(ingredient for ingredient in constraints.expiring if self.covered[ingredient] == 0)
+        }
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Meal Engine Storage
+SQLite (WAL mode) event log and per-user state snapshots for the AI meal engine
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meal_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_meal_events_user ON meal_events (user_id, id);
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id TEXT PRIMARY KEY,
+    preferences TEXT,
+    ingredient_preferences TEXT,
+    last_event_id INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+class MealStore:
+    """
+    Append-only event log plus per-user snapshots of derived state.
+
+    Every learning event is one INSERT, so recording a meal is O(1) I/O and
+    durable once the call returns. Derived state (preferences, ingredient
+    scores) is snapshotted periodically together with the id of the last
+    event it includes; anything after that is replayed on load.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Durable across app crashes in WAL mode
+        self._conn.executescript(SCHEMA)
+
+    def append_event(self, user_id: str, kind: str, payload: Dict[str, Any]) -> int:
+        """Append one event to the log. Returns its id."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO meal_events (user_id, kind, payload) VALUES (?, ?, ?)",
+                (user_id, kind, json.dumps(payload))
+            )
+            return cursor.lastrowid
+
+    def append_events(self, events: List[Tuple[str, str, Dict[str, Any]]]) -> List[int]:
+        """Append many (user_id, kind, payload) events in one transaction. Returns their ids."""
+        with self._lock:
+            ids = []
+            self._conn.execute("BEGIN")
+            try:
+                for user_id, kind, payload in events:
+                    cursor = self._conn.execute(
+                        "INSERT INTO meal_events (user_id, kind, payload) VALUES (?, ?, ?)",
+                        (user_id, kind, json.dumps(payload))
+                    )
+                    ids.append(cursor.lastrowid)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return ids
+
+    def load_events(self, user_id: str, kind: Optional[str] = None,
+                    after_id: int = 0) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """A user's events in log order as (id, kind, payload)."""
+        query = "SELECT id, kind, payload FROM meal_events WHERE user_id = ? AND id > ?"
+        params: Tuple = (user_id, after_id)
+        if kind is not None:
+            query += " AND kind = ?"
+            params += (kind,)
+        query += " ORDER BY id"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [(event_id, event_kind, json.loads(payload)) for event_id, event_kind, payload in rows]
+
+    def load_user_state(self, user_id: str) -> Tuple[Optional[Dict], Dict[str, float], int]:
+        """Latest snapshot for a user as (preferences, ingredient_preferences, last_event_id)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT preferences, ingredient_preferences, last_event_id FROM user_state WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        if row is None:
+            return None, {}, 0
+        preferences, ingredient_preferences, last_event_id = row
+        return (
+            json.loads(preferences) if preferences else None,
+            json.loads(ingredient_preferences) if ingredient_preferences else {},
+            last_event_id
+        )
+
+    def save_user_states(self, states: List[Tuple[str, Optional[Dict], Dict[str, float], int]]):
+        """Snapshot (user_id, preferences, ingredient_preferences, last_event_id) rows in one transaction."""
+        if not states:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO user_state (user_id, preferences, ingredient_preferences, last_event_id) "
+                    "VALUES (?, ?, ?, ?)",
+                    [
+                        (user_id, json.dumps(preferences) if preferences is not None else None,
+                         json.dumps(ingredient_preferences), last_event_id)
+                        for user_id, preferences, ingredient_preferences, last_event_id in states
+                    ]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def user_ids(self) -> List[str]:
+        """Every user with logged events or a state snapshot, sorted."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id FROM user_state UNION SELECT user_id FROM meal_events ORDER BY user_id"
+            ).fetchall()
+        return [user_id for user_id, in rows]
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            has_events = self._conn.execute("SELECT 1 FROM meal_events LIMIT 1").fetchone()
+            has_state = self._conn.execute("SELECT 1 FROM user_state LIMIT 1").fetchone()
+        return has_events is None and has_state is None
+
+    def checkpoint(self):
+        """Fold the WAL back into the main database file."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def import_legacy_json(self, data_dir: str) -> int:
+        """
+        One-time import of the old user_preferences.json / meal_history.json files.
+        Returns the number of meals imported.
+        """
+        prefs_file = os.path.join(data_dir, "user_preferences.json")
+        history_file = os.path.join(data_dir, "meal_history.json")
+
+        preferences = {}
+        if os.path.exists(prefs_file):
+            with open(prefs_file, 'r') as f:
+                preferences = json.load(f)
+
+        history = {}
+        if os.path.exists(history_file):
+            with open(history_file, 'r') as f:
+                history = json.load(f)
+
+        events = [(user_id, 'meal', meal) for user_id, meals in history.items() for meal in meals]
+        if events:
+            self.append_events(events)
+        # Preferences snapshot with last_event_id 0 so the imported meals get replayed
+        self.save_user_states([(user_id, pref, {}, 0) for user_id, pref in preferences.items()])
+
+        logger.info(f"Imported {len(events)} meals for {len(history)} users from legacy JSON")
+        return len(events)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Nutrition Ledger
+Append-only log of eaten meals with incrementally maintained per-user
+daily/weekly/monthly nutrient rollups, so dashboards are O(1) reads.
+"""
+
+import os
+import json
+import argparse
+import logging
+import numpy as np
+from datetime import date, datetime
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+from calorie_calculation_service import calorie_calculator, NUTRIENT_VECTOR_FIELDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PERIODS = ('day', 'week', 'month')
+
+def period_key(period: str, day: date) -> int:
+    """Integer bucket for a date: day ordinal, ordinal of the week's Monday, or months since year 0."""
+    if period == 'day':
+        return day.toordinal()
+    if period == 'week':
+        return day.toordinal() - day.weekday()
+    if period == 'month':
+        return day.year * 12 + day.month - 1
+    raise ValueError(f"Unknown period: {period}. Expected one of {PERIODS}")
+
+def period_start(period: str, key: int) -> date:
+    """First day covered by a period bucket."""
+    if period == 'month':
+        return date(key // 12, key % 12 + 1, 1)
+    return date.fromordinal(key)
+
+class RollupStore:
+    """Running nutrient sums in one growable float32 array, one row per (user, period bucket)"""
+
+    def __init__(self, width: int, capacity: int = 1024):
+        self.rows: Dict[Tuple[str, int], int] = {}
+        self.sums = np.zeros((capacity, width), dtype=np.float32)
+        self.counts = np.zeros(capacity, dtype=np.int32)
+
+    def row_for(self, key: Tuple[str, int]) -> int:
+        """Row index for a key, allocating (and growing the arrays) if new."""
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.rows)
+            if row >= len(self.counts):
+                self._grow(row + 1)
+            self.rows[key] = row
+        return row
+
+    def _grow(self, needed: int):
+        capacity = max(needed, len(self.counts) * 2)
+        sums = np.zeros((capacity, self.sums.shape[1]), dtype=np.float32)
+        sums[:len(self.sums)] = self.sums
+        counts = np.zeros(capacity, dtype=np.int32)
+        counts[:len(self.counts)] = self.counts
+        self.sums, self.counts = sums, counts
+
+    def add(self, key: Tuple[str, int], vector: np.ndarray):
+        row = self.row_for(key)
+        self.sums[row] += vector
+        self.counts[row] += 1
+
+    def add_many(self, keys: List[Tuple[str, int]], vectors: np.ndarray):
+        """Vectorized add of many meals (repeated keys accumulate)."""
+        rows = np.fromiter((self.row_for(key) for key in keys), dtype=np.int64, count=len(keys))
+        np.add.at(self.sums, rows, vectors.astype(np.float32, copy=False))
+        np.add.at(self.counts, rows, 1)
+
+    def get(self, key: Tuple[str, int]) -> Optional[Tuple[np.ndarray, int]]:
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        return self.sums[row], int(self.counts[row])
+
+    @property
+    def nbytes(self) -> int:
+        return self.sums.nbytes + self.counts.nbytes
+
+class NutritionLedger:
+    """Meal log plus incremental per-user nutrient rollups"""
+
+    def __init__(self, data_dir: str = "nutrition_ledger_data", calculator=calorie_calculator, snapshot_every: int = 1000):
+        self.data_dir = data_dir
+        self.calculator = calculator
+        # Snapshot after this many logged meals, bounding how much of the log startup replays
+        self.snapshot_every = snapshot_every
+        self.meals_since_snapshot = 0
+        self.fields = NUTRIENT_VECTOR_FIELDS
+        self.rollups = {period: RollupStore(len(self.fields)) for period in PERIODS}
+        self.log_file = os.path.join(data_dir, "meals.jsonl")
+        self.snapshot_file = os.path.join(data_dir, "rollups.npz")
+        os.makedirs(data_dir, exist_ok=True)
+
+        # Restore the last snapshot, then replay meals logged after it
+        log_offset = self._load_snapshot()
+        self._replay_log(log_offset)
+
+    def _load_snapshot(self) -> int:
+        """Load rollups from the snapshot file. Returns the log offset it covers."""
+        if not os.path.exists(self.snapshot_file):
+            return 0
+        try:
+            with np.load(self.snapshot_file) as snapshot:
+                for period in PERIODS:
+                    store = self.rollups[period]
+                    users = snapshot[f'{period}_users']
+                    buckets = snapshot[f'{period}_buckets']
+                    store.rows = {(str(user), int(bucket)): row for row, (user, bucket) in enumerate(zip(users, buckets))}
+                    store.sums = snapshot[f'{period}_sums']
+                    store.counts = snapshot[f'{period}_counts']
+                return int(snapshot['log_offset'])
+        except Exception as e:
+            logger.error(f"Error loading nutrition ledger snapshot: {e}")
+            self.rollups = {period: RollupStore(len(self.fields)) for period in PERIODS}
+            return 0
+
+    def save_snapshot(self):
+        """Persist the rollups so startup only replays meals logged afterwards."""
+        arrays = {'log_offset': np.int64(os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0)}
+        for period, store in self.rollups.items():
+            used = len(store.rows)
+            arrays[f'{period}_users'] = np.array([user for user, _ in store.rows], dtype=str)
+            arrays[f'{period}_buckets'] = np.array([bucket for _, bucket in store.rows], dtype=np.int64)
+            arrays[f'{period}_sums'] = store.sums[:used]
+            arrays[f'{period}_counts'] = store.counts[:used]
+
+        tmp_file = self.snapshot_file + '.tmp.npz'
+        np.savez(tmp_file, **arrays)
+        os.replace(tmp_file, self.snapshot_file)
+        self.meals_since_snapshot = 0
+
+    def _replay_log(self, offset: int = 0):
+        """Load meals logged after the given byte offset into the rollups."""
+        if not os.path.exists(self.log_file):
+            return
+        try:
+            with open(self.log_file, 'r') as f:
+                f.seek(offset)
+                meals = (json.loads(line) for line in f if line.strip())
+                count = self._apply_meals(meals)
+            self.meals_since_snapshot = count
+            logger.info(f"Loaded {count} meals into nutrition ledger")
+        except Exception as e:
+            logger.error(f"Error loading nutrition ledger: {e}")
+
+    def _meal_date(self, meal: Dict[str, Any]) -> date:
+        value = meal.get('date')
+        if not value:
+            return datetime.now().date()
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+    def _meal_vector(self, meal: Dict[str, Any]) -> np.ndarray:
+        if 'nutrients' in meal:
+            return np.asarray(meal['nutrients'], dtype=np.float64)
+        return self.calculator.meal_nutrient_vector(meal.get('ingredients', []))
+
+    def log_meal(self, user_id: str, ingredients: List[Dict[str, Any]], meal_date: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Append a meal to the log and fold it into the user's rollups.
+        Ingredients need a 'name' and 'weight_g'. O(nutrients) per meal,
+        plus a snapshot every snapshot_every meals.
+        Raises ValueError, logging nothing, if meal_date isn't YYYY-MM-DD or a weight isn't a number.
+        """
+        meal = {
+            'user_id': user_id,
+            'date': meal_date or datetime.now().strftime("%Y-%m-%d"),
+            'ingredients': ingredients
+        }
+        vector = self._meal_vector(meal)
+        day = self._meal_date(meal)
+
+        with open(self.log_file, 'a') as f:
+            f.write(json.dumps(meal) + '\n')
+
+        for period in PERIODS:
+            self.rollups[period].add((user_id, period_key(period, day)), vector)
+
+        self.meals_since_snapshot += 1
+        if self.meals_since_snapshot >= self.snapshot_every:
+            self.save_snapshot()
+
+        return dict(zip(self.fields, (round(float(v), 2) for v in vector)))
+
+    def _apply_meals(self, meals: Iterable[Dict[str, Any]], chunk_size: int = 50000) -> int:
+        """Fold meals into the rollups in vectorized chunks. Returns the number applied."""
+        total = 0
+        chunk: List[Dict[str, Any]] = []
+        for meal in meals:
+            chunk.append(meal)
+            if len(chunk) >= chunk_size:
+                total += self._apply_chunk(chunk)
+                chunk = []
+        if chunk:
+            total += self._apply_chunk(chunk)
+        return total
+
+    def _apply_chunk(self, meals: List[Dict[str, Any]]) -> int:
+        vectors = np.array([self._meal_vector(meal) for meal in meals])
+        days = [self._meal_date(meal) for meal in meals]
+        self.add_vectors([meal['user_id'] for meal in meals], days, vectors)
+        return len(meals)
+
+    def add_vectors(self, user_ids: List[str], days: List[date], vectors: np.ndarray):
+        """Fold precomputed meal nutrient vectors (meals × nutrients) into the rollups."""
+        for period in PERIODS:
+            keys = [(user_id, period_key(period, day)) for user_id, day in zip(user_ids, days)]
+            self.rollups[period].add_many(keys, vectors)
+
+    def backfill(self, meals: Iterable[Dict[str, Any]], persist: bool = True) -> int:
+        """
+        Import historical meals in bulk.
+        Each meal is a dict with user_id, date and either ingredients or a
+        precomputed 'nutrients' vector ordered like NUTRIENT_VECTOR_FIELDS.
+        """
+        if not persist:
+            return self._apply_meals(meals)
+
+        def logged(meals_iter):
+            with open(self.log_file, 'a') as f:
+                for meal in meals_iter:
+                    f.write(json.dumps(meal) + '\n')
+                    yield meal
+
+        count = self._apply_meals(logged(meals))
+        self.save_snapshot()
+        return count
+
+    def get_summary(self, user_id: str, period: str = 'day', on_date: Optional[str] = None) -> Dict[str, Any]:
+        """Nutrient totals for the user's day/week/month containing on_date. O(1)."""
+        day = datetime.strptime(on_date, "%Y-%m-%d").date() if on_date else datetime.now().date()
+        key = period_key(period, day)
+        entry = self.rollups[period].get((user_id, key))
+        sums, meals = entry if entry else (np.zeros(len(self.fields)), 0)
+
+        return {
+            'user_id': user_id,
+            'period': period,
+            'period_start': period_start(period, key).isoformat(),
+            'meals_logged': meals,
+            'totals': dict(zip(self.fields, (round(float(v), 2) for v in sums)))
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Nutrition ledger maintenance")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = subcommands.add_parser('backfill', help="Import meals from a JSON Lines file")
+    backfill_parser.add_argument('meals_file', help="One meal per line: {user_id, date, ingredients: [{name, weight_g}]}")
+    backfill_parser.add_argument('--data-dir', default="nutrition_ledger_data")
+
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        ledger = NutritionLedger(data_dir=args.data_dir)
+        with open(args.meals_file, 'r') as f:
+            count = ledger.backfill(json.loads(line) for line in f if line.strip())
+        print(f"Backfilled {count} meals into {ledger.log_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Preference Statistics
+Sufficient statistics over a user's recent meals, updated per meal in
+O(ingredients), from which learned preferences (favorite ingredients,
+meal-type frequency, cooking-time limits) are read without rescanning history.
+"""
+
+import heapq
+from collections import deque
+from typing import Dict, List, Deque, Tuple, Iterable, Any
+
+# Window sizes and favorites count of the learned preferences
+FAVORITES_WINDOW = 50
+FREQUENCY_WINDOW = 30
+TIME_WINDOW = 20
+TOP_FAVORITES = 15
+# Meals needed before learned preferences are applied
+MIN_MEALS = 5
+
+def _liked(meal) -> bool:
+    return bool(meal.rating and meal.rating >= 4)
+
+class PreferenceStats:
+    """
+    Rolling windows over one user's last meals, kept as ring buffers with
+    running sums so adding a meal (and evicting the one that falls out of
+    each window) touches only that meal's ingredients.
+
+    Orderings match a full rescan of the window: ties between favorite
+    ingredients and the order of meal types go by first occurrence in the
+    window, which is tracked per key as a queue of (meal seq, position).
+    """
+
+    def __init__(self, meal_count: int = 0):
+        self.meal_count = meal_count  # Meals ever observed, including ones before the windows
+
+        # Favorites: rating sums and occurrence positions of ingredients in liked meals
+        self._favorites_window: Deque[Tuple[int, Any]] = deque()
+        self._ingredient_sums: Dict[str, float] = {}
+        self._ingredient_occurrences: Dict[str, Deque[Tuple[int, int]]] = {}
+
+        # Meal-type frequency: seq numbers of each type's meals
+        self._frequency_window: Deque[Tuple[int, str]] = deque()
+        self._meal_type_seqs: Dict[str, Deque[int]] = {}
+
+        # Cooking time: prep time sums/counts of liked meals per type
+        self._time_window: Deque[Tuple[str, int]] = deque()
+        self._time_sums: Dict[str, int] = {}
+        self._time_counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_history(cls, meals: List[Any]) -> 'PreferenceStats':
+        """Stats for a loaded history; only the tail that fits the windows is visited."""
+        tail = meals[-max(FAVORITES_WINDOW, FREQUENCY_WINDOW, TIME_WINDOW):]
+        stats = cls(meal_count=len(meals) - len(tail))
+        stats.observe_many(tail)
+        return stats
+
+    def observe_many(self, meals: Iterable[Any]):
+        for meal in meals:
+            self.observe(meal)
+
+    def observe(self, meal):
+        """Add one meal (a MealRecord) to every window."""
+        seq = self.meal_count
+        self.meal_count += 1
+
+        # Favorites window
+        if _liked(meal):
+            self._favorites_window.append((seq, meal))
+            for position, ingredient in enumerate(meal.ingredients):
+                self._ingredient_sums[ingredient] = self._ingredient_sums.get(ingredient, 0.0) + meal.rating
+                self._ingredient_occurrences.setdefault(ingredient, deque()).append((seq, position))
+        while self._favorites_window and self._favorites_window[0][0] <= seq - FAVORITES_WINDOW:
+            old_seq, old_meal = self._favorites_window.popleft()
+            for ingredient in old_meal.ingredients:
+                occurrences = self._ingredient_occurrences[ingredient]
+                occurrences.popleft()
+                if occurrences:
+                    self._ingredient_sums[ingredient] -= old_meal.rating
+                else:
+                    del self._ingredient_occurrences[ingredient]
+                    del self._ingredient_sums[ingredient]
+
+        # Meal-type frequency window
+        self._frequency_window.append((seq, meal.meal_type))
+        self._meal_type_seqs.setdefault(meal.meal_type, deque()).append(seq)
+        if len(self._frequency_window) > FREQUENCY_WINDOW:
+            _, old_type = self._frequency_window.popleft()
+            seqs = self._meal_type_seqs[old_type]
+            seqs.popleft()
+            if not seqs:
+                del self._meal_type_seqs[old_type]
+
+        # Cooking time window
+        timed = meal.prep_time if (meal.prep_time and _liked(meal)) else None
+        self._time_window.append((meal.meal_type, timed))
+        if timed is not None:
+            self._time_sums[meal.meal_type] = self._time_sums.get(meal.meal_type, 0) + timed
+            self._time_counts[meal.meal_type] = self._time_counts.get(meal.meal_type, 0) + 1
+        if len(self._time_window) > TIME_WINDOW:
+            old_type, old_time = self._time_window.popleft()
+            if old_time is not None:
+                self._time_sums[old_type] -= old_time
+                self._time_counts[old_type] -= 1
+
+    def favorite_ingredients(self) -> List[str]:
+        """Top ingredients by mean rating in liked recent meals."""
+        sums, occurrences = self._ingredient_sums, self._ingredient_occurrences
+        return heapq.nsmallest(
+            TOP_FAVORITES, occurrences,
+            key=lambda ingredient: (-(sums[ingredient] / len(occurrences[ingredient])), occurrences[ingredient][0])
+        )
+
+    def meal_frequency(self) -> Dict[str, int]:
+        ordered = sorted(self._meal_type_seqs.items(), key=lambda item: item[1][0])
+        return {meal_type: len(seqs) for meal_type, seqs in ordered}
+
+    def time_constraints(self) -> Dict[str, int]:
+        """Average prep time of liked recent meals, for meal types that have any."""
+        return {
+            meal_type: int(self._time_sums[meal_type] / count)
+            for meal_type, count in self._time_counts.items() if count
+        }
+
+    def apply_to(self, user_pref):
+        """Write the learned fields into a UserPreference (no-op until MIN_MEALS meals)."""
+        if self.meal_count < MIN_MEALS:
+            return
+        user_pref.favorite_ingredients = self.favorite_ingredients()
+        user_pref.meal_frequency = self.meal_frequency()
+        user_pref.time_constraints.update(self.time_constraints())
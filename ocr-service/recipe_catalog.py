@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Recipe Catalog
+Recipes loaded once into per-meal-type partitions, an ingredient→recipe
+inverted index and dietary-label bitsets, so meal generation never rescans
+the raw recipe list.
+"""
+
+import os
+import json
+import logging
+import numpy as np
+from scipy import sparse
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snack')
+DIFFICULTY_LEVELS = {'beginner': 1, 'intermediate': 2, 'advanced': 3}
+
+# Ingredients that break a dietary restriction (matched case-insensitively)
+RESTRICTION_VIOLATIONS = {
+    'vegetarian': ['meat', 'chicken', 'beef', 'pork', 'fish'],
+    'vegan': ['meat', 'chicken', 'beef', 'pork', 'fish', 'dairy', 'eggs'],
+    'gluten_free': ['wheat', 'bread', 'pasta', 'flour'],
+    'dairy_free': ['milk', 'cheese', 'butter', 'yogurt']
+}
+
+# Dietary labels that also satisfy other restrictions
+IMPLIED_LABELS = {
+    'vegan': ('vegetarian', 'dairy_free')
+}
+
+def normalize_ingredient(name: str) -> str:
+    """Key for case- and whitespace-insensitive ingredient matching."""
+    return name.strip().lower()
+
+def normalize_label(name: str) -> str:
+    """Key for dietary labels/restrictions, so 'Gluten-Free' matches 'gluten_free'."""
+    return normalize_ingredient(name).replace('-', '_').replace(' ', '_')
+
+@dataclass(frozen=True)
+class RecipeFilter:
+    """
+    Hard per-request limits on which recipes may be planned at all, applied
+    as pruning stages over a meal type's partition before anything is scored.
+    """
+    dietary_restrictions: Tuple[str, ...] = ()  # Restrictions or labels every recipe must suit
+    max_prep_time: Optional[float] = None
+    cuisine: Optional[str] = None  # Only prunes meal types that have recipes of this cuisine
+
+    @property
+    def active(self) -> bool:
+        return bool(self.dietary_restrictions) or self.max_prep_time is not None or bool(self.cuisine)
+
+# Built-in recipes used when no catalog file is configured. Their nutrients are precomputed
+# (`python recipe_nutrition.py precompute`), so the meal service never loads the calorie service
+# to build them; none of them resolves fully yet, so only their coverage is stored.
+SAMPLE_RECIPES = [
+    {
+        "name": "Avocado Toast with Scrambled Eggs",
+        "ingredients": ["bread", "avocado", "eggs", "salt", "pepper", "butter"],
+        "ingredient_grams": {"bread": 56, "avocado": 70, "eggs": 100, "salt": 1, "pepper": 0.5, "butter": 7},
+        "nutrient_coverage": 0.701,
+        "meal_type": "breakfast",
+        "prep_time": 10,
+        "cost": 4.0,
+        "calories": 350,
+        "dietary_labels": ["vegetarian"],
+        "cuisine": "American",
+        "difficulty": "beginner",
+        "protein": 15,
+        "instructions": [
+            "Toast bread slices",
+            "Mash avocado with salt and pepper",
+            "Scramble eggs in butter",
+            "Spread avocado on toast, top with eggs"
+        ]
+    },
+    {
+        "name": "Greek Quinoa Bowl",
+        "ingredients": ["quinoa", "cucumber", "tomato", "feta", "olives", "olive_oil", "lemon"],
+        "ingredient_grams": {"quinoa": 185, "cucumber": 60, "tomato": 80, "feta": 30, "olives": 15, "olive_oil": 10, "lemon": 10},
+        "nutrient_coverage": 0.859,
+        "meal_type": "lunch",
+        "prep_time": 25,
+        "cost": 6.0,
+        "calories": 420,
+        "dietary_labels": ["vegetarian", "gluten_free"],
+        "cuisine": "Mediterranean",
+        "difficulty": "intermediate",
+        "protein": 18,
+        "instructions": [
+            "Cook quinoa according to package instructions",
+            "Chop cucumber and tomato",
+            "Mix vegetables with quinoa",
+            "Top with feta and olives",
+            "Drizzle with olive oil and lemon"
+        ]
+    },
+    {
+        "name": "Grilled Chicken with Sweet Potato",
+        "ingredients": ["chicken_breast", "sweet_potato", "broccoli", "olive_oil", "garlic", "herbs"],
+        "ingredient_grams": {"chicken_breast": 150, "sweet_potato": 150, "broccoli": 90, "olive_oil": 10, "garlic": 5, "herbs": 2},
+        "nutrient_coverage": 0.631,
+        "meal_type": "dinner",
+        "prep_time": 35,
+        "cost": 8.0,
+        "calories": 480,
+        "dietary_labels": ["gluten_free", "dairy_free"],
+        "cuisine": "American",
+        "difficulty": "intermediate",
+        "protein": 35,
+        "instructions": [
+            "Season chicken with herbs and garlic",
+            "Grill chicken for 6-7 minutes per side",
+            "Roast sweet potato at 400°F for 25 minutes",
+            "Steam broccoli until tender",
+            "Serve together with olive oil drizzle"
+        ]
+    },
+    {
+        "name": "Berry Protein Smoothie",
+        "ingredients": ["berries", "protein_powder", "banana", "almond_milk", "spinach", "chia_seeds"],
+        "ingredient_grams": {"berries": 100, "protein_powder": 30, "banana": 120, "almond_milk": 240, "spinach": 30, "chia_seeds": 12},
+        "nutrient_coverage": 0.282,
+        "meal_type": "snack",
+        "prep_time": 5,
+        "cost": 3.0,
+        "calories": 280,
+        "dietary_labels": ["vegan", "gluten_free"],
+        "cuisine": "Health",
+        "difficulty": "beginner",
+        "protein": 25,
+        "instructions": [
+            "Add all ingredients to blender",
+            "Blend until smooth",
+            "Adjust consistency with more almond milk if needed",
+            "Serve immediately"
+        ]
+    },
+    {
+        "name": "Vegetarian Stir Fry",
+        "ingredients": ["tofu", "bell_peppers", "broccoli", "carrots", "soy_sauce", "ginger", "garlic", "rice"],
+        "ingredient_grams": {"tofu": 150, "bell_peppers": 80, "broccoli": 80, "carrots": 60, "soy_sauce": 15, "ginger": 5, "garlic": 5, "rice": 150},
+        "nutrient_coverage": 0.972,
+        "meal_type": "dinner",
+        "prep_time": 20,
+        "cost": 5.5,
+        "calories": 380,
+        "dietary_labels": ["vegetarian", "vegan"],
+        "cuisine": "Asian",
+        "difficulty": "intermediate",
+        "protein": 20,
+        "instructions": [
+            "Press and cube tofu",
+            "Cook rice according to package instructions",
+            "Heat oil in wok, add tofu and cook until golden",
+            "Add vegetables and stir fry for 5-7 minutes",
+            "Add sauce and serve over rice"
+        ]
+    }
+]
+
+def synthetic_recipes(count: int, seed: int = 0, vocabulary_size: int = 2000) -> List[Dict[str, Any]]:
+    """Random but well-formed recipes for load tests and benchmarks."""
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"ingredient_{i}" for i in range(vocabulary_size)]
+    vocabulary[:len(RESTRICTION_VIOLATIONS['vegan'])] = RESTRICTION_VIOLATIONS['vegan']
+    labels = list(RESTRICTION_VIOLATIONS)
+    cuisines = ['American', 'Mediterranean', 'Asian', 'Mexican', 'Indian', 'Italian', 'Health']
+    difficulties = list(DIFFICULTY_LEVELS)
+
+    # Zipf-ish ingredient popularity, like real recipe corpora
+    popularity = 1.0 / np.arange(1, vocabulary_size + 1)
+    popularity /= popularity.sum()
+
+    # Draw every random attribute at once, then assemble the dicts
+    draws = rng.choice(vocabulary_size, size=(count, 24), p=popularity)
+    sizes = rng.integers(4, 12, count)
+    prep_times = rng.integers(5, 90, count)
+    costs = np.round(rng.uniform(2, 15, count), 2)
+    calories = rng.integers(150, 900, count)
+    label_draws = rng.random((count, len(labels))) < 0.2
+    cuisine_draws = rng.integers(len(cuisines), size=count)
+    difficulty_draws = rng.integers(len(difficulties), size=count)
+    proteins = rng.integers(0, 50, count)
+
+    recipes = []
+    for i in range(count):
+        recipes.append({
+            "name": f"Recipe {i}",
+            "ingredients": [vocabulary[j] for j in dict.fromkeys(draws[i].tolist())][:sizes[i]],
+            "meal_type": MEAL_TYPES[i % len(MEAL_TYPES)],
+            "prep_time": int(prep_times[i]),
+            "cost": float(costs[i]),
+            "calories": int(calories[i]),
+            "dietary_labels": [label for label, drawn in zip(labels, label_draws[i]) if drawn],
+            "cuisine": cuisines[cuisine_draws[i]],
+            "difficulty": difficulties[difficulty_draws[i]],
+            "protein": int(proteins[i]),
+            "instructions": []
+        })
+    return recipes
+
+class RecipeCatalog:
+    """
+    Immutable, indexed view of the recipe database.
+
+    Recipes are addressed by integer id (their position in `recipes`, which
+    is grouped by meal type so each meal type is a contiguous id range),
+    ingredients by their id in `ingredient_ids`. Per-recipe attributes used
+    for scoring live in parallel NumPy arrays; dietary labels and
+    restriction violations are uint64 bitsets, one bit per label/restriction.
+    """
+
+    def __init__(self, recipes: Iterable[Dict[str, Any]]):
+        recipes = list(recipes)
+        if any(recipe.get('ingredient_grams') and 'nutrient_coverage' not in recipe for recipe in recipes):
+            # Nutrients weren't precomputed into the catalog file (see recipe_nutrition.py): compute them now, once
+            from recipe_nutrition import with_nutrients
+            recipes = with_nutrients(recipes)
+
+        # Store recipes grouped by meal type so each partition is a contiguous
+        # id range and per-partition arrays are views, not gathers
+        grouped = defaultdict(list)
+        for recipe in recipes:
+            grouped[recipe.get('meal_type')].append(recipe)
+        order = [meal_type for meal_type in MEAL_TYPES if meal_type in grouped]
+        order += [meal_type for meal_type in grouped if meal_type not in MEAL_TYPES]
+
+        self.recipes: List[Dict[str, Any]] = []
+        self.partitions: Dict[str, slice] = {}
+        for meal_type in order:
+            start = len(self.recipes)
+            self.recipes.extend(grouped[meal_type])
+            self.partitions[meal_type] = slice(start, len(self.recipes))
+        n = len(self.recipes)
+        # Name → id of the first recipe with that name
+        self.name_ids: Dict[str, int] = {}
+        for recipe_id, recipe in enumerate(self.recipes):
+            self.name_ids.setdefault(recipe['name'], recipe_id)
+
+        # Ingredient → recipe ids (a recipe repeats once per occurrence of the ingredient)
+        postings = defaultdict(list)
+        lower_postings = defaultdict(set)
+        for recipe_id, recipe in enumerate(self.recipes):
+            for ingredient in recipe['ingredients']:
+                postings[ingredient].append(recipe_id)
+                lower_postings[normalize_ingredient(ingredient)].add(recipe_id)
+        self.ingredient_index: Dict[str, np.ndarray] = {
+            ingredient: np.array(ids, dtype=np.int64) for ingredient, ids in postings.items()
+        }
+        # Normalized name → sorted distinct recipe ids, for matching user-entered names
+        self.normalized_index: Dict[str, np.ndarray] = {
+            ingredient: np.array(sorted(ids), dtype=np.int64) for ingredient, ids in lower_postings.items()
+        }
+        self.ingredient_counts = np.array([len(recipe['ingredients']) for recipe in self.recipes], dtype=np.float64)
+
+        # Recipes × ingredients occurrence counts (CSR), whole catalog and per meal type,
+        # so scoring against a dense per-user ingredient weight vector is one matvec
+        self.ingredient_ids: Dict[str, int] = {ingredient: i for i, ingredient in enumerate(postings)}
+        normalized_columns = defaultdict(list)
+        for ingredient, column in self.ingredient_ids.items():
+            normalized_columns[normalize_ingredient(ingredient)].append(column)
+        self.normalized_columns: Dict[str, List[int]] = dict(normalized_columns)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(self.ingredient_counts, dtype=np.int64)
+        indices = np.fromiter(
+            (self.ingredient_ids[ingredient] for recipe in self.recipes for ingredient in recipe['ingredients']),
+            dtype=np.int32, count=int(indptr[-1])
+        )
+        self.incidence = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr), shape=(n, len(self.ingredient_ids))
+        )
+        self.incidence.sum_duplicates()
+        self.partition_incidence: Dict[str, sparse.csr_matrix] = {
+            meal_type: self.incidence[part] for meal_type, part in self.partitions.items()
+        }
+
+        # Scalar attributes, with the defaults the scorer has always assumed
+        self.prep_time = np.array([recipe.get('prep_time', 30) for recipe in self.recipes], dtype=np.float64)
+        self.calories = np.array([recipe.get('calories', 500) for recipe in self.recipes], dtype=np.float64)
+        self.protein = np.array([recipe.get('protein', 0) for recipe in self.recipes], dtype=np.float64)
+        self.cost = np.array([recipe.get('cost', 5.0) for recipe in self.recipes], dtype=np.float64)
+        self.difficulty = np.array([
+            DIFFICULTY_LEVELS.get(recipe.get('difficulty', 'intermediate'), 2) for recipe in self.recipes
+        ], dtype=np.int8)
+
+        # Per-serving nutrient vectors (columns in nutrient_fields), for recipes that have them;
+        # their calories and protein above already come from these
+        self.nutrient_fields: Tuple[str, ...] = next(
+            (tuple(recipe['nutrients']) for recipe in self.recipes if recipe.get('nutrients')), ()
+        )
+        self.has_nutrients = np.array([bool(recipe.get('nutrients')) for recipe in self.recipes], dtype=bool)
+        self.nutrients = np.zeros((n, len(self.nutrient_fields)), dtype=np.float64)
+        for recipe_id in np.flatnonzero(self.has_nutrients):
+            values = self.recipes[recipe_id]['nutrients']
+            self.nutrients[recipe_id] = [values.get(field, 0.0) for field in self.nutrient_fields]
+
+        self.cuisine_codes: Dict[Any, int] = {}
+        self.cuisine = np.array([
+            self.cuisine_codes.setdefault(recipe.get('cuisine'), len(self.cuisine_codes)) for recipe in self.recipes
+        ], dtype=np.int32)
+
+        # Dietary label bitsets
+        self.label_bits: Dict[str, int] = {}
+        for recipe in self.recipes:
+            for label in recipe.get('dietary_labels', []):
+                self.label_bits.setdefault(label, len(self.label_bits))
+        if len(self.label_bits) > 64:
+            raise ValueError(f"Recipe catalog supports at most 64 dietary labels, got {len(self.label_bits)}")
+        self.labels = np.zeros(n, dtype=np.uint64)
+        for recipe_id, recipe in enumerate(self.recipes):
+            mask = 0
+            for label in recipe.get('dietary_labels', []):
+                mask |= 1 << self.label_bits[label]
+            self.labels[recipe_id] = mask
+
+        # Restriction violation bitsets, built from the lowercase inverted index
+        self.restriction_bits = {restriction: bit for bit, restriction in enumerate(RESTRICTION_VIOLATIONS)}
+        self.violations = np.zeros(n, dtype=np.uint64)
+        for restriction, bit in self.restriction_bits.items():
+            violating = set()
+            for ingredient in RESTRICTION_VIOLATIONS[restriction]:
+                violating |= lower_postings.get(ingredient, set())
+            if violating:
+                self.violations[np.fromiter(violating, dtype=np.int64)] |= np.uint64(1 << bit)
+
+        # Suitability bitsets for hard filtering: a recipe suits a restriction only if it is labeled with it
+        # (or with a label implying it). Ingredient names alone can't prove a recipe safe ('chicken_breast',
+        # 'feta'), so unlabeled recipes never pass a dietary filter.
+        names = list(dict.fromkeys(normalize_label(name) for name in [*RESTRICTION_VIOLATIONS, *self.label_bits]))
+        if len(names) > 64:
+            raise ValueError(f"Recipe catalog supports at most 64 dietary restrictions and labels, got {len(names)}")
+        self.suitability_bits = {name: bit for bit, name in enumerate(names)}
+        self.suitable = np.zeros(n, dtype=np.uint64)
+        for label, label_bit in self.label_bits.items():
+            name = normalize_label(label)
+            mask = 0
+            for suited in (name, *IMPLIED_LABELS.get(name, ())):
+                mask |= 1 << self.suitability_bits[suited]
+            self.suitable[(self.labels & np.uint64(1 << label_bit)) != 0] |= np.uint64(mask)
+
+        logger.info(f"Indexed {n} recipes, {len(self.ingredient_index)} ingredients, {len(self.label_bits)} dietary labels, "
+                    f"{int(self.has_nutrients.sum())} nutrient vectors")
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    def nutrient(self, field: str) -> np.ndarray:
+        """One nutrient per serving for every recipe (NaN for recipes without nutrient vectors)."""
+        if field not in self.nutrient_fields:
+            raise KeyError(f"Unknown nutrient: {field}")
+        return np.where(self.has_nutrients, self.nutrients[:, self.nutrient_fields.index(field)], np.nan)
+
+    def partition(self, meal_type: str) -> slice:
+        """Id range of one meal type's recipes (empty if there are none)."""
+        return self.partitions.get(meal_type, slice(0, 0))
+
+    def meal_type_ids(self, meal_type: str) -> np.ndarray:
+        """Recipe ids of one meal type."""
+        part = self.partition(meal_type)
+        return np.arange(part.start, part.stop, dtype=np.int64)
+
+    def meal_type_incidence(self, meal_type: str) -> sparse.csr_matrix:
+        """Ingredient occurrence matrix of one meal type's recipes, rows aligned with meal_type_ids."""
+        matrix = self.partition_incidence.get(meal_type)
+        if matrix is None:
+            return sparse.csr_matrix((0, len(self.ingredient_ids)))
+        return matrix
+
+    def ingredient_vector(self, weights: Dict[str, float]) -> np.ndarray:
+        """Dense weight vector over the catalog's ingredients; unknown ingredients are dropped."""
+        vector = np.zeros(len(self.ingredient_ids))
+        for ingredient, weight in weights.items():
+            i = self.ingredient_ids.get(ingredient)
+            if i is not None:
+                vector[i] += weight
+        return vector
+
+    def recipes_with(self, ingredient: str) -> np.ndarray:
+        """Recipe ids containing an ingredient (with multiplicity)."""
+        return self.ingredient_index.get(ingredient, np.empty(0, dtype=np.int64))
+
+    def recipes_with_any(self, ingredients: Iterable[str]) -> np.ndarray:
+        """Sorted distinct ids of recipes containing any of the (normalized) ingredients."""
+        postings = [self.normalized_index[ingredient] for ingredient in ingredients if ingredient in self.normalized_index]
+        if not postings:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(postings))
+
+    def label_mask(self, labels: Iterable[str]) -> np.uint64:
+        """Bitset of the given dietary labels; labels no recipe carries are ignored."""
+        mask = 0
+        for label in labels:
+            if label in self.label_bits:
+                mask |= 1 << self.label_bits[label]
+        return np.uint64(mask)
+
+    def restriction_mask(self, restrictions: Iterable[str]) -> int:
+        """Bitset of the given restrictions over `restriction_bits`; unknown ones are ignored."""
+        mask = 0
+        for restriction in restrictions:
+            if restriction in self.restriction_bits:
+                mask |= 1 << self.restriction_bits[restriction]
+        return mask
+
+    def cuisine_mask(self, cuisines: Iterable[str]) -> np.ndarray:
+        """Boolean lookup table over cuisine codes, True for the given cuisines."""
+        mask = np.zeros(len(self.cuisine_codes), dtype=bool)
+        for cuisine in cuisines:
+            if cuisine in self.cuisine_codes:
+                mask[self.cuisine_codes[cuisine]] = True
+        return mask
+
+    def suitability_mask(self, restrictions: Iterable[str]) -> np.uint64:
+        """
+        Bitset of the given restrictions over `suitability_bits`. Known
+        restrictions always count, even if no recipe suits them; names that
+        are neither a known restriction nor any recipe's label are ignored.
+        """
+        mask = 0
+        for restriction in restrictions:
+            bit = self.suitability_bits.get(normalize_label(restriction))
+            if bit is not None:
+                mask |= 1 << bit
+        return np.uint64(mask)
+
+    def filter_ids(self, meal_type: str, recipe_filter: Optional[RecipeFilter]) -> np.ndarray:
+        """
+        Sorted ids of a meal type's recipes that pass a RecipeFilter: every
+        stage is one vectorized mask over the partition (bitset AND for
+        dietary restrictions, compare for prep time, code lookup for cuisine).
+        """
+        part = self.partition(meal_type)
+        if recipe_filter is None or not recipe_filter.active:
+            return np.arange(part.start, part.stop, dtype=np.int64)
+
+        keep = np.ones(part.stop - part.start, dtype=bool)
+        required = self.suitability_mask(recipe_filter.dietary_restrictions)
+        if required:
+            keep &= (self.suitable[part] & required) == required
+        if recipe_filter.max_prep_time is not None:
+            keep &= self.prep_time[part] <= recipe_filter.max_prep_time
+        if recipe_filter.cuisine:
+            cuisine = normalize_ingredient(recipe_filter.cuisine)
+            lookup = np.array([
+                isinstance(name, str) and normalize_ingredient(name) == cuisine for name in self.cuisine_codes
+            ], dtype=bool)
+            preferred = keep & lookup[self.cuisine[part]]
+            if preferred.any():
+                keep = preferred
+        return np.flatnonzero(keep) + part.start
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'RecipeCatalog':
+        """
+        Load the catalog from a JSON file (a list of recipe dicts), taken from
+        `path` or the RECIPE_CATALOG_PATH environment variable. Falls back to
+        the built-in sample recipes.
+        """
+        path = path or os.environ.get('RECIPE_CATALOG_PATH')
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                return cls(json.load(f))
+        if path:
+            logger.warning(f"Recipe catalog {path} not found, using built-in recipes")
+        return cls(SAMPLE_RECIPES)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Recipe Embeddings
+Offline TF-IDF + SVD recipe embeddings with a KMeans (IVF) index, persisted as
+.npy artifacts and memory-mapped online for cosine-similarity retrieval.
+scikit-learn is only needed to build the index, never to serve it.
+"""
+
+import os
+import json
+import shutil
+import zlib
+import argparse
+import logging
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+from recipe_catalog import RecipeCatalog
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS = ('embeddings', 'centroids', 'cluster_members', 'cluster_offsets', 'idf', 'components')
+
+def catalog_fingerprint(catalog: RecipeCatalog) -> str:
+    """Identifies the recipe id order an index was built against."""
+    checksum = 0
+    for recipe in catalog.recipes:
+        checksum = zlib.crc32(f"{recipe.get('name')}|{recipe.get('meal_type')}\n".encode(), checksum)
+    return f"{len(catalog.recipes)}:{checksum:08x}"
+
+def _ingredient_tokens(ingredients: List[str]) -> List[str]:
+    """TF-IDF analyzer: each ingredient is one token."""
+    return [ingredient.lower() for ingredient in ingredients]
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+def build_embedding_index(catalog: RecipeCatalog, out_dir: str, dimensions: int = 64,
+                          clusters: Optional[int] = None, max_features: int = 1000, seed: int = 42) -> Dict[str, Any]:
+    """
+    Fit embeddings and the cluster index for a catalog and write the artifacts
+    to out_dir (replacing any previous build atomically). Returns the metadata.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.cluster import MiniBatchKMeans
+
+    documents = [recipe['ingredients'] for recipe in catalog.recipes]
+    vectorizer = TfidfVectorizer(max_features=max_features, analyzer=_ingredient_tokens)
+    tfidf = vectorizer.fit_transform(documents)
+
+    dimensions = max(1, min(dimensions, tfidf.shape[1] - 1))
+    svd = TruncatedSVD(n_components=dimensions, random_state=seed)
+    embeddings = _normalize_rows(svd.fit_transform(tfidf)).astype(np.float32)
+
+    clusters = clusters or int(np.clip(np.sqrt(len(documents)), 1, 1024))
+    kmeans = MiniBatchKMeans(n_clusters=clusters, random_state=seed, n_init=3, batch_size=4096)
+    labels = kmeans.fit_predict(embeddings)
+    members = np.argsort(labels, kind='stable').astype(np.int64)
+    offsets = np.searchsorted(labels[members], np.arange(clusters + 1)).astype(np.int64)
+
+    vocabulary = {token: int(column) for token, column in vectorizer.vocabulary_.items()}
+    meta = {
+        'fingerprint': catalog_fingerprint(catalog),
+        'recipes': len(documents),
+        'dimensions': dimensions,
+        'clusters': clusters,
+        'explained_variance': float(svd.explained_variance_ratio_.sum()),
+        'built_at': datetime.now().isoformat()
+    }
+
+    tmp_dir = out_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'embeddings.npy'), embeddings)
+    np.save(os.path.join(tmp_dir, 'centroids.npy'), _normalize_rows(kmeans.cluster_centers_).astype(np.float32))
+    np.save(os.path.join(tmp_dir, 'cluster_members.npy'), members)
+    np.save(os.path.join(tmp_dir, 'cluster_offsets.npy'), offsets)
+    np.save(os.path.join(tmp_dir, 'idf.npy'), vectorizer.idf_.astype(np.float32))
+    np.save(os.path.join(tmp_dir, 'components.npy'), svd.components_.astype(np.float32))
+    with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w') as f:
+        json.dump(vocabulary, f)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = out_dir.rstrip(os.sep) + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    logger.info(f"Built recipe embedding index: {meta}")
+    return meta
+
+class RecipeEmbeddingIndex:
+    """
+    Read-only, memory-mapped recipe embedding index.
+
+    Search is IVF-style: rank cluster centroids against the query, then score
+    only the recipes in the best `probes` clusters.
+    """
+
+    def __init__(self, directory: str, catalog: RecipeCatalog):
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        if self.meta['fingerprint'] != catalog_fingerprint(catalog):
+            raise ValueError(f"Embedding index in {directory} was built for a different recipe catalog")
+
+        self.directory = directory
+        self._map_arrays()
+        with open(os.path.join(directory, 'vocabulary.json'), 'r') as f:
+            self.vocabulary: Dict[str, int] = json.load(f)
+
+    def _map_arrays(self):
+        arrays = {name: np.load(os.path.join(self.directory, f'{name}.npy'), mmap_mode='r') for name in ARTIFACTS}
+        self.embeddings = arrays['embeddings']
+        self.centroids = arrays['centroids']
+        self.cluster_members = arrays['cluster_members']
+        self.cluster_offsets = arrays['cluster_offsets']
+        self.idf = arrays['idf']
+        self.components = arrays['components']
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Pickled for worker processes: they map the same files instead of receiving copies of the arrays
+        return {'directory': self.directory, 'meta': self.meta, 'vocabulary': self.vocabulary}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._map_arrays()
+
+    @classmethod
+    def load(cls, directory: str, catalog: RecipeCatalog) -> Optional['RecipeEmbeddingIndex']:
+        """The index in `directory`, or None if it hasn't been built or doesn't match the catalog."""
+        if not os.path.exists(os.path.join(directory, 'meta.json')):
+            return None
+        try:
+            return cls(directory, catalog)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Recipe embedding index not loaded: {e}")
+            return None
+
+    def embed_ingredients(self, ingredients: Iterable[str]) -> Optional[np.ndarray]:
+        """Project an ingredient list into the embedding space (None if no ingredient is known)."""
+        weights = np.zeros(len(self.idf), dtype=np.float32)
+        for token in _ingredient_tokens(list(ingredients)):
+            column = self.vocabulary.get(token)
+            if column is not None:
+                weights[column] += self.idf[column]
+        norm = np.linalg.norm(weights)
+        if norm == 0:
+            return None
+        vector = self.components @ (weights / norm)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def profile_vector(self, weighted_meals: Iterable[Tuple[Iterable[str], float]]) -> Optional[np.ndarray]:
+        """Normalized weighted mean of the embeddings of (ingredients, weight) meals."""
+        total = None
+        for ingredients, weight in weighted_meals:
+            vector = self.embed_ingredients(ingredients)
+            if vector is not None:
+                total = vector * weight if total is None else total + vector * weight
+        if total is None:
+            return None
+        norm = np.linalg.norm(total)
+        return total / norm if norm > 0 else None
+
+    def search(self, query: np.ndarray, k: int = 50, part: Optional[slice] = None,
+               probes: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k (recipe ids, cosine similarities) for a normalized query, optionally
+        restricted to a catalog id range. Falls back to a full scan of the range
+        when the probed clusters hold fewer than k candidates.
+        """
+        start, stop = (part.start, part.stop) if part is not None else (0, len(self.embeddings))
+        if stop <= start or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        centroid_scores = self.centroids @ query
+        probes = min(probes, len(centroid_scores))
+        best_clusters = np.argpartition(-centroid_scores, probes - 1)[:probes]
+        candidates = np.concatenate([
+            self.cluster_members[self.cluster_offsets[c]:self.cluster_offsets[c + 1]] for c in best_clusters
+        ])
+        candidates = candidates[(candidates >= start) & (candidates < stop)]
+
+        if len(candidates) < k:
+            candidates = np.arange(start, stop, dtype=np.int64)
+            similarities = self.embeddings[start:stop] @ query
+        else:
+            candidates = np.sort(candidates)  # Sequential reads from the memory map
+            similarities = self.embeddings[candidates] @ query
+
+        k = min(k, len(candidates))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return candidates[top], similarities[top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe embedding index maintenance")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subcommands.add_parser('build', help="Fit embeddings and the cluster index for the recipe catalog")
+    build_parser.add_argument('--catalog', default=None, help="Recipe catalog JSON (default: RECIPE_CATALOG_PATH or built-in recipes)")
+    build_parser.add_argument('--out', default=os.environ.get('RECIPE_EMBEDDINGS_DIR', os.path.join("ai_meal_data", "recipe_embeddings")))
+    build_parser.add_argument('--dimensions', type=int, default=64)
+    build_parser.add_argument('--clusters', type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        logging.basicConfig(level=logging.INFO)
+        catalog = RecipeCatalog.load(args.catalog)
+        meta = build_embedding_index(catalog, args.out, dimensions=args.dimensions, clusters=args.clusters)
+        print(f"Built index for {meta['recipes']} recipes ({meta['dimensions']} dims, {meta['clusters']} clusters) in {args.out}")
+
+if __name__ == "__main__":
+    main()
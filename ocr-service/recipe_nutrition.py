@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Recipe Nutrition
+Per-serving nutrient vectors for recipes whose ingredient quantities all
+resolve to known foods, computed from the calorie service's nutrient
+database in one sparse product over the whole catalog. They are computed
+once, when the catalog is built, or offline into the catalog file itself,
+so scoring and plan constraints read real values without any per-request
+calorie computation.
+"""
+
+import os
+import json
+import argparse
+import logging
+import numpy as np
+from scipy import sparse
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Recipe ingredient names for foods the nutrient database lists under another name. Only
+# true synonyms belong here: 'almond_milk' is not 'milk' and 'sweet_potato' is not 'potato'.
+FOOD_ALIASES = {
+    'chicken_breast': 'chicken',
+    'chicken_thigh': 'chicken',
+    'rolled_oats': 'oats',
+    'oatmeal': 'oats',
+    'white_rice': 'rice',
+    'spaghetti': 'pasta',
+    'penne': 'pasta',
+    'cheddar': 'cheese',
+    'whole_milk': 'milk',
+    'sunflower_seeds': 'sunflower_seed',
+}
+# Seasonings used in amounts too small to matter: they count as resolved, with no nutrients
+NEGLIGIBLE_INGREDIENTS = frozenset({'pepper', 'black_pepper', 'herbs', 'garlic', 'ginger', 'cinnamon'})
+
+def _singular_forms(word: str) -> List[str]:
+    forms = [word]
+    if word.endswith('ies'):
+        forms.append(word[:-3] + 'y')
+    if word.endswith('oes'):
+        forms.append(word[:-2])
+    if word.endswith('s'):
+        forms.append(word[:-1])
+    return forms
+
+def food_key(name: str, food_index: Dict[str, int]) -> Optional[str]:
+    """
+    Nutrient-database food for an ingredient name: the name itself or its
+    singular ('eggs', 'tomatoes'), else its entry in FOOD_ALIASES. Anything
+    else is unknown (None), however close its words look.
+    """
+    canonical = name.strip().lower().replace(' ', '_').replace('-', '_')
+    for form in _singular_forms(canonical):
+        if form in food_index:
+            return form
+        if FOOD_ALIASES.get(form) in food_index:
+            return FOOD_ALIASES[form]
+    return None
+
+def _is_negligible(name: str) -> bool:
+    return name.strip().lower().replace(' ', '_').replace('-', '_') in NEGLIGIBLE_INGREDIENTS
+
+def recipe_nutrient_matrix(recipes: List[Dict[str, Any]], calculator=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (per-serving nutrients, coverage, complete) of each recipe from its
+    'ingredient_grams' ({ingredient: grams per serving}): a recipes ×
+    NUTRIENT_VECTOR_FIELDS matrix of the resolved ingredients, the share of
+    each recipe's grams that resolved (0 for recipes without quantities),
+    and whether every one of its ingredients did.
+    """
+    if calculator is None:
+        from calorie_calculation_service import calorie_calculator as calculator
+
+    rows, columns, grams = [], [], []
+    totals = np.zeros(len(recipes))
+    resolved = np.zeros(len(recipes))
+    complete = np.zeros(len(recipes), dtype=bool)
+    foods: Dict[str, Optional[str]] = {}
+    for row, recipe in enumerate(recipes):
+        quantities = recipe.get('ingredient_grams') or {}
+        complete[row] = bool(quantities)
+        for name, weight in quantities.items():
+            weight = float(weight)
+            totals[row] += weight
+            if name not in foods:
+                foods[name] = food_key(name, calculator.food_index)
+            if foods[name] is not None:
+                rows.append(row)
+                columns.append(calculator.food_index[foods[name]])
+                grams.append(weight)
+                resolved[row] += weight
+            elif _is_negligible(name):
+                resolved[row] += weight
+            else:
+                complete[row] = False
+
+    # Recipes × foods grams; ingredients that map to the same food add up
+    quantities = sparse.csr_matrix((grams, (rows, columns)), shape=(len(recipes), len(calculator.food_index)))
+    nutrients = quantities @ calculator.nutrient_matrix / 100
+    coverage = np.divide(resolved, totals, out=np.zeros(len(recipes)), where=totals > 0)
+    return nutrients, coverage, complete
+
+def with_nutrients(recipes: List[Dict[str, Any]], calculator=None) -> List[Dict[str, Any]]:
+    """
+    The recipes, with copies of those that list ingredient quantities
+    carrying 'nutrient_coverage' and, if every ingredient resolved,
+    per-serving 'nutrients' (NUTRIENT_VECTOR_FIELDS → value) that also
+    replace their 'calories' and 'protein'. Partly resolved recipes keep
+    their catalog values; other recipes are returned as they are.
+    """
+    from calorie_calculation_service import NUTRIENT_VECTOR_FIELDS
+
+    nutrients, coverage, complete = recipe_nutrient_matrix(recipes, calculator)
+    calories, protein = NUTRIENT_VECTOR_FIELDS.index('calories'), NUTRIENT_VECTOR_FIELDS.index('protein')
+    rounded = np.round(nutrients, 3).tolist()
+    result = []
+    for recipe, vector, rounded_vector, covered, resolved in zip(recipes, nutrients.tolist(), rounded,
+                                                                 coverage.tolist(), complete.tolist()):
+        if not recipe.get('ingredient_grams'):
+            result.append(recipe)
+            continue
+        recipe = dict(recipe, nutrient_coverage=round(covered, 3))
+        if resolved:
+            recipe['nutrients'] = dict(zip(NUTRIENT_VECTOR_FIELDS, rounded_vector))
+            recipe['calories'] = round(vector[calories], 1)
+            recipe['protein'] = round(vector[protein], 1)
+        else:
+            recipe.pop('nutrients', None)
+        result.append(recipe)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe nutrient precomputation")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    precompute_parser = subcommands.add_parser('precompute', help="Write nutrient vectors into a recipe catalog file")
+    precompute_parser.add_argument('--catalog', default=os.environ.get('RECIPE_CATALOG_PATH'), required=not os.environ.get('RECIPE_CATALOG_PATH'))
+    precompute_parser.add_argument('--out', default=None, help="Output catalog JSON (default: overwrite --catalog)")
+
+    args = parser.parse_args()
+
+    if args.command == 'precompute':
+        logging.basicConfig(level=logging.INFO)
+        with open(args.catalog, 'r') as f:
+            recipes = json.load(f)
+        recipes = with_nutrients(recipes)
+        out = args.out or args.catalog
+        with open(out + '.tmp', 'w') as f:
+            json.dump(recipes, f)
+        os.replace(out + '.tmp', out)
+        quantified = sum(1 for recipe in recipes if 'nutrient_coverage' in recipe)
+        computed = sum(1 for recipe in recipes if recipe.get('nutrients'))
+        print(f"Nutrients for {computed} of {quantified} recipes with quantities ({len(recipes)} recipes) in {out}")
+
+if __name__ == "__main__":
+    main()
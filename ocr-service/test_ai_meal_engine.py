@@ -0,0 +1,956 @@
+#!/usr/bin/env python3
+"""
+Test script for the AI meal engine's learning and storage paths.
+Runs against a throwaway data directory; no service needs to be running.
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import subprocess
+import math
+import time
+import random
+import tempfile
+import numpy as np
+from collections import Counter
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_meal_generator import AIPersonalizationEngine, MealRecord, MealRating, UserPreference, parse_meal_id
+from meal_history import MealHistory
+from waste_reduction import ExpiringInventory
+from recipe_catalog import RecipeCatalog, RecipeFilter, RESTRICTION_VIOLATIONS, SAMPLE_RECIPES, synthetic_recipes
+from recipe_nutrition import NEGLIGIBLE_INGREDIENTS, food_key, with_nutrients
+from recipe_embeddings import RecipeEmbeddingIndex, build_embedding_index
+from meal_plan_optimizer import PlanConstraints, PlanOptimizer
+
+def _meal(user_id: str, i: int, rating: float = 4.0) -> MealRecord:
+    return MealRecord(
+        user_id=user_id,
+        meal_name=f"Meal {i}",
+        ingredients=["rice", "tofu", f"veg_{i % 4}"],
+        meal_type=["breakfast", "lunch", "dinner"][i % 3],
+        date="2026-01-01",
+        rating=rating,
+        prep_time=10 + i % 30
+    )
+
+def _same_scores(a: dict, b: dict) -> bool:
+    """Ingredient scores match up to float rounding (batch and sequential EMA sum in different orders)."""
+    return a.keys() == b.keys() and all(math.isclose(a[k], b[k], abs_tol=1e-9) for k in a)
+
+def test_event_log_recovery():
+    """Derived state survives a restart even when no snapshot was taken."""
+
+    print("💾 Testing event log recovery")
+    print("=" * 60)
+
+    data_dir = tempfile.mkdtemp(prefix="meal_engine_test_")
+    engine = AIPersonalizationEngine(data_dir=data_dir)
+    for i in range(engine.SNAPSHOT_INTERVAL + 7):
+        engine.learn_from_meal(_meal("recovery_user", i, rating=1 + i % 5))
+
+    # Simulate a crash: a fresh engine sees only the log and the last snapshot
+    restarted = AIPersonalizationEngine(data_dir=data_dir)
+    restarted_prefs = restarted.get_user_preferences("recovery_user")
+
+    assert len(restarted.meal_history["recovery_user"]) == len(engine.meal_history["recovery_user"])
+    assert _same_scores(restarted.ingredient_preferences["recovery_user"], engine.ingredient_preferences["recovery_user"])
+    assert restarted_prefs == engine.user_preferences["recovery_user"]
+    print("✅ History, ingredient scores and preferences recovered")
+
+def test_concurrent_learning():
+    """Thousands of concurrent records end in the same state as replaying the log in order."""
+
+    print("\n🧵 Testing concurrent meal recording")
+    print("=" * 60)
+
+    data_dir = tempfile.mkdtemp(prefix="meal_engine_test_")
+    engine = AIPersonalizationEngine(data_dir=data_dir)
+    users = [f"stress_user_{i}" for i in range(25)]
+    records = [_meal(users[i % len(users)], i, rating=1 + i % 5) for i in range(5000)]
+
+    # Mix queued submissions with direct calls and concurrent readers
+    def record(i_record):
+        i, meal_record = i_record
+        if i % 10 == 0:
+            engine.learn_from_meal(meal_record)
+        else:
+            engine.submit_meal(meal_record)
+        if i % 50 == 0:
+            engine.generate_personalized_meals(meal_record.user_id, days=1)
+            engine.get_user_insights(meal_record.user_id)
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(record, enumerate(records)))
+    engine.learning_queue.join()
+
+    for user_id in users:
+        assert len(engine.meal_history[user_id]) == 200, user_id
+    print(f"✅ All {len(records)} meals applied")
+
+    # Replaying the event log from scratch must reproduce the in-memory state
+    conn = sqlite3.connect(os.path.join(data_dir, "meal_engine.db"))
+    conn.execute("DELETE FROM user_state")
+    conn.commit()
+    conn.close()
+    replayed = AIPersonalizationEngine(data_dir=data_dir)
+    for user_id in users:
+        replayed_prefs = replayed.get_user_preferences(user_id)
+        assert _same_scores(replayed.ingredient_preferences[user_id], engine.ingredient_preferences[user_id]), user_id
+        assert replayed_prefs == engine.user_preferences[user_id], user_id
+    print("✅ Final state matches an in-order replay of the event log")
+
+def test_batch_learning():
+    """One batch ingestion ends in the same state as learning the meals one at a time."""
+
+    print("\n📦 Testing batch learning")
+    print("=" * 60)
+
+    users = [f"batch_user_{i}" for i in range(10)]
+    records = [_meal(users[i % len(users)], i, rating=1 + i % 5) for i in range(3000)]
+    # Unrated meals are logged but don't move ingredient scores
+    records += [MealRecord(user_id=users[0], meal_name="Unrated", ingredients=["rice", "okra"],
+                           meal_type="lunch", date="2026-01-02")]
+
+    sequential = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"))
+    for meal_record in records:
+        sequential.learn_from_meal(meal_record)
+
+    batched = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"))
+    batched.learn_from_meals(records)
+
+    for user_id in users:
+        assert len(batched.meal_history[user_id]) == len(sequential.meal_history[user_id]), user_id
+        assert _same_scores(batched.ingredient_preferences[user_id], sequential.ingredient_preferences[user_id]), user_id
+        assert batched.get_user_preferences(user_id) == sequential.get_user_preferences(user_id), user_id
+    assert "okra" not in batched.ingredient_preferences[users[0]]
+    print(f"✅ Batch of {len(records)} meals matches sequential learning")
+
+    # Batch state is snapshotted, so a restart needs no replay
+    restarted = AIPersonalizationEngine(data_dir=batched.data_dir)
+    restarted.get_user_preferences(users[0])
+    assert restarted._unsnapshotted_events[users[0]] == 0
+    print("✅ Batch snapshot covers every ingested meal")
+
+def test_catalog_scoring():
+    """Vectorized catalog scoring agrees with the per-recipe reference scorer."""
+
+    print("\n📇 Testing indexed catalog scoring")
+    print("=" * 60)
+
+    recipes = synthetic_recipes(2000, seed=1)
+    recipes.append(dict(recipes[1], name="Empty Recipe", ingredients=[]))
+    catalog = RecipeCatalog(recipes)
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    profiles = [
+        (UserPreference(user_id="plain"), {}, []),
+        (UserPreference(user_id="picky", dietary_restrictions=["vegan", "gluten_free"],
+                        favorite_ingredients=["ingredient_10", "ingredient_11"],
+                        disliked_ingredients=["ingredient_12"], preferred_cuisines=["Asian", "Mexican"],
+                        cooking_skill="beginner", health_goals=["weight_loss"]),
+         {"ingredient_10": 0.6, "ingredient_20": -0.4}, ["ingredient_30", "eggs"]),
+        (UserPreference(user_id="lifter", dietary_restrictions=["keto"], health_goals=["muscle_gain"],
+                        cooking_skill="advanced"), {"fish": 0.9}, []),
+    ]
+
+    for user_prefs, ingredient_prefs, available in profiles:
+        for meal_type in ("breakfast", "lunch", "dinner", "snack"):
+            recipe_ids = catalog.meal_type_ids(meal_type)
+            vectorized = engine._score_recipes(meal_type, user_prefs, ingredient_prefs, available)
+            reference = [engine._calculate_meal_score(catalog.recipes[i], user_prefs, ingredient_prefs, available)
+                         for i in recipe_ids]
+            assert np.allclose(vectorized, reference), (user_prefs.user_id, meal_type)
+            assert np.isfinite(vectorized).all()
+            assert np.isfinite(engine._score_recipes_batch(meal_type, [(user_prefs, ingredient_prefs)])).all()
+    print("✅ Vectorized scores match the reference scorer, also for a recipe without ingredients")
+
+def test_large_catalog_plan():
+    """A week's plan from a 100k-recipe catalog is fast and doesn't repeat recipes."""
+
+    print("\n🗂️  Testing plan generation on a 100k-recipe catalog")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(100000, seed=2))
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    engine.set_user_preferences(UserPreference(user_id="big_user", favorite_ingredients=["ingredient_40"],
+                                               dietary_restrictions=["vegetarian"]))
+
+    start = time.perf_counter()
+    plan = engine.generate_personalized_meals("big_user", days=7, meals_per_day=4)
+    elapsed = time.perf_counter() - start
+
+    assert len(plan) == 28
+    for meal_type in ("breakfast", "lunch", "dinner", "snack"):
+        names = [meal.name for meal in plan if meal.meal_type == meal_type]
+        assert len(names) == len(set(names)) == 7, meal_type
+    print(f"✅ 7-day plan in {elapsed * 1000:.0f} ms with no repeated recipes")
+
+def test_embedding_index():
+    """Offline-built embeddings load via mmap and retrieve similar recipes."""
+
+    print("\n🧭 Testing recipe embedding index")
+    print("=" * 60)
+
+    # Serving without artifacts must not pull in scikit-learn
+    check = "import sys, ai_meal_generator; sys.exit('sklearn' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", check], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env={**os.environ, "RECIPE_EMBEDDINGS_DIR": tempfile.mkdtemp()}, capture_output=True)
+    assert result.returncode == 0, result.stderr.decode()
+    print("✅ scikit-learn not imported when no index exists")
+
+    catalog = RecipeCatalog(synthetic_recipes(20000, seed=3))
+    index_dir = os.path.join(tempfile.mkdtemp(prefix="meal_engine_test_"), "recipe_embeddings")
+    build_embedding_index(catalog, index_dir, dimensions=32)
+    index = RecipeEmbeddingIndex.load(index_dir, catalog)
+    assert isinstance(index.embeddings, np.memmap)
+    assert RecipeEmbeddingIndex.load(index_dir, RecipeCatalog(synthetic_recipes(100, seed=3))) is None
+
+    # IVF search finds most of the true nearest neighbours
+    recall = []
+    for recipe_id in range(0, len(catalog), 997):
+        query = index.embed_ingredients(catalog.recipes[recipe_id]['ingredients'])
+        exact = set(np.argsort(-(np.asarray(index.embeddings) @ query))[:20])
+        start = time.perf_counter()
+        found, _ = index.search(query, k=20)
+        elapsed = time.perf_counter() - start
+        recall.append(len(exact & set(found)) / 20)
+    assert np.mean(recall) > 0.8, np.mean(recall)
+    print(f"✅ Recall@20 {np.mean(recall):.2f}, {elapsed * 1000:.1f} ms/query")
+
+    # Meals like the ones a user loved come back first
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog,
+                                     embeddings_dir=index_dir)
+    loved = catalog.recipes[catalog.partition("dinner").start]
+    for i in range(5):
+        engine.learn_from_meal(MealRecord(user_id="taste_user", meal_name=loved["name"], ingredients=loved["ingredients"],
+                                          meal_type="dinner", date="2026-01-01", rating=5))
+    similar = engine.similar_to_liked_meals("taste_user", meal_type="dinner", k=5)
+    assert similar[0]["name"] == loved["name"] and all(meal["meal_type"] == "dinner" for meal in similar)
+    assert len(engine.generate_personalized_meals("taste_user", days=7)) == 21
+    print("✅ Retrieval follows the user's highly rated meals")
+
+def test_plan_optimizer():
+    """Whole-plan search meets budget/calorie targets and uses expiring items the greedy plan misses."""
+
+    print("\n🧩 Testing constraint-based plan optimizer")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(20000, seed=4))
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    constraints = PlanConstraints(weekly_budget=120.0, daily_calories=1500, min_daily_protein=60,
+                                  expiring={"Ingredient_300": 2, "ingredient_400": 3, "ingredient_500": 5})
+
+    greedy, greedy_report = engine.generate_meal_plan("plan_user", days=7)
+    assert greedy_report["optimizer"] == "greedy"
+    greedy_cost = sum(meal.estimated_cost for meal in greedy)
+
+    start = time.perf_counter()
+    optimized, report = engine.generate_meal_plan("plan_user", days=7, constraints=constraints)
+    elapsed = time.perf_counter() - start
+
+    assert report["optimizer"] == "local_search" and len(optimized) == 21
+    assert elapsed < 1.0, elapsed
+    assert report["within_budget"], report
+    assert math.isclose(sum(meal.estimated_cost for meal in optimized), report["total_cost"], abs_tol=0.01)
+    assert all(1350 - 100 <= calories <= 1650 + 100 for calories in report["daily_calories"]), report["daily_calories"]
+    assert report["expiring_used"] == ["ingredient_300", "ingredient_400", "ingredient_500"], report
+    assert report["repeated_recipes"] == 0
+    print(f"✅ Plan cost {report['total_cost']:.2f} (greedy {greedy_cost:.2f}), "
+          f"calories {report['daily_calories']}, {report['iterations']} moves in {elapsed * 1000:.0f} ms")
+
+    # Incremental move deltas stay consistent with a full recomputation
+    pools = {meal_type: engine._plan_pool(meal_type, *engine._score_meal_type(UserPreference(user_id="x"), {}, meal_type, []))
+             for meal_type in ("breakfast", "lunch", "dinner")}
+    optimizer = PlanOptimizer(catalog, time_budget=0.05, rng=random.Random(0))
+    slots = [(day, meal_type) for day in range(7) for meal_type in ("breakfast", "lunch", "dinner")]
+    _, report = optimizer.optimize(slots, pools, constraints)
+    assert math.isclose(optimizer._objective(), report["objective"], abs_tol=1e-3)
+    print("✅ Incremental objective matches full recomputation")
+
+def test_incremental_preferences():
+    """Incrementally maintained preferences match a full rescan of the history after every meal."""
+
+    print("\n📈 Testing incremental preference statistics")
+    print("=" * 60)
+
+    rng = random.Random(5)
+    data_dir = tempfile.mkdtemp(prefix="meal_engine_test_")
+    engine = AIPersonalizationEngine(data_dir=data_dir)
+    vocabulary = [f"item_{i}" for i in range(25)]
+    for i in range(400):
+        engine.learn_from_meal(MealRecord(
+            user_id="stats_user",
+            meal_name=f"Meal {i}",
+            ingredients=[rng.choice(vocabulary) for _ in range(rng.randint(1, 6))],  # Duplicates allowed
+            meal_type=rng.choice(["breakfast", "lunch", "dinner", "snack"]),
+            date="2026-01-01",
+            rating=rng.choice([None, 1, 2, 3, 4, 4.5, 5]),
+            prep_time=rng.choice([None, 0, 5, 12, 30, 47]),
+            enjoyed=rng.choice([None, True, False])
+        ))
+        incremental = engine.get_user_preferences("stats_user")
+        engine._recompute_user_preferences("stats_user")
+        full = engine.get_user_preferences("stats_user")
+        assert incremental == full, i
+    print("✅ Favorites, meal frequency and time limits match the full rescan for 400 meals")
+
+    # Stats rebuilt from a loaded history carry on identically
+    restarted = AIPersonalizationEngine(data_dir=data_dir)
+    restarted.get_user_preferences("stats_user")
+    meal = MealRecord(user_id="stats_user", meal_name="Extra", ingredients=["item_1", "item_2"],
+                      meal_type="lunch", date="2026-01-02", rating=5, prep_time=20)
+    engine.learn_from_meal(meal)
+    restarted.learn_from_meal(meal)
+    assert restarted.get_user_preferences("stats_user") == engine.get_user_preferences("stats_user")
+    print("✅ Statistics rebuilt after restart stay consistent")
+
+def test_hot_user_cache():
+    """Users are loaded on demand, the hot set stays bounded, and evicted state is written back."""
+
+    print("\n🔥 Testing hot-user cache")
+    print("=" * 60)
+
+    # Startup doesn't depend on how many users the store holds
+    data_dir = tempfile.mkdtemp(prefix="meal_engine_test_")
+    seeded = AIPersonalizationEngine(data_dir=data_dir)
+    seeded.store.append_events([(f"cold_user_{i % 5000}", 'meal', asdict(_meal(f"cold_user_{i % 5000}", i)))
+                                for i in range(100000)])
+    start = time.perf_counter()
+    engine = AIPersonalizationEngine(data_dir=data_dir, max_hot_users=5, max_cached_meals=120)
+    startup = time.perf_counter() - start
+    assert not engine._loaded_users and startup < 1.0, startup
+    print(f"✅ Started in {startup * 1000:.0f} ms over 5,000 stored users without loading any")
+
+    reference = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"))
+    users = [f"hot_user_{i}" for i in range(30)]
+    for i in range(600):
+        meal_record = _meal(users[(i * 7) % len(users)], i, rating=1 + i % 5)
+        engine.learn_from_meal(meal_record)
+        reference.learn_from_meal(meal_record)
+        assert len(engine._loaded_users) <= 5 and engine._cached_meals <= 120
+    engine.get_user_preferences("cold_user_42")
+    assert len(engine.meal_history["cold_user_42"]) == 20
+
+    for user_id in users:
+        prefs = engine.get_user_preferences(user_id)
+        assert prefs == reference.get_user_preferences(user_id), user_id
+        assert _same_scores(engine.ingredient_preferences[user_id], reference.ingredient_preferences[user_id]), user_id
+        assert len(engine.meal_history[user_id]) == 20, user_id
+    assert len(engine._loaded_users) <= 5
+    print("✅ Hot set stayed within 5 users / 120 meals; evicted users reload identically")
+
+def test_compact_history():
+    """The columnar history round-trips records and yields the same insights as the record list."""
+
+    print("\n🗜️ Testing compact meal history")
+    print("=" * 60)
+
+    rng = random.Random(11)
+    records = [
+        MealRecord(
+            user_id="compact_user",
+            meal_name=f"Meal {i % 7}",
+            ingredients=[f"item_{rng.randrange(40)}" for _ in range(rng.randrange(0, 6))],
+            meal_type=rng.choice(["breakfast", "lunch", "dinner", "snack", "brunch"]),
+            date=rng.choice(["2026-01-01", "2026-02-28", "yesterday", "2026-03-01T08:00"]),
+            rating=rng.choice([None, 0, 1, 3.5, 4, 5]),
+            prep_time=rng.choice([None, 0, 5, 25]),
+            cost=rng.choice([None, 3.25]),
+            calories=rng.choice([None, 0, 640]),
+            enjoyed=rng.choice([None, True, False])
+        )
+        for i in range(300)
+    ]
+    history = MealHistory()
+    for start in range(0, len(records), 37):
+        history.extend(records[start:start + 37])
+    assert len(history) == len(records) and list(history) == records
+    assert history[-1] == records[-1] and history[-20:] == records[-20:]
+    print("✅ Records (including missing fields and non-ISO dates) round-trip exactly")
+
+    view = history.view()
+    history.extend(records[:50])
+    assert len(view) == 300 and list(view) == records and len(history) == 350
+    print("✅ Views stay fixed while the history grows")
+
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"))
+    engine.learn_from_meals(records)
+    insights = engine.get_user_insights("compact_user")
+    assert insights["favorite_meal_type"] == Counter(m.meal_type for m in records).most_common(1)[0][0]
+    assert math.isclose(insights["average_rating"], np.mean([m.rating for m in records if m.rating]))
+    assert insights["most_used_ingredients"] == Counter(i for m in records for i in m.ingredients).most_common(10)
+    times = {}
+    for m in records:
+        if m.prep_time:
+            times.setdefault(m.meal_type, []).append(m.prep_time)
+    assert list(insights["cooking_time_analysis"]) == list(times)
+    for meal_type, values in times.items():
+        analysis = insights["cooking_time_analysis"][meal_type]
+        assert analysis["average_time"] == np.mean(values)
+        assert analysis["preferred_range"] == f"{min(values)}-{max(values)} minutes"
+    print("✅ Insights match the record-list computation")
+
+    legacy_bytes = sum(sys.getsizeof(m) + sys.getsizeof(m.ingredients) for m in records) / len(records)
+    compact_bytes = MealHistory.from_records(records).nbytes / len(records)
+    assert compact_bytes < legacy_bytes / 2, (compact_bytes, legacy_bytes)
+    print(f"✅ {compact_bytes:.0f} bytes/meal vs. {legacy_bytes:.0f} for record objects (container overhead alone)")
+
+def test_waste_reduction():
+    """Every expiring item with a matching recipe is scheduled before it expires."""
+
+    print("\n♻️ Testing waste reduction planner")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(20000, seed=5))
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    expiring = [
+        {"name": " Ingredient_400", "days_left": 0, "cost": 3.0},
+        {"name": "ingredient_401", "days_left": 1},
+        {"name": "INGREDIENT_402", "days_left": 1},
+        {"name": "ingredient_403", "days_left": 2},
+        {"name": "ingredient_404", "days_left": 3},
+        {"name": "ingredient_405", "days_left": 6},
+        {"name": "ingredient_405", "days_left": 2},  # Duplicate: earliest expiry wins
+        {"name": "not_in_any_recipe", "days_left": 1}
+    ]
+    inventory = ExpiringInventory(expiring)
+    assert [item.name for item in inventory.by_urgency()][:3] == ["ingredient_400", "ingredient_401", "ingredient_402"]
+    assert inventory.get("Ingredient_405").days_left == 2
+
+    # Index retrieval finds exactly the recipes a scan would
+    scanned = [recipe_id for recipe_id, recipe in enumerate(catalog.recipes)
+               if any(ingredient.lower() in inventory.items for ingredient in recipe['ingredients'])]
+    assert engine.waste_planner.candidates(inventory).tolist() == scanned
+    print(f"✅ Inverted index returns the same {len(scanned)} candidates as a full scan")
+
+    start = time.perf_counter()
+    meals, report = engine.plan_waste_reduction("waste_user", expiring, days=3)
+    elapsed = time.perf_counter() - start
+    assert report["uncovered"] == ["not_in_any_recipe"], report
+    for name, day in report["covered"].items():
+        assert day < inventory.items[name].deadline, (name, day)
+    for meal in meals:
+        day = parse_meal_id(meal.meal_id)[2]
+        assert inventory.fresh_in(meal.ingredients, day), meal.name
+        assert "expiring ingredients" in meal.reasoning
+    assert len({meal.name for meal in meals}) == len(meals) == 9
+    print(f"✅ {len(report['covered'])}/{len(inventory)} items covered before expiry in {elapsed * 1000:.0f} ms")
+
+    # Generating a plan first and filtering afterwards leaves items unused
+    generated = engine.generate_personalized_meals("waste_user", days=3, available_ingredients=list(inventory.items))
+    used = {item.name for meal in generated for item in inventory.fresh_in(meal.ingredients, parse_meal_id(meal.meal_id)[2])}
+    assert len(used) < len(report["covered"])
+    print(f"✅ Generate-then-filter would have used only {len(used)} of them")
+
+def _same_insights(a: dict, b: dict) -> bool:
+    """Insights match, allowing float rounding in running totals."""
+    if a.keys() != b.keys():
+        return False
+    for key in a:
+        if isinstance(a[key], float):
+            if not math.isclose(a[key], b[key], rel_tol=1e-12):
+                return False
+        elif key == "cooking_time_analysis":
+            if list(a[key]) != list(b[key]) or any(
+                not math.isclose(a[key][t]["average_time"], b[key][t]["average_time"], rel_tol=1e-12)
+                or a[key][t]["preferred_range"] != b[key][t]["preferred_range"] for t in a[key]
+            ):
+                return False
+        elif a[key] != b[key]:
+            return False
+    return True
+
+def test_materialized_insights():
+    """Cached insights track learning exactly and their ETag changes only when they do."""
+
+    print("\n🔎 Testing materialized user insights")
+    print("=" * 60)
+
+    data_dir = tempfile.mkdtemp(prefix="meal_engine_test_")
+    engine = AIPersonalizationEngine(data_dir=data_dir)
+    rng = random.Random(17)
+
+    def random_meal(i):
+        return MealRecord(
+            user_id="insight_user", meal_name=f"Meal {i}",
+            ingredients=[f"item_{rng.randrange(60)}" for _ in range(rng.randrange(1, 5))],
+            meal_type=rng.choice(["breakfast", "lunch", "dinner", "snack"]), date="2026-01-01",
+            rating=rng.choice([None, 0, 2, 4, 4.5]), prep_time=rng.choice([None, 0, 8, 20, 45])
+        )
+
+    _, empty_etag = engine.get_user_insights_with_etag("insight_user")
+    for i in range(120):
+        if i % 3:
+            engine.learn_from_meal(random_meal(i))
+        else:
+            engine.learn_from_meals([random_meal(i), random_meal(1000 + i)])
+        insights, etag = engine.get_user_insights_with_etag("insight_user")
+        assert _same_insights(insights, engine._recompute_user_insights("insight_user")), i
+        assert etag != empty_etag
+    print("✅ Incremental insights match a full recomputation after every learning step")
+
+    assert engine.get_user_insights_with_etag("insight_user")[1] == etag
+    engine.set_user_preferences(UserPreference(user_id="insight_user", preferred_cuisines=["Asian"]))
+    insights, new_etag = engine.get_user_insights_with_etag("insight_user")
+    assert new_etag != etag and insights["preferred_cuisines"] == ["Asian"]
+    insights["preferred_cuisines"].append("Mexican")
+    assert engine.get_user_insights("insight_user")["preferred_cuisines"] == ["Asian"]
+    print("✅ ETag is stable between changes and moves on preference updates")
+
+    restarted = AIPersonalizationEngine(data_dir=data_dir)
+    assert restarted.get_user_insights_with_etag("insight_user") == (insights | {"preferred_cuisines": ["Asian"]}, new_etag)
+    print("✅ Insights rebuilt from the stored history carry the same ETag")
+
+    # Reads against a long history are cache hits
+    engine.learn_from_meals([random_meal(i) for i in range(20000)])
+    engine.get_user_insights("insight_user")
+    start = time.perf_counter()
+    for _ in range(1000):
+        engine.get_user_insights_with_etag("insight_user")
+    cached = (time.perf_counter() - start) / 1000
+    start = time.perf_counter()
+    for _ in range(10):
+        engine._recompute_user_insights("insight_user")
+    recomputed = (time.perf_counter() - start) / 10
+    assert cached < recomputed, (cached, recomputed)
+    print(f"✅ Cached read {cached * 1e6:.0f} µs vs. {recomputed * 1e3:.1f} ms recomputed over 20k meals")
+
+def test_meal_suggestions():
+    """Suggestions return K distinct recipes of one meal type, diversified by MMR."""
+
+    print("\n💡 Testing top-K meal suggestions")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(100000, seed=9))
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    engine.set_user_preferences(UserPreference(user_id="suggest_user", favorite_ingredients=["ingredient_20", "ingredient_31"]))
+
+    start = time.perf_counter()
+    suggestions = engine.suggest_meals("suggest_user", "lunch", count=10)
+    elapsed = time.perf_counter() - start
+    assert len(suggestions) == 10 and len({meal.name for meal in suggestions}) == 10
+    assert len({meal.meal_id for meal in suggestions}) == 10
+    assert all(meal.meal_type == "lunch" for meal in suggestions)
+
+    # Same candidates as a plain top-K, but with less ingredient overlap between picks
+    recipe_ids, scores = engine._score_meal_type(engine.get_user_preferences("suggest_user"), {}, "lunch", [])
+    top_k = [int(recipe_ids[i]) for i in np.argsort(-scores, kind='stable')[:10]]
+
+    def mean_overlap(ids):
+        sets = [set(catalog.recipes[i]['ingredients']) for i in ids]
+        pairs = [(a, b) for i, a in enumerate(sets) for b in sets[i + 1:]]
+        return sum(len(a & b) / len(a | b) for a, b in pairs) / len(pairs)
+
+    chosen = [pick[0] for pick in engine._select_mmr_recipes(recipe_ids, scores, 10)]
+    assert [catalog.recipes[i]['name'] for i in chosen] == [meal.name for meal in suggestions]
+    assert mean_overlap(chosen) < mean_overlap(top_k)
+    assert np.mean([meal.confidence_score for meal in suggestions]) > np.percentile(scores, 99)
+    print(f"✅ 10 distinct lunch suggestions in {elapsed * 1000:.0f} ms "
+          f"(ingredient overlap {mean_overlap(chosen):.2f} vs. {mean_overlap(top_k):.2f} for plain top-K)")
+
+    # The old path generated a whole day and kept one meal of the type
+    start = time.perf_counter()
+    day = [meal for meal in engine.generate_personalized_meals("suggest_user", days=1, meals_per_day=10) if meal.meal_type == "lunch"]
+    print(f"✅ Generate-then-filter returned {len(day)} suggestion in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    engine.MMR_LAMBDA = 1.0
+    plain = engine._select_mmr_recipes(recipe_ids, scores, 10)
+    assert [score for _, score in plain] == sorted(scores, reverse=True)[:10]
+    assert engine.suggest_meals("suggest_user", "brunch", count=5) == []
+    print("✅ λ = 1 reduces to plain top-K; unknown meal types return nothing")
+
+def test_plan_cache():
+    """Identical requests give identical plans, served from cache until the user's state changes."""
+
+    print("\n🎲 Testing seeded plans and the plan cache")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(50000, seed=12))
+    data_dir = tempfile.mkdtemp(prefix="meal_engine_test_")
+    engine = AIPersonalizationEngine(data_dir=data_dir, catalog=catalog)
+    engine.learn_from_meals([_meal("seed_user", i) for i in range(10)])
+
+    def names(meals):
+        return [meal.name for meal in meals]
+
+    start = time.perf_counter()
+    first, report = engine.generate_meal_plan("seed_user", days=7)
+    generated = time.perf_counter() - start
+    start = time.perf_counter()
+    second, cached_report = engine.generate_meal_plan("seed_user", days=7)
+    cached = time.perf_counter() - start
+    assert names(first) == names(second) and not report["cached"] and cached_report["cached"]
+    assert names(AIPersonalizationEngine(data_dir=data_dir, catalog=catalog).generate_personalized_meals("seed_user", days=7)) == names(first)
+    print(f"✅ Repeat request identical, from cache in {cached * 1e6:.0f} µs (generated in {generated * 1000:.1f} ms); same plan after restart")
+
+    second[0].name = "mutated"
+    assert engine.generate_meal_plan("seed_user", days=7)[0][0].name == first[0].name
+
+    reseeded = engine.generate_personalized_meals("seed_user", days=7, seed=1)
+    assert names(reseeded) == names(engine.generate_personalized_meals("seed_user", days=7, seed=1)) != names(first)
+    assert not engine.generate_meal_plan("seed_user", days=7, available_ingredients=["ingredient_40"])[1]["cached"]
+    print("✅ Seeds and inventory are part of the key")
+
+    engine.learn_from_meal(_meal("seed_user", 11))
+    assert not engine.generate_meal_plan("seed_user", days=7)[1]["cached"]
+    assert engine.generate_meal_plan("seed_user", days=7)[1]["cached"]
+    engine.set_user_preferences(UserPreference(user_id="seed_user", preferred_cuisines=["Italian"]))
+    assert not engine.generate_meal_plan("seed_user", days=7)[1]["cached"]
+    print("✅ Learning and preference updates invalidate cached plans")
+
+    # The constrained local search is reproducible too
+    constraints = PlanConstraints(weekly_budget=100.0, daily_calories=1600, expiring={"ingredient_300": 2})
+    plans = [
+        names(AIPersonalizationEngine(data_dir=data_dir, catalog=catalog).generate_personalized_meals("seed_user", days=7, constraints=constraints))
+        for _ in range(2)
+    ]
+    assert plans[0] == plans[1]
+    print("✅ Optimized plans are reproducible across engines")
+
+def test_request_filters():
+    """Request filters prune recipes before scoring without changing the scores of the ones kept."""
+
+    print("\n🚦 Testing request filters")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(20000, seed=21))
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    user_prefs = UserPreference(user_id="filter_user", favorite_ingredients=["ingredient_20", "ingredient_21"])
+
+    # Only labeled recipes pass a dietary filter, whatever their ingredient names look like
+    sample = RecipeCatalog(SAMPLE_RECIPES)
+
+    def kept(meal_type, *restrictions):
+        recipe_ids = sample.filter_ids(meal_type, RecipeFilter(dietary_restrictions=restrictions))
+        return [sample.recipes[recipe_id]['name'] for recipe_id in recipe_ids]
+
+    assert kept("dinner", "vegetarian") == ["Vegetarian Stir Fry"]  # Not the chicken_breast dish
+    assert kept("lunch", "vegan") == [] and kept("lunch", "dairy_free") == []  # Greek Quinoa Bowl has feta
+    assert kept("breakfast", "Gluten-Free") == []  # Bread
+    assert kept("snack", "dairy_free") == ["Berry Protein Smoothie"]  # Labeled vegan
+    assert kept("dinner", "gluten_free", "vegetarian") == []
+    assert len(kept("dinner", "low-carb")) == 2  # Unknown to the catalog: ignored
+    print("✅ Dietary filters drop chicken_breast and feta dishes; vegan implies vegetarian and dairy-free")
+
+    recipe_filter = RecipeFilter(dietary_restrictions=("Gluten-Free", "vegan", "low-carb"), max_prep_time=30, cuisine="italian")
+    for meal_type in ("breakfast", "lunch", "dinner"):
+        part = catalog.partition(meal_type)
+        expected = [
+            recipe_id for recipe_id in range(part.start, part.stop)
+            if {"gluten_free", "vegan"} <= set(catalog.recipes[recipe_id]['dietary_labels'])
+            and catalog.recipes[recipe_id]['prep_time'] <= 30 and catalog.recipes[recipe_id]['cuisine'] == "Italian"
+        ]
+        recipe_ids = catalog.filter_ids(meal_type, recipe_filter)
+        assert recipe_ids.tolist() == expected and len(expected) > 0
+
+        full = engine._score_recipes(meal_type, user_prefs, {}, [])
+        assert np.allclose(engine._score_recipes(meal_type, user_prefs, {}, [], recipe_ids), full[recipe_ids - part.start])
+    print(f"✅ Bitset/prep-time/cuisine stages match a per-recipe check ({len(recipe_ids)} of {part.stop - part.start} lunches kept)")
+
+    # A cuisine with no recipes of the meal type doesn't empty it
+    assert len(catalog.filter_ids("lunch", RecipeFilter(cuisine="martian"))) == len(catalog.meal_type_ids("lunch"))
+
+    meals, report = engine.generate_meal_plan("filter_user", days=5, recipe_filter=recipe_filter, servings=3)
+    by_name = {recipe['name']: recipe for recipe in catalog.recipes}
+    assert len(meals) == 15 and report["candidates"]["lunch"] > 0
+    for meal in meals:
+        recipe = by_name[meal.name]
+        assert recipe['prep_time'] <= 30 and recipe['cuisine'] == "Italian" and "vegan" in recipe['dietary_labels']
+        assert meal.servings == 3 and math.isclose(meal.estimated_cost, recipe['cost'] * 3)
+    assert not engine.generate_meal_plan("filter_user", days=5, recipe_filter=recipe_filter)[1]["cached"]
+    print("✅ Plans only use recipes passing the filter; costs cover every serving")
+
+    weights = engine._ingredient_weights(user_prefs, {}, ["ingredient_30", "ingredient_31"],
+                                         {"ingredient_30": 4.0, "ingredient_31": 1.0})
+    assert weights["ingredient_30"] > weights["ingredient_31"] > 0.2
+    assert ExpiringInventory([{"name": "Milk", "expires_in_days": 2}]).get("milk").days_left == 2
+    print("✅ High-quantity ingredients weigh more; frontend expiry fields are understood")
+
+def test_meal_ratings():
+    """Ratings of generated meals are logged, applied online and survive a restart in order with meals."""
+
+    print("\n⭐ Testing meal ratings")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(5000, seed=31))
+    data_dir = tempfile.mkdtemp(prefix="meal_engine_test_")
+    engine = AIPersonalizationEngine(data_dir=data_dir, catalog=catalog)
+
+    meals = engine.generate_personalized_meals("rate_user_1", days=2)
+    assert parse_meal_id(meals[0].meal_id)[:2] == ("rate_user_1", meals[0].meal_type)
+    for bad_id in ("rate", "rate_user_1_lunch_x_20260101", "_lunch_0_20260101", "rate_user_1_lunch_0_2026"):
+        try:
+            engine.resolve_rating(bad_id, 4)
+            assert False, bad_id
+        except ValueError:
+            pass
+    for unknown_id in ("rate_user_1_lunch_9_20200101", f"rate_user_1_lunch_0_20200101_r{len(catalog)}"):
+        try:
+            engine.resolve_rating(unknown_id, 4)
+            assert False, unknown_id
+        except KeyError:
+            pass
+    print("✅ Meal ids parse from the right (user ids may contain underscores); unknown meals are rejected")
+
+    # Meal ids carry their recipe: suggestions of the same meal type, cache hits, restarts and other
+    # workers (a fresh engine) all resolve a plan meal to the recipe it showed
+    plan = engine.generate_personalized_meals("rate_user_2", days=3, seed=5)
+    suggestions = engine.suggest_meals("rate_user_2", plan[0].meal_type, 5)
+    assert {meal.name for meal in suggestions} != {plan[0].name}
+    cached, report = engine.generate_meal_plan("rate_user_2", days=3, seed=5)
+    assert report["cached"] and [meal.meal_id for meal in cached] == [meal.meal_id for meal in plan]
+    streamed = [meal for _, day_meals in engine.stream_meal_plan("rate_user_2", days=3, seed=5) for meal in day_meals]
+    other_worker = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    for meal in plan:
+        assert engine.resolve_rating(meal.meal_id, 4).recipe_name == meal.name
+        assert other_worker.resolve_rating(meal.meal_id, 4).recipe_name == meal.name
+    for meal in suggestions + streamed:
+        assert engine.resolve_rating(meal.meal_id, 4).recipe_name == meal.name
+    print("✅ Plan meals rate as the recipe they showed after suggestions, cache hits and on another worker")
+
+    # Ratings interleaved with meals, through the shard writer; reference applies the same EMA steps in order
+    expected = {}
+    def step(ingredients, score):
+        for ingredient in ingredients:
+            expected[ingredient] = expected.get(ingredient, 0.0) + 0.1 * (score - expected.get(ingredient, 0.0))
+    for i, meal in enumerate(meals):
+        record = _meal("rate_user_1", i, rating=2.0)
+        engine.submit_meal(record)
+        step(record.ingredients, -0.5)
+        engine.submit_rating(engine.resolve_rating(meal.meal_id, 5 - i % 2))
+        step(meal.ingredients, (5 - i % 2 - 3.0) / 2.0)
+    engine.learning_queue.join()
+    rating = engine.resolve_rating("rate_user_1_dinner_0_20200101", 1, recipe_name=catalog.recipes[0]['name'])
+    engine.learn_from_rating(rating)
+    step(rating.ingredients, -1.0)
+    assert _same_scores(engine.ingredient_preferences["rate_user_1"], expected)
+
+    reloaded = AIPersonalizationEngine(data_dir=data_dir, catalog=catalog)
+    assert reloaded.store.load_user_state("rate_user_1")[2] < engine._last_event_id["rate_user_1"]
+    assert _same_scores(reloaded._user_snapshot("rate_user_1")[1], expected)
+    engine.consolidate()
+    assert engine.store.load_user_state("rate_user_1")[2] == engine._last_event_id["rate_user_1"]
+    assert _same_scores(AIPersonalizationEngine(data_dir=data_dir, catalog=catalog)._user_snapshot("rate_user_1")[1], expected)
+    print("✅ Online updates match in-order EMA steps, before and after restart and consolidation")
+
+    recipes = catalog.recipes[:50]
+    ratings = [
+        MealRating(f"rate_bench_{i % 100}", f"rate_bench_{i % 100}_lunch_0_20260101", recipe['name'],
+                   recipe['ingredients'], "lunch", float(1 + i % 5))
+        for i, recipe in enumerate(recipes * 100)
+    ]
+    start = time.perf_counter()
+    for meal_rating in ratings:
+        engine.submit_rating(meal_rating)
+    engine.learning_queue.join()
+    elapsed = time.perf_counter() - start
+    assert len(engine.store.load_events("rate_bench_7", kind="rating")) == 50
+    print(f"✅ {len(ratings) / elapsed:,.0f} ratings/s through the shard writers ({len(ratings)} ratings, 100 users)")
+
+def test_streaming_plan():
+    """Streamed plans come day by day, match the whole-plan result and replay from cache."""
+
+    print("\n📡 Testing streamed meal plans")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(20000, seed=47))
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    engine.learn_from_meals([_meal("stream_user", i) for i in range(10)])
+
+    def drain(stream):
+        days = []
+        while True:
+            try:
+                days.append(next(stream))
+            except StopIteration as stop:
+                return days, stop.value
+
+    days, report = drain(engine.stream_meal_plan("stream_user", days=5, seed=3))
+    assert [day for day, _ in days] == list(range(5)) and len({len(meals) for _, meals in days}) == 1 and days[0][1]
+    assert not report["cached"]
+    cached_days, cached_report = drain(engine.stream_meal_plan("stream_user", days=5, seed=3))
+    assert cached_report["cached"]
+    assert [[meal.name for meal in meals] for _, meals in cached_days] == [[meal.name for meal in meals] for _, meals in days]
+    other = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=catalog)
+    other.learn_from_meals([_meal("stream_user", i) for i in range(10)])
+    whole, _ = other.generate_meal_plan("stream_user", days=5, seed=3)
+    assert [meal.name for meal in whole] == [meal.name for _, meals in days for meal in meals]
+    print("✅ Days arrive in order, equal the whole plan and replay from cache")
+
+    constraints = PlanConstraints(weekly_budget=100.0, daily_calories=1600)
+    days, report = drain(engine.stream_meal_plan("stream_user", days=7, constraints=constraints))
+    assert [day for day, _ in days] == list(range(7)) and report["optimizer"] == "local_search"
+
+    long_days, _ = drain(engine.stream_meal_plan("stream_user", days=engine.PLAN_CACHE_MAX_DAYS + 1))
+    assert len(long_days) == engine.PLAN_CACHE_MAX_DAYS + 1
+    assert not drain(engine.stream_meal_plan("stream_user", days=engine.PLAN_CACHE_MAX_DAYS + 1))[1]["cached"]
+    print("✅ Optimized plans stream after the search; long plans aren't kept in the cache")
+
+def test_bulk_plans():
+    """The bulk job writes every stored user's plan, batched or not, identical to per-user requests."""
+
+    print("\n📦 Testing bulk plan generation")
+    print("=" * 60)
+
+    catalog = RecipeCatalog(synthetic_recipes(20000, seed=48))
+    data_dir = tempfile.mkdtemp(prefix="meal_engine_test_")
+    engine = AIPersonalizationEngine(data_dir=data_dir, catalog=catalog)
+    rng = random.Random(48)
+    cuisines = [cuisine for cuisine in catalog.cuisine_codes if cuisine]
+    for i in range(40):
+        engine.set_user_preferences(UserPreference(
+            user_id=f"bulk_user_{i:02d}",
+            dietary_restrictions=rng.sample(list(RESTRICTION_VIOLATIONS), i % 2),
+            preferred_cuisines=rng.sample(cuisines, i % 3),
+            health_goals=[["maintenance", "weight_loss", "muscle_gain"][i % 3]]
+        ))
+    engine.learn_from_meals([_meal("bulk_user_07", i) for i in range(12)])
+    assert engine.store.user_ids() == [f"bulk_user_{i:02d}" for i in range(40)]
+
+    # Workers plan from the catalog alone; they can't reach the store or the learning queue
+    planner = engine._bulk_planner()
+    assert planner.catalog is engine.catalog and not hasattr(planner, "store") and not hasattr(planner, "learning_queue")
+
+    outputs = []
+    for workers, batch_size in ((1, 16), (2, 7)):
+        output_path = os.path.join(data_dir, f"plans_{workers}.jsonl")
+        report = engine.generate_bulk_plans(output_path, workers=workers, batch_size=batch_size)
+        assert report["users"] == 40 and report["users_per_second"] > 0
+        with open(output_path) as f:
+            outputs.append([json.loads(line) for line in f])
+    assert outputs[0] == outputs[1]
+    assert [plan["user_id"] for plan in outputs[0]] == engine.store.user_ids()
+    print(f"✅ {len(outputs[0])} plans written in user order, same in-process and across a forkserver pool")
+
+    for plan in outputs[0]:
+        meals, report = engine.generate_meal_plan(plan["user_id"], days=7)
+        assert [meal.name for meal in meals] == [meal["name"] for meal in plan["meals"]]
+        assert plan["report"]["seed"] == report["seed"]
+    print("✅ Matrix-scored plans equal today's per-user plans")
+
+def test_recipe_nutrition():
+    """Recipes whose ingredients all resolve get per-serving nutrient vectors from the calorie service's database."""
+
+    print("\n🥗 Testing recipe nutrient vectors")
+    print("=" * 60)
+
+    from calorie_calculation_service import calorie_calculator, NUTRIENT_VECTOR_FIELDS
+
+    assert food_key("eggs", calorie_calculator.food_index) == "egg"
+    assert food_key("tomatoes", calorie_calculator.food_index) == "tomato"
+    assert food_key("Chicken Breast", calorie_calculator.food_index) == "chicken"
+    # No guessing from the last word
+    assert food_key("almond_milk", calorie_calculator.food_index) is None
+    assert food_key("sweet_potato", calorie_calculator.food_index) is None
+    assert food_key("protein_powder", calorie_calculator.food_index) is None
+
+    # The samples with only their resolvable ingredients (and seasonings) left
+    complete = [
+        dict({key: value for key, value in sample.items() if key != "nutrient_coverage"}, ingredient_grams={
+            name: grams for name, grams in sample["ingredient_grams"].items()
+            if food_key(name, calorie_calculator.food_index) or name in NEGLIGIBLE_INGREDIENTS
+        })
+        for sample in SAMPLE_RECIPES
+    ]
+    recipes = with_nutrients(complete)
+    for recipe in recipes:
+        expected = {"calories": 0.0, "protein": 0.0, "fiber": 0.0}
+        for name, grams in recipe["ingredient_grams"].items():
+            food = food_key(name, calorie_calculator.food_index)
+            if food is not None:
+                nutrition = calorie_calculator.calculate_precise_nutrition(food, grams)
+                for field in expected:
+                    expected[field] += nutrition[field]
+        # The service rounds each ingredient's values; the vectors are rounded once per recipe
+        for field, value in expected.items():
+            assert abs(recipe["nutrients"][field] - value) < 0.1 * len(recipe["ingredient_grams"]), (recipe["name"], field)
+        assert recipe["nutrient_coverage"] == 1.0 and recipe["calories"] == round(recipe["nutrients"]["calories"], 1)
+    assert all(recipe["calories"] != sample["calories"] for recipe, sample in zip(recipes, SAMPLE_RECIPES))
+    assert not any("nutrients" in recipe for recipe in complete)
+    print("✅ Vectors match the calorie service per ingredient; hand-entered calories/protein are replaced")
+
+    # One unresolved ingredient keeps the catalog values, whatever share of the grams resolved
+    partial = with_nutrients(SAMPLE_RECIPES)
+    # The samples ship precomputed, so the meal service doesn't load the calorie service; keep them current
+    assert [recipe["nutrient_coverage"] for recipe in partial] == [sample["nutrient_coverage"] for sample in SAMPLE_RECIPES]
+    smoothie = next(recipe for recipe in partial if recipe["name"] == "Berry Protein Smoothie")
+    assert smoothie["protein"] == 25 and "nutrients" not in smoothie and 0 < smoothie["nutrient_coverage"] < 1
+    for recipe, sample in zip(partial, SAMPLE_RECIPES):
+        assert "nutrients" not in recipe and (recipe["calories"], recipe["protein"]) == (sample["calories"], sample["protein"])
+        assert 0 < recipe["nutrient_coverage"] < 1
+    unquantified = dict(SAMPLE_RECIPES[1], name="No Quantities")
+    del unquantified["ingredient_grams"]
+    assert with_nutrients([unquantified])[0] is unquantified
+    print("✅ Partly resolved recipes keep their hand-entered values and report their coverage")
+
+    catalog = RecipeCatalog(complete + SAMPLE_RECIPES + [unquantified])
+    assert catalog.nutrient_fields == NUTRIENT_VECTOR_FIELDS
+    assert catalog.has_nutrients.sum() == len(complete)
+    for recipe_id, recipe in enumerate(catalog.recipes):
+        assert catalog.calories[recipe_id] == recipe["calories"] and catalog.protein[recipe_id] == recipe["protein"]
+        if recipe.get("nutrients"):
+            assert catalog.nutrient("fiber")[recipe_id] == recipe["nutrients"]["fiber"]
+        else:
+            assert np.isnan(catalog.nutrient("fiber")[recipe_id])
+
+    # Precomputed offline into the catalog file, then loaded without recomputing
+    path = os.path.join(tempfile.mkdtemp(prefix="meal_engine_test_"), "catalog.json")
+    with open(path, "w") as f:
+        json.dump(with_nutrients(complete), f)
+    loaded = RecipeCatalog.load(path)
+    assert np.array_equal(loaded.nutrients, RecipeCatalog(complete).nutrients)
+
+    engine = AIPersonalizationEngine(data_dir=tempfile.mkdtemp(prefix="meal_engine_test_"), catalog=loaded)
+    engine.set_user_preferences(UserPreference(user_id="nutrition_user", health_goals=["muscle_gain"]))
+    meals = engine.generate_personalized_meals("nutrition_user", days=1, meals_per_day=4)
+    for meal in meals:
+        recipe = loaded.recipes[loaded.name_ids[meal.name]]
+        assert meal.nutrients == recipe["nutrients"] and meal.estimated_calories == round(recipe["calories"])
+    print("✅ Catalog arrays, precomputed catalog files and generated meals all carry the vectors")
+
+def test_startup_imports():
+    """Importing the engine leaves training, dataframe, solver, HTTP client and process pool libraries unloaded."""
+
+    print("\n⏱️ Testing cold-start imports")
+    print("=" * 60)
+
+    lazy = ["sklearn", "pandas", "scipy.optimize", "requests", "concurrent.futures.process", "calorie_calculation_service"]
+    check = f"import sys, ai_meal_generator; print(','.join(m for m in {lazy!r} if m in sys.modules))"
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-c", check], cwd=tempfile.mkdtemp(prefix="meal_engine_test_"),
+                            env={**os.environ, "PYTHONPATH": here}, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "", result.stdout
+    print(f"✅ None of {', '.join(lazy)} imported at startup")
+
+    check = "import sys, calorie_calculation_service; sys.exit('scipy.optimize' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", check], cwd=tempfile.mkdtemp(prefix="meal_engine_test_"),
+                            env={**os.environ, "PYTHONPATH": here}, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    print("✅ The calorie service imports scipy.optimize only for gap recommendations")
+
+if __name__ == "__main__":
+    test_event_log_recovery()
+    test_concurrent_learning()
+    test_batch_learning()
+    test_catalog_scoring()
+    test_large_catalog_plan()
+    test_embedding_index()
+    test_plan_optimizer()
+    test_incremental_preferences()
+    test_hot_user_cache()
+    test_compact_history()
+    test_waste_reduction()
+    test_materialized_insights()
+    test_meal_suggestions()
+    test_plan_cache()
+    test_request_filters()
+    test_meal_ratings()
+    test_streaming_plan()
+    test_bulk_plans()
+    test_recipe_nutrition()
+    test_startup_imports()
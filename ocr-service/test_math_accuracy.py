@@ -219,6 +219,252 @@ def test_validation_system():
     
     return True
 
+def test_nutrition_cache():
+    """Test that memoized results match a fresh calculation and stay isolated."""
+    
+    print("\n🗄️  Testing Nutrition Cache")
+    print("=" * 60)
+    
+    first = calorie_calculator.calculate_precise_nutrition("Banana", 118.04)
+    fresh = calorie_calculator._build_precise_nutrition("banana", 118.0)
+    
+    # Canonical key: case and sub-0.1g jitter hit the same entry
+    matches = all(first[key] == value for key, value in fresh.items())
+    print(f"📊 Cached matches fresh calculation: {'✅' if matches else '❌'}")
+    
+    # Mutating a returned payload must not leak into the cache
+    first['vitamins']['vitamin_c'] = -1
+    first['validation_errors'].append("mutated")
+    second = calorie_calculator.calculate_precise_nutrition("banana", 118)
+    isolated = second['vitamins']['vitamin_c'] >= 0 and "mutated" not in second['validation_errors']
+    print(f"📊 Cached entries isolated from callers: {'✅' if isolated else '❌'}")
+    
+    return matches and isolated
+
+def test_nutrition_fields():
+    """Test field presets, unknown fields and lean precise-nutrition responses."""
+    from calorie_calculation_service import NUTRITION_PRESETS, NUTRITION_SECTIONS, FULL_NUTRITION_SECTIONS
+    
+    print("\n🎚️  Testing Nutrition Field Selection")
+    print("=" * 60)
+    
+    # Presets build exactly their sections; 'full' (and no selection) keeps every key
+    macros_sections, macros_keys = calorie_calculator.resolve_nutrition_fields("macros")
+    presets = (macros_sections == NUTRITION_PRESETS['macros'] and macros_keys is None
+               and calorie_calculator.resolve_nutrition_fields(["full"]) == (FULL_NUTRITION_SECTIONS, None)
+               and calorie_calculator.resolve_nutrition_fields(None) == (FULL_NUTRITION_SECTIONS, None))
+    print(f"📊 Presets resolve to their sections: {'✅' if presets else '❌'}")
+    
+    # Individual keys pull in their section but only keep the requested keys plus the item's identity
+    sections, keys = calorie_calculator.resolve_nutrition_fields("calories, vitamins")
+    single_keys = (sections == {'macros', 'vitamins', 'portion'}
+                   and keys == {'calories', 'vitamins', 'food_name', 'portion_size_g'})
+    lean = calorie_calculator.calculate_precise_nutrition("banana", 118, "calories")
+    single_keys &= set(lean) == {'calories', 'food_name', 'portion_size_g'}
+    print(f"📊 Single keys trim the response: {'✅' if single_keys else '❌'} {sorted(lean)}")
+    
+    # Lean results agree with the full calculation
+    full = calorie_calculator.calculate_precise_nutrition("banana", 118)
+    macros = calorie_calculator.calculate_precise_nutrition("banana", 118, "macros")
+    expected_keys = {key for section in NUTRITION_PRESETS['macros'] for key in NUTRITION_SECTIONS[section]}
+    consistent = set(macros) == expected_keys and all(macros[key] == full[key] for key in macros)
+    print(f"📊 Macros preset matches the full response: {'✅' if consistent else '❌'}")
+    
+    # Unknown fields are rejected, not silently dropped
+    try:
+        calorie_calculator.resolve_nutrition_fields("macros,sodium_mg")
+        unknown = False
+    except ValueError as e:
+        unknown = "sodium_mg" in str(e)
+    unknown &= "sodium_mg" in calorie_calculator.calculate_precise_nutrition("banana", 118, ["sodium_mg"]).get('error', '')
+    print(f"📊 Unknown fields rejected: {'✅' if unknown else '❌'}")
+    
+    return presets and single_keys and consistent and unknown
+
+def test_lean_portion_update():
+    """Test that a lean /update-portion request skips the validation and timestamp sections."""
+    from fastapi.testclient import TestClient
+    import food_service
+    
+    print("\n🪶 Testing Lean Portion Updates")
+    print("=" * 60)
+    
+    client = TestClient(food_service.app)
+    request = {"food_name": "banana", "new_weight_g": 150, "original_weight_g": 118}
+    full = client.post("/update-portion", json=request).json()
+    lean = client.post("/update-portion", json=dict(request, fields="macros")).json()
+    
+    complete = "validation" in full and "timestamp" in full and "vitamins" in full['precise_nutrition']
+    skipped = ("validation" not in lean and "timestamp" not in lean
+               and "vitamins" not in lean['precise_nutrition'] and "validation_errors" not in lean['precise_nutrition']
+               and lean['precise_nutrition']['calories'] == full['precise_nutrition']['calories'])
+    print(f"📊 Default request returns every section: {'✅' if complete else '❌'}")
+    print(f"📊 Lean request skips validation and timestamp: {'✅' if skipped else '❌'} {sorted(lean)}")
+    
+    rejected = client.post("/update-portion", json=dict(request, fields=["macros", "sodium_mg"])).status_code == 400
+    print(f"📊 Unknown fields return 400: {'✅' if rejected else '❌'}")
+    
+    return complete and skipped and rejected
+
+def test_gap_recommender():
+    """Test that recommended foods shrink the nutrient gap and the remaining gaps match them."""
+    
+    print("\n🎯 Testing Nutrient Gap Recommender")
+    print("=" * 60)
+    
+    intake = {"calories": 1200, "protein": 30, "carbs": 150, "fat": 40, "fiber": 10}
+    targets = {"calories": 2000, "protein": 60, "carbs": 250, "fat": 70, "fiber": 30}
+    
+    result = calorie_calculator.recommend_foods_for_gaps(intake, targets, max_foods=4)
+    
+    gap_before = sum(value / targets[key] for key, value in result['gaps'].items())
+    gap_after = sum(value / targets[key] for key, value in result['remaining_gaps'].items())
+    
+    # Remaining gaps are what the returned foods leave open, nothing else
+    consistent = True
+    for field, gap in result['gaps'].items():
+        closed = sum(food['closes'].get(field, 0) for food in result['recommended_foods'])
+        expected = max(gap - closed, 0)
+        consistent &= abs(result['remaining_gaps'].get(field, 0) - expected) <= 0.01 * (len(result['recommended_foods']) + 1)
+    
+    print(f"📊 Foods recommended: {[food['food_name'] for food in result['recommended_foods']]}")
+    print(f"📊 Relative gap: {gap_before:.2f} → {gap_after:.2f}")
+    print(f"📊 Remaining gaps match the recommended portions: {consistent}")
+    
+    return (0 < len(result['recommended_foods']) <= 4) and gap_after < gap_before and consistent
+
+def test_portion_estimation():
+    """Test that portion estimates are deterministic per image and use geometry when a region is known."""
+    from calorie_calculation_service import PLATE_WIDTH_CM, FOOD_DEPTH_CM
+    
+    print("\n📐 Testing Portion Estimation")
+    print("=" * 60)
+    
+    ingredients = [{"name": "apple", "confidence": 0.9}, {"name": "rice", "confidence": 0.6}]
+    
+    # Same image hash → same portions, cached or freshly computed; another image varies them
+    first = calorie_calculator.estimate_portion_sizes(ingredients, image_hash="a1b2c3")
+    again = calorie_calculator.estimate_portion_sizes(ingredients, image_hash="a1b2c3")
+    key = (("apple", 0.9, None), ("rice", 0.6, None))
+    fresh = calorie_calculator._build_portion_estimates(key, (224, 224), "a1b2c3")
+    other = calorie_calculator.estimate_portion_sizes(ingredients, image_hash="d4e5f6")
+    uniforms = calorie_calculator._hash_uniforms("a1b2c3", "apple")
+    deterministic = (list(first) == list(again) == list(fresh) and list(first) != list(other)
+                     and uniforms == calorie_calculator._hash_uniforms("a1b2c3", "apple")
+                     and all(0 <= u < 1 for u in uniforms))
+    print(f"📊 Same image hash gives the same portions: {'✅' if deterministic else '❌'} {[round(float(g), 1) for g in first]}g")
+    
+    # A bounding box sizes the food from its area, depth and density; the hash doesn't move it
+    bbox = (40, 60, 100, 80)
+    with_bbox = [ingredients[0], dict(ingredients[1], bbox=bbox)]
+    sized = calorie_calculator.estimate_portion_sizes(with_bbox, (224, 224), image_hash="a1b2c3")
+    rice = calorie_calculator.nutritional_database["rice"]
+    volume_cm3 = bbox[2] * bbox[3] * (PLATE_WIDTH_CM / 224) ** 2 * FOOD_DEPTH_CM
+    geometric = abs(sized[1] - volume_cm3 * rice.density) < 1e-6 and sized[0] == first[0]
+    print(f"📊 Bounding box uses image geometry: {'✅' if geometric else '❌'} ({sized[1]:.1f}g rice)")
+    
+    # Neither hash nor bbox: typical serving scaled by confidence only; unknown foods get 100g
+    plain = calorie_calculator.estimate_portion_sizes(ingredients + [{"name": "dragonfruit", "confidence": 0.9}])
+    expected = [calorie_calculator.nutritional_database["apple"].typical_portion_size * (0.8 + 0.9 * 0.4),
+                rice.typical_portion_size * (0.8 + 0.6 * 0.4), 100.0]
+    fallback = all(abs(got - want) < 1e-6 for got, want in zip(plain, expected))
+    print(f"📊 Fallback without hash or bbox: {'✅' if fallback else '❌'} {[round(float(g), 1) for g in plain]}g")
+    
+    return deterministic and geometric and fallback
+
+def test_nutrition_ledger():
+    """Test that logged meals roll up per day/week/month and survive a snapshot/restore plus replay."""
+    import tempfile
+    from nutrition_ledger import NutritionLedger
+    
+    print("\n📒 Testing Nutrition Ledger")
+    print("=" * 60)
+    
+    data_dir = tempfile.mkdtemp(prefix="nutrition_ledger_test_")
+    ledger = NutritionLedger(data_dir=data_dir, snapshot_every=3)
+    
+    # Monday and Wednesday of one week, the last day of March, then April
+    meals = [("2026-03-02", "banana", 118), ("2026-03-04", "apple", 150),
+             ("2026-03-31", "banana", 100), ("2026-04-01", "apple", 100)]
+    calories = []
+    for day, food, grams in meals:
+        logged = ledger.log_meal("ledger_user", [{"name": food, "weight_g": grams}], day)
+        calories.append(logged['calories'])
+        if day == "2026-03-31":
+            snapshotted = os.path.exists(ledger.snapshot_file) and ledger.meals_since_snapshot == 0
+    
+    expected = {
+        ("day", "2026-03-02"): (calories[0], 1),
+        ("week", "2026-03-04"): (calories[0] + calories[1], 2),
+        ("month", "2026-03-15"): (calories[0] + calories[1] + calories[2], 3),
+        ("month", "2026-04-01"): (calories[3], 1),
+    }
+    
+    def rollups_match(ledger):
+        for (period, day), (total, count) in expected.items():
+            summary = ledger.get_summary("ledger_user", period, day)
+            if summary['meals_logged'] != count or abs(summary['totals']['calories'] - total) > 0.05:
+                return False
+        return True
+    
+    rollups = rollups_match(ledger)
+    print(f"📊 Day/week/month rollups match the logged meals: {'✅' if rollups else '❌'}")
+    print(f"📊 Snapshot taken every 3 meals: {'✅' if snapshotted else '❌'}")
+    
+    # A fresh ledger restores the snapshot and replays only the meal logged after it
+    restored = rollups_match(NutritionLedger(data_dir=data_dir))
+    print(f"📊 Snapshot restore plus log replay reproduces the rollups: {'✅' if restored else '❌'}")
+    
+    # An invalid date is rejected before anything is logged
+    log_size = os.path.getsize(ledger.log_file)
+    try:
+        ledger.log_meal("ledger_user", [{"name": "apple", "weight_g": 100}], "2026-02-30")
+        rejected = False
+    except ValueError:
+        rejected = os.path.getsize(ledger.log_file) == log_size
+    print(f"📊 Invalid dates rejected without logging: {'✅' if rejected else '❌'}")
+    
+    return rollups and snapshotted and restored and rejected
+
+def test_nutrient_gaps_endpoint():
+    """Test the /log-meal and /nutrient-gaps endpoints against a scratch ledger."""
+    import tempfile
+    from fastapi.testclient import TestClient
+    from nutrition_ledger import NutritionLedger
+    import food_service
+    
+    print("\n🩺 Testing Nutrient Gaps Endpoint")
+    print("=" * 60)
+    
+    service_ledger = food_service.nutrition_ledger
+    food_service.nutrition_ledger = NutritionLedger(data_dir=tempfile.mkdtemp(prefix="nutrition_ledger_test_"))
+    client = TestClient(food_service.app)
+    try:
+        logged = client.post("/log-meal", json={
+            "user_id": "gaps_user", "date": "2026-03-02",
+            "ingredients": [{"name": "banana", "weight_g": 118}, {"name": "apple", "weight_g": 150}]
+        })
+        gaps = client.post("/nutrient-gaps/gaps_user", json={"date": "2026-03-02", "max_foods": 3})
+        body = gaps.json()
+        
+        served = logged.status_code == 200 and gaps.status_code == 200
+        intake = served and abs(body['intake']['calories'] - logged.json()['meal_nutrients']['calories']) <= 0.05
+        recommended = served and 0 < len(body['recommended_foods']) <= 3
+        print(f"📊 Gaps computed from the logged intake: {'✅' if intake else '❌'}")
+        print(f"📊 Foods recommended: {[food['food_name'] for food in body.get('recommended_foods', [])]}")
+        
+        # Bad dates are client errors, not server errors
+        bad_log = client.post("/log-meal", json={
+            "user_id": "gaps_user", "date": "02/03/2026", "ingredients": [{"name": "apple", "weight_g": 100}]
+        })
+        bad_gaps = client.post("/nutrient-gaps/gaps_user", json={"date": "2026-13-01"})
+        bad_dates = bad_log.status_code == 400 and bad_gaps.status_code == 400
+        print(f"📊 Invalid dates return 400: {'✅' if bad_dates else '❌'}")
+    finally:
+        food_service.nutrition_ledger = service_ledger
+    
+    return intake and recommended and bad_dates
+
 if __name__ == "__main__":
     print("🧮 MATHEMATICAL ACCURACY TEST SUITE")
     print("Target: 90-95% accuracy for all calculations")
@@ -228,12 +474,19 @@ if __name__ == "__main__":
     test1_passed = test_precise_calculations()
     test2_passed = test_portion_scaling()
     test3_passed = test_validation_system()
+    test4_passed = test_nutrition_cache()
+    test5_passed = test_nutrition_fields()
+    test6_passed = test_lean_portion_update()
+    test7_passed = test_gap_recommender()
+    test8_passed = test_portion_estimation()
+    test9_passed = test_nutrition_ledger()
+    test10_passed = test_nutrient_gaps_endpoint()
     
     print("\n" + "=" * 60)
     print("🏁 FINAL RESULTS")
     print("=" * 60)
     
-    if test1_passed and test2_passed and test3_passed:
+    if test1_passed and test2_passed and test3_passed and test4_passed and test5_passed and test6_passed and test7_passed and test8_passed and test9_passed and test10_passed:
         print("🎉 ALL TESTS PASSED! Mathematical accuracy target achieved.")
         print("✅ System ready for production with 90-95% accuracy.")
     else:
@@ -244,3 +497,10 @@ if __name__ == "__main__":
     print(f"   Precise Calculations: {'✅' if test1_passed else '❌'}")
     print(f"   Portion Scaling: {'✅' if test2_passed else '❌'}")
     print(f"   Validation System: {'✅' if test3_passed else '❌'}")
+    print(f"   Nutrition Cache: {'✅' if test4_passed else '❌'}")
+    print(f"   Nutrition Fields: {'✅' if test5_passed else '❌'}")
+    print(f"   Lean Portion Updates: {'✅' if test6_passed else '❌'}")
+    print(f"   Gap Recommender: {'✅' if test7_passed else '❌'}")
+    print(f"   Portion Estimation: {'✅' if test8_passed else '❌'}")
+    print(f"   Nutrition Ledger: {'✅' if test9_passed else '❌'}")
+    print(f"   Nutrient Gaps Endpoint: {'✅' if test10_passed else '❌'}")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Waste Reduction Planner
+Plans meals around expiring inventory: candidate recipes come straight from
+the catalog's ingredient index, are ranked by preference plus a waste bonus
+in one vectorized pass, and are assigned to slots soonest-expiring item
+first so every coverable item is used before it goes bad.
+"""
+
+import time
+import heapq
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
+from recipe_catalog import RecipeCatalog, normalize_ingredient
+from meal_plan_optimizer import waste_weight
+
+def item_days_left(item: Dict[str, Any]) -> int:
+    """Days until an inventory dict expires ('days_left', or 'expires_in_days' as the frontend sends it)."""
+    return int(item.get('days_left', item.get('expires_in_days', 0)))
+
+@dataclass
+class ExpiringItem:
+    """One inventory item that should be used soon."""
+    name: str  # Normalized
+    days_left: int
+    cost: float = 2.0
+
+    @property
+    def deadline(self) -> int:
+        """Plan days (0-based) before which the item must be used; items expiring today still count for today."""
+        return max(self.days_left, 1)
+
+class ExpiringInventory:
+    """
+    Expiring items keyed by normalized name, plus a min-heap on days left
+    for soonest-first iteration. Duplicate names keep the earliest expiry.
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]]):
+        self.items: Dict[str, ExpiringItem] = {}
+        for item in items:
+            name = normalize_ingredient(item.get('name') or '')
+            if not name:
+                continue
+            item_days = item_days_left(item)
+            known = self.items.get(name)
+            if known is None or item_days < known.days_left:
+                self.items[name] = ExpiringItem(name, item_days, float(item.get('cost', 2.0)))
+        self._heap = [(item.days_left, name) for name, item in self.items.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, name: str) -> bool:
+        return normalize_ingredient(name) in self.items
+
+    def get(self, name: str) -> Optional[ExpiringItem]:
+        return self.items.get(normalize_ingredient(name))
+
+    def by_urgency(self) -> Iterator[ExpiringItem]:
+        """Items soonest-expiring first (ties by name)."""
+        heap = list(self._heap)
+        while heap:
+            _, name = heapq.heappop(heap)
+            yield self.items[name]
+
+    def fresh_in(self, ingredients: Iterable[str], day: int) -> List[ExpiringItem]:
+        """Distinct inventory items among `ingredients` that are still usable on plan day `day`."""
+        found = {}
+        for ingredient in ingredients:
+            item = self.get(ingredient)
+            if item is not None and item.deadline > day:
+                found[item.name] = item
+        return list(found.values())
+
+class WastePlanner:
+    """
+    Earliest-deadline-first assignment of expiring-ingredient recipes to
+    plan slots.
+
+    Each uncovered item, soonest first, gets the best-ranked unused recipe
+    containing it in the earliest free slot before its deadline; a pick
+    covers every other item it uses too. Slots left over are filled with
+    the best remaining recipes that still use something fresh.
+    """
+
+    WASTE_BONUS = 0.2  # Confidence per unit of waste weight (see waste_weight)
+
+    def __init__(self, catalog: RecipeCatalog):
+        self.catalog = catalog
+
+    def catalog_ingredients(self, inventory: ExpiringInventory) -> List[str]:
+        """Catalog spellings of the inventory's ingredients."""
+        names = list(self.catalog.ingredient_ids)
+        return [names[column] for name in inventory.items for column in self.catalog.normalized_columns.get(name, [])]
+
+    def candidates(self, inventory: ExpiringInventory) -> np.ndarray:
+        """Sorted ids of every recipe that uses at least one inventory item."""
+        return self.catalog.recipes_with_any(inventory.items)
+
+    def _inventory_vectors(self, inventory: ExpiringInventory) -> Tuple[np.ndarray, np.ndarray]:
+        """(waste weight, deadline) per catalog ingredient column; zero for non-inventory ingredients."""
+        weights = np.zeros(len(self.catalog.ingredient_ids))
+        deadlines = np.zeros(len(self.catalog.ingredient_ids))
+        for name, item in inventory.items.items():
+            columns = self.catalog.normalized_columns.get(name, [])
+            weights[columns] = waste_weight(item.days_left)
+            deadlines[columns] = item.deadline
+        return weights, deadlines
+
+    def plan(self, slots: List[Tuple[int, str]], pools: Dict[str, Tuple[np.ndarray, np.ndarray]],
+             inventory: ExpiringInventory) -> Tuple[List[Optional[Tuple[int, float]]], Dict[str, Any]]:
+        """
+        Assign recipes to (day, meal type) slots.
+
+        pools maps a meal type to (candidate recipe ids, preference scores).
+        Returns one (recipe id, confidence) or None per slot, and a report of
+        which items were covered in time.
+        """
+        start_time = time.perf_counter()
+        catalog = self.catalog
+        weights, deadlines = self._inventory_vectors(inventory)
+
+        # Rank every candidate once: preference + waste bonus, plus the last day it still uses something fresh
+        ranked: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+        for meal_type, (recipe_ids, scores) in pools.items():
+            if not len(recipe_ids):
+                continue
+            rows = catalog.incidence[recipe_ids]
+            rank = scores + self.WASTE_BONUS * (rows @ weights)
+            last_fresh_day = rows.multiply(deadlines).max(axis=1).toarray().ravel() - 1
+            ranked[meal_type] = (recipe_ids, rank, last_fresh_day, np.ones(len(recipe_ids), dtype=bool))
+
+        free_days: Dict[str, List[int]] = {}
+        for day, meal_type in slots:
+            free_days.setdefault(meal_type, []).append(day)
+        plan: Dict[Tuple[int, str], Tuple[int, float]] = {}
+        covered: Dict[str, int] = {}
+
+        def assign(meal_type: str, day: int, index: int):
+            recipe_ids, rank, _, unused = ranked[meal_type]
+            recipe_id = int(recipe_ids[index])
+            unused[index] = False
+            free_days[meal_type].remove(day)
+            fresh = inventory.fresh_in(catalog.recipes[recipe_id]['ingredients'], day)
+            confidence = float(pools[meal_type][1][index]) + self.WASTE_BONUS * sum(waste_weight(item.days_left) for item in fresh)
+            plan[(day, meal_type)] = (recipe_id, confidence)
+            for item in fresh:
+                covered.setdefault(item.name, day)
+
+        # Soonest-expiring uncovered item first: best recipe using it in the earliest slot before its deadline
+        for item in inventory.by_urgency():
+            if item.name in covered:
+                continue
+            item_recipes = catalog.normalized_index.get(item.name)
+            if item_recipes is None:
+                continue
+            best = None
+            for meal_type, (recipe_ids, rank, _, unused) in ranked.items():
+                days = [day for day in free_days.get(meal_type, []) if day < item.deadline]
+                if not days:
+                    continue
+                usable = unused & np.isin(recipe_ids, item_recipes, assume_unique=True)
+                if not usable.any():
+                    continue
+                index = int(np.argmax(np.where(usable, rank, -np.inf)))
+                if best is None or rank[index] > best[0]:
+                    best = (rank[index], meal_type, days[0], index)
+            if best is not None:
+                assign(best[1], best[2], best[3])
+
+        # Remaining slots: best unused recipe that still uses an item fresh on that day
+        for day, meal_type in slots:
+            if (day, meal_type) in plan or meal_type not in ranked:
+                continue
+            recipe_ids, rank, last_fresh_day, unused = ranked[meal_type]
+            usable = unused & (last_fresh_day >= day)
+            if usable.any():
+                assign(meal_type, day, int(np.argmax(np.where(usable, rank, -np.inf))))
+
+        uncovered = [item.name for item in inventory.by_urgency() if item.name not in covered]
+        report = {
+            "optimizer": "waste",
+            "expiring_items": len(inventory),
+            "candidates": int(sum(len(recipe_ids) for recipe_ids, _ in pools.values())),
+            "covered": {name: day for name, day in sorted(covered.items(), key=lambda entry: entry[1])},
+            "uncovered": uncovered,
+            "coverage_rate": len(covered) / len(inventory) if len(inventory) else 0,
+            "search_ms": round((time.perf_counter() - start_time) * 1000, 2)
+        }
+        return [plan.get(slot) for slot in slots], report